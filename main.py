@@ -85,18 +85,36 @@ async def on_message(message: cl.Message):
 
     try:
         loading_msg = cl.Message(content="Đang tìm kiếm và suy nghĩ...")
+        if not rag_service.startup.is_ready():
+            loading_msg.content = "Hệ thống đang khởi động, vui lòng chờ trong giây lát..."
         await loading_msg.send()
 
-        # Gọi pipeline RAG
-        response = await rag_service.get_response(
-            question=message.content,
-            session_id=session_id,
-            chat_history=history.messages,
-        )
-
-        loading_msg.content = response
-        loading_msg.author = "Bot"
-        await loading_msg.update()
+        if settings.pipeline.streaming:
+            # Stream token vào một message mới, xoá loading message khi có phần trả lời đầu tiên
+            answer_msg = cl.Message(content="", author="Bot")
+            async for chunk in rag_service.stream_response(
+                question=message.content,
+                session_id=session_id,
+                chat_history=history.messages,
+            ):
+                if loading_msg is not None:
+                    await loading_msg.remove()
+                    loading_msg = None
+                # replace=True: output guard block → thay toàn bộ nội dung đã stream
+                await answer_msg.stream_token(chunk.text, is_sequence=chunk.replace)
+            await answer_msg.send()
+            response = answer_msg.content
+        else:
+            # Gọi pipeline RAG
+            response = await rag_service.get_response(
+                question=message.content,
+                session_id=session_id,
+                chat_history=history.messages,
+            )
+
+            loading_msg.content = response
+            loading_msg.author = "Bot"
+            await loading_msg.update()
 
         logger.info(f"Trả lời thành công, độ dài response: {len(response)} ký tự")
 
@@ -109,6 +127,10 @@ async def on_message(message: cl.Message):
 
     except Exception as e:
         logger.error(f"Lỗi khi xử lý tin nhắn: {str(e)}", exc_info=True)
-        loading_msg.content = f"❌ Xin lỗi, có lỗi xảy ra khi xử lý:\n{str(e)}\nVui lòng thử lại nhé!"
-        loading_msg.author = "Bot"
-        await loading_msg.update()
\ No newline at end of file
+        error_msg = loading_msg if loading_msg is not None else cl.Message(content="")
+        error_msg.content = f"❌ Xin lỗi, có lỗi xảy ra khi xử lý:\n{str(e)}\nVui lòng thử lại nhé!"
+        error_msg.author = "Bot"
+        if loading_msg is not None:
+            await error_msg.update()
+        else:
+            await error_msg.send()
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""
+Benchmark PineconeQueryClient trên server giả lập (src.storage.pinecone_standin, chạy trong process):
+- Kết nối: client dùng chung (keep-alive) vs mở kết nối mới cho mỗi request.
+- Payload: chỉ id + score vs kèm metadata (text) → số byte response.
+- Hedging: độ trễ p50 / p95 / p99 khi có đuôi chậm (slow_fraction request chậm thêm slow_ms), hedge tắt vs bật.
+
+Chạy:
+    python -m src.benchmarks.dense_client
+    python -m src.benchmarks.dense_client --slow-fraction 0.1 --slow-ms 300 --requests 400
+"""
+import argparse
+import asyncio
+import threading
+import time
+from typing import List
+import httpx
+import numpy as np
+from src.storage.pinecone_query_client import PineconeQueryClient
+from src.storage.pinecone_standin import StandinIndex, serve
+
+# ========================
+# CẤU HÌNH
+# ========================
+NUM_VECTORS = 5_000
+DIM = 1024
+TOP_K = 10
+CONCURRENCY = 8
+
+
+def report(name: str, timings: List[float], extra: str = ""):
+    print(
+        f"{name:<28} | p50: {np.percentile(timings, 50):7.2f} ms | p95: {np.percentile(timings, 95):7.2f} ms | "
+        f"p99: {np.percentile(timings, 99):7.2f} ms" + (f" | {extra}" if extra else "")
+    )
+
+
+async def run(client: PineconeQueryClient, queries: np.ndarray) -> List[float]:
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def one(vector) -> float:
+        async with semaphore:
+            start = time.perf_counter()
+            await client.aquery(vector, top_k=TOP_K)
+            return (time.perf_counter() - start) * 1000
+
+    return list(await asyncio.gather(*(one(q) for q in queries)))
+
+
+async def run_no_keepalive(base_url: str, queries: np.ndarray) -> List[float]:
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def one(vector) -> float:
+        async with semaphore:
+            start = time.perf_counter()
+            # Client mới mỗi request → TCP handshake mỗi lần
+            async with httpx.AsyncClient(base_url=base_url) as client:
+                response = await client.post("/query", json={"vector": vector.tolist(), "topK": TOP_K, "includeMetadata": False})
+                response.raise_for_status()
+            return (time.perf_counter() - start) * 1000
+
+    return list(await asyncio.gather(*(one(q) for q in queries)))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark PineconeQueryClient (keep-alive, payload, hedging)")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--latency-ms", type=float, default=10.0)
+    parser.add_argument("--slow-fraction", type=float, default=0.03)
+    parser.add_argument("--slow-ms", type=float, default=200.0)
+    args = parser.parse_args()
+
+    index = StandinIndex.random(NUM_VECTORS, DIM)
+    server = serve(index, port=0, latency_ms=args.latency_ms, slow_fraction=args.slow_fraction, slow_ms=args.slow_ms)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    queries = np.random.default_rng(1).standard_normal((args.requests, DIM)).astype(np.float32)
+
+    print(
+        f"=== Benchmark dense client ({NUM_VECTORS:,} vector, {args.requests} request, song song {CONCURRENCY}, "
+        f"{args.slow_fraction:.0%} request chậm thêm {args.slow_ms:.0f} ms) ==="
+    )
+
+    # Payload
+    for include_metadata in (False, True):
+        with httpx.Client(base_url=base_url) as http:
+            body = {"vector": queries[0].tolist(), "topK": TOP_K, "includeMetadata": include_metadata}
+            size = len(http.post("/query", json=body).content)
+        print(f"Response top-{TOP_K} {'kèm metadata' if include_metadata else 'chỉ id + score':<16}: {size:,} byte")
+
+    report("Không keep-alive", await run_no_keepalive(base_url, queries))
+
+    no_hedge = PineconeQueryClient(api_key="", index_host=base_url, hedge=False)
+    report("Keep-alive, không hedge", await run(no_hedge, queries))
+    await no_hedge.aclose()
+
+    hedged = PineconeQueryClient(api_key="", index_host=base_url, hedge=True, hedge_min_samples=20)
+    await run(hedged, queries[:50])   # Làm nóng: đủ mẫu độ trễ để tính p95
+    warm = hedged.stats()
+    timings = await run(hedged, queries)
+    stats = hedged.stats()
+    report(
+        "Keep-alive, hedge p95",
+        timings,
+        f"hedge gửi {stats['hedges_sent'] - warm['hedges_sent']}, thắng {stats['hedges_won'] - warm['hedges_won']}, "
+        f"ngưỡng {stats['hedge_delay_ms']:.1f} ms",
+    )
+    await hedged.aclose()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,136 @@
+"""
+So sánh dense backend FAISS (local) với Pinecone:
+- Recall@k: tỉ lệ node id trong top-k của Pinecone (và của exact search trên embedded_nodes.pkl
+  nếu có) được FAISS trả về.
+- Latency: thời gian search 1 query (mean / p50 / p95), embedding tính sẵn nên chỉ đo phần search.
+
+Chạy (cần build_faiss_index trước, PINECONE_API_KEY trong .env cho phần Pinecone):
+    python -m src.benchmarks.dense_recall
+    python -m src.benchmarks.dense_recall --top-k 10 --no-pinecone --exact
+"""
+import argparse
+import os
+import pickle
+import time
+import numpy as np
+from statistics import mean, median
+from dotenv import load_dotenv
+from llama_index.core.schema import QueryBundle
+from src.embedding.embedding import EmbeddingProvider
+from src.retrievers.dense import DenseRetrieverBuilder
+from src.retrievers.faiss_dense import FaissRetrieverBuilder
+from src.config.settings import settings
+
+# ========================
+# CẤU HÌNH
+# ========================
+QUERIES = [
+    "Triệu chứng của bệnh cảm cúm là gì?",
+    "Người bị tiểu đường type 2 nên ăn gì để ổn định đường huyết?",
+    "Viêm họng cấp có nên dùng kháng sinh không?",
+    "Trẻ em bị sốt cao co giật phải xử lý thế nào?",
+    "Đau thắt ngực khi gắng sức có phải dấu hiệu bệnh mạch vành?",
+    "Phụ nữ mang thai 3 tháng đầu có được uống paracetamol không?",
+    "Chỉ số HbA1c bao nhiêu là bình thường?",
+    "Cách phòng ngừa sốt xuất huyết trong mùa mưa",
+    "Bị đau dạ dày lâu ngày có nguy cơ ung thư không?",
+    "Tiêm vắc xin HPV ở độ tuổi nào là tốt nhất?",
+]
+WARMUP = 2
+ROUNDS = 5
+
+
+def search_ids(retriever, bundles) -> list:
+    return [[n.node.node_id for n in retriever.retrieve(bundle)] for bundle in bundles]
+
+
+def latency_ms(retriever, bundles) -> list:
+    for bundle in bundles[:WARMUP]:
+        retriever.retrieve(bundle)
+    timings = []
+    for _ in range(ROUNDS):
+        for bundle in bundles:
+            start = time.perf_counter()
+            retriever.retrieve(bundle)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def exact_ids(pkl_path, query_embeddings: np.ndarray, top_k: int) -> list:
+    """Top-k chính xác (brute force cosine) trên toàn bộ embedding trong pickle."""
+    with open(pkl_path, "rb") as f:
+        nodes = [node for node in pickle.load(f) if node.embedding is not None]
+    matrix = np.asarray([node.embedding for node in nodes], dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    queries = query_embeddings / np.linalg.norm(query_embeddings, axis=1, keepdims=True)
+    scores = queries @ matrix.T
+    top = np.argsort(-scores, axis=1)[:, :top_k]
+    return [[nodes[i].node_id for i in row] for row in top]
+
+
+def recall(found: list, truth: list) -> float:
+    hits = [len(set(f) & set(t)) / len(t) for f, t in zip(found, truth) if t]
+    return mean(hits) if hits else 0.0
+
+
+def report(name: str, timings: list):
+    print(
+        f"{name:<9} | latency mean: {mean(timings):.2f} ms | "
+        f"p50: {median(timings):.2f} ms | p95: {np.percentile(timings, 95):.2f} ms"
+    )
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Benchmark recall / latency FAISS vs Pinecone")
+    parser.add_argument("--top-k", type=int, default=settings.retriever.top_k_dense)
+    parser.add_argument("--no-pinecone", action="store_true", help="Bỏ qua Pinecone (chạy offline)")
+    parser.add_argument("--exact", action="store_true", help="Tính thêm recall so với exact search trên pickle")
+    args = parser.parse_args()
+
+    provider = EmbeddingProvider(
+        model_name=settings.embedding.model_name,
+        device=settings.embedding.device,
+        backend=settings.embedding.backend,
+        query_max_length=settings.embedding.query_max_length,
+        onnx_dir=settings.paths.embedding_onnx_dir,
+        batching=False,
+    )
+    query_embeddings = np.asarray(provider.embed_queries(QUERIES), dtype=np.float32)
+    bundles = [QueryBundle(query_str=q, embedding=[float(x) for x in e]) for q, e in zip(QUERIES, query_embeddings)]
+
+    faiss_retriever = FaissRetrieverBuilder.build(
+        index_dir=settings.paths.faiss_index_dir,
+        embed_model=provider.embed_model,
+        similarity_top_k=args.top_k,
+        nprobe=settings.faiss.nprobe,
+        ef_search=settings.faiss.ef_search,
+        num_threads=settings.faiss.num_threads,
+    )
+    print(f"=== Benchmark dense backend (top_k={args.top_k}, FAISS {faiss_retriever.index.meta.get('index_type')}) ===")
+    faiss_found = search_ids(faiss_retriever, bundles)
+    report("faiss", latency_ms(faiss_retriever, bundles))
+
+    if not args.no_pinecone:
+        pinecone_retriever = DenseRetrieverBuilder.build(
+            api_key=os.getenv("PINECONE_API_KEY"),
+            index_name=settings.pinecone.index_name,
+            embed_model=provider.embed_model,
+            similarity_top_k=args.top_k,
+            namespace=settings.pinecone.namespace,
+            text_key=settings.pinecone.text_key or "text",
+            embed_dim=provider.dim,
+        )
+        pinecone_found = search_ids(pinecone_retriever, bundles)
+        report("pinecone", latency_ms(pinecone_retriever, bundles))
+        print(f"Recall@{args.top_k} FAISS so với Pinecone: {recall(faiss_found, pinecone_found):.3f}")
+
+    if args.exact:
+        truth = exact_ids(settings.paths.embedded_nodes_path, query_embeddings, args.top_k)
+        print(f"Recall@{args.top_k} FAISS so với exact: {recall(faiss_found, truth):.3f}")
+        if not args.no_pinecone:
+            print(f"Recall@{args.top_k} Pinecone so với exact: {recall(pinecone_found, truth):.3f}")
+
+
+if __name__ == "__main__":
+    main()
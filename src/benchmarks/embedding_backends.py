@@ -0,0 +1,104 @@
+"""
+So sánh các backend của EmbeddingProvider trên CPU:
+- Parity: cosine giữa embedding của backend và bản tham chiếu (torch fp32) phải >= 0.99.
+- Latency: thời gian embed 1 query (mean / p50 / p95).
+
+Chạy (cần export ONNX trước cho backend onnx / onnx_int8):
+    python -m src.embedding.export_onnx
+    python -m src.benchmarks.embedding_backends
+    python -m src.benchmarks.embedding_backends --backends torch_int8 onnx_int8 --threads 4
+Exit code 1 nếu có backend không đạt ngưỡng parity.
+"""
+import argparse
+import sys
+import time
+import numpy as np
+from statistics import mean, median
+from src.embedding.embedding import EmbeddingProvider
+from src.config.settings import settings
+
+# ========================
+# CẤU HÌNH
+# ========================
+QUERIES = [
+    "Triệu chứng của bệnh cảm cúm là gì?",
+    "Người bị tiểu đường type 2 nên ăn gì để ổn định đường huyết?",
+    "Viêm họng cấp có nên dùng kháng sinh không?",
+    "Trẻ em bị sốt cao co giật phải xử lý thế nào?",
+    "Đau thắt ngực khi gắng sức có phải dấu hiệu bệnh mạch vành?",
+    "Phụ nữ mang thai 3 tháng đầu có được uống paracetamol không?",
+    "Chỉ số HbA1c bao nhiêu là bình thường?",
+    "Cách phòng ngừa sốt xuất huyết trong mùa mưa",
+]
+PARITY_THRESHOLD = 0.99
+WARMUP = 2
+ROUNDS = 5
+
+
+def embed_all(provider: EmbeddingProvider) -> np.ndarray:
+    model = provider.embed_model
+    return np.array([model.get_query_embedding(q) for q in QUERIES], dtype=np.float32)
+
+
+def latency_ms(provider: EmbeddingProvider) -> list:
+    model = provider.embed_model
+    for q in QUERIES[:WARMUP]:
+        model.get_query_embedding(q)
+    timings = []
+    for _ in range(ROUNDS):
+        for q in QUERIES:
+            start = time.perf_counter()
+            model.get_query_embedding(q)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def cosine_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return np.sum(a * b, axis=1)
+
+
+def load(backend: str, threads) -> EmbeddingProvider:
+    return EmbeddingProvider(
+        model_name=settings.embedding.model_name,
+        device="cpu",
+        query_cache_size=0,    # Đo thời gian thật, không qua memo
+        backend=backend,
+        num_threads=threads,
+        query_max_length=settings.embedding.query_max_length,
+        onnx_dir=settings.paths.embedding_onnx_dir,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark backend EmbeddingProvider (CPU)")
+    parser.add_argument("--backends", nargs="+", default=["torch", "torch_int8", "onnx", "onnx_int8"])
+    parser.add_argument("--threads", type=int, default=settings.embedding.num_threads)
+    args = parser.parse_args()
+
+    print(f"=== Benchmark embedding backends ({settings.embedding.model_name}, CPU, threads={args.threads}) ===")
+    reference = embed_all(load("torch", args.threads))
+
+    failed = []
+    for backend in args.backends:
+        provider = load(backend, args.threads)
+        similarity = cosine_rows(embed_all(provider), reference)
+        timings = latency_ms(provider)
+        ok = float(similarity.min()) >= PARITY_THRESHOLD
+        if not ok:
+            failed.append(backend)
+        print(
+            f"{backend:<11} | cosine min: {similarity.min():.4f} mean: {similarity.mean():.4f} "
+            f"[{'PASS' if ok else 'FAIL'}] | latency mean: {mean(timings):.1f} ms | "
+            f"p50: {median(timings):.1f} ms | p95: {np.percentile(timings, 95):.1f} ms"
+        )
+        del provider
+
+    if failed:
+        print(f"Không đạt parity (< {PARITY_THRESHOLD}): {failed}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark FusionEngine (native) vs QueryFusionRetriever của llama-index trên 2 retriever giả lập
+(dense + lexical, có độ trễ mạng cố định):
+- Parity: thứ tự node id top-k giống nhau (RRF, k=60).
+- Latency: thời gian 1 request (mean / p50 / p95) và phần fusion thuần (không tính độ trễ nhánh).
+- Concurrency: nhiều request song song với top_k khác nhau → số node trả về có đúng top_k không
+  (cách cũ đổi similarity_top_k dùng chung giữa các request).
+
+Chạy:
+    python -m src.benchmarks.fusion
+    python -m src.benchmarks.fusion --latency-ms 30 --concurrency 64
+"""
+import argparse
+import asyncio
+import random
+import time
+from statistics import mean, median
+from typing import List
+import numpy as np
+from llama_index.core.llms import MockLLM
+from llama_index.core.retrievers import BaseRetriever, QueryFusionRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+from src.retrievers.fusion import FusionEngine
+
+# ========================
+# CẤU HÌNH
+# ========================
+NUM_NODES = 2000
+TOP_K_DENSE = 10
+TOP_K_LEXICAL = 15
+TOP_K_FINAL = 6
+ROUNDS = 50
+
+
+class FakeRetriever(BaseRetriever):
+    """Trả top-k ngẫu nhiên (cố định theo query) sau một độ trễ giả lập."""
+
+    def __init__(self, nodes: List[TextNode], top_k: int, latency_ms: float, seed: int):
+        super().__init__()
+        self.nodes = nodes
+        self.top_k = top_k
+        self.latency_ms = latency_ms
+        self.seed = seed
+
+    def _results(self, query: str) -> List[NodeWithScore]:
+        rng = random.Random(f"{self.seed}:{query}")
+        picked = rng.sample(self.nodes, self.top_k)
+        scores = sorted((rng.random() for _ in picked), reverse=True)
+        return [NodeWithScore(node=node, score=score) for node, score in zip(picked, scores)]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        time.sleep(self.latency_ms / 1000)
+        return self._results(query_bundle.query_str)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        await asyncio.sleep(self.latency_ms / 1000)
+        return self._results(query_bundle.query_str)
+
+
+async def old_retrieve(fusion: QueryFusionRetriever, query: str, top_k: int) -> List[NodeWithScore]:
+    """Cách HybridRetriever cũ truyền top_k: sửa tạm similarity_top_k dùng chung."""
+    original_k = fusion.similarity_top_k
+    fusion.similarity_top_k = top_k
+    nodes = await fusion.aretrieve(QueryBundle(query_str=query))
+    fusion.similarity_top_k = original_k
+    return nodes
+
+
+async def timed(coro) -> float:
+    start = time.perf_counter()
+    await coro
+    return (time.perf_counter() - start) * 1000
+
+
+def report(name: str, timings: List[float]):
+    print(
+        f"{name:<22} | mean: {mean(timings):.2f} ms | p50: {median(timings):.2f} ms | "
+        f"p95: {np.percentile(timings, 95):.2f} ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark FusionEngine vs QueryFusionRetriever")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Độ trễ giả lập của mỗi nhánh")
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    nodes = [TextNode(id_=f"node-{i}", text=f"Nội dung tài liệu {i}") for i in range(NUM_NODES)]
+    dense = FakeRetriever(nodes, TOP_K_DENSE, args.latency_ms, seed=1)
+    lexical = FakeRetriever(nodes, TOP_K_LEXICAL, args.latency_ms, seed=2)
+
+    old = QueryFusionRetriever(
+        retrievers=[dense, lexical],
+        llm=MockLLM(),    # num_queries=1 → không gọi LLM, chỉ để khỏi resolve Settings.llm
+        similarity_top_k=TOP_K_FINAL,
+        num_queries=1,
+        mode="reciprocal_rerank",
+        use_async=True,
+    )
+    new = FusionEngine(retrievers=[dense, lexical], mode="rrf", similarity_top_k=TOP_K_FINAL)
+    queries = [f"câu hỏi {i}" for i in range(ROUNDS)]
+
+    print(f"=== Benchmark fusion (2 nhánh, độ trễ {args.latency_ms:.0f} ms/nhánh) ===")
+
+    # Parity
+    mismatched = 0
+    for query in queries:
+        old_ids = [n.node.node_id for n in await old.aretrieve(QueryBundle(query_str=query))]
+        new_ids = [n.node.node_id for n in await new.retrieve(QueryBundle(query_str=query))]
+        mismatched += old_ids != new_ids
+    print(f"Parity RRF top-{TOP_K_FINAL}: {ROUNDS - mismatched}/{ROUNDS} query giống thứ tự")
+
+    # Latency end-to-end
+    report("QueryFusionRetriever", [await timed(old.aretrieve(QueryBundle(query_str=q))) for q in queries])
+    report("FusionEngine", [await timed(new.retrieve(QueryBundle(query_str=q))) for q in queries])
+
+    # Chi phí fusion thuần (kết quả nhánh tính sẵn)
+    branch_results = [[dense._results(q), lexical._results(q)] for q in queries]
+    start = time.perf_counter()
+    for results in branch_results:
+        old._reciprocal_rerank_fusion({(str(i), 0): r for i, r in enumerate(results)})
+    old_fuse = (time.perf_counter() - start) * 1000 / ROUNDS
+    start = time.perf_counter()
+    for results in branch_results:
+        new.fuse(results)
+    new_fuse = (time.perf_counter() - start) * 1000 / ROUNDS
+    print(f"Fusion thuần / request  | QueryFusionRetriever: {old_fuse:.3f} ms | FusionEngine: {new_fuse:.3f} ms")
+
+    # Concurrency: top_k khác nhau giữa các request chạy song song
+    top_ks = [random.Random(i).choice([3, 6, 10]) for i in range(args.concurrency)]
+    queries = [queries[i % ROUNDS] for i in range(args.concurrency)]
+    old_results = await asyncio.gather(*(old_retrieve(old, q, k) for q, k in zip(queries, top_ks)))
+    new_results = await asyncio.gather(*(new.retrieve(QueryBundle(query_str=q), top_k=k) for q, k in zip(queries, top_ks)))
+    old_wrong = sum(len(r) != k for r, k in zip(old_results, top_ks))
+    new_wrong = sum(len(r) != k for r, k in zip(new_results, top_ks))
+    print(
+        f"Concurrency ({args.concurrency} request song song): sai số node trả về "
+        f"QueryFusionRetriever {old_wrong}/{args.concurrency} | FusionEngine {new_wrong}/{args.concurrency}"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
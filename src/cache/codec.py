@@ -0,0 +1,98 @@
+import json
+import numpy as np
+from dataclasses import dataclass
+from typing import Dict, Literal, Mapping, Optional, Union
+
+EntryFormat = Literal["json", "float32", "float16", "int8"]
+
+# Tên field trong Redis hash của một entry
+FIELD_QUESTION = "question"
+FIELD_RESPONSE = "response"
+FIELD_EMBEDDING = "emb"
+FIELD_DTYPE = "dtype"
+FIELD_SCALE = "scale"
+
+
+@dataclass
+class CacheEntry:
+    question: str
+    response: str
+    embedding: Optional[np.ndarray] = None
+
+
+def _to_str(value: Union[bytes, str, None]) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    return value
+
+
+def encode_json(question: str, response: str, embedding: np.ndarray) -> str:
+    """Layout cũ: một string JSON (embedding là list float)."""
+    return json.dumps({
+        "question": question,
+        "response": response,
+        "embedding": np.asarray(embedding, dtype=np.float32).tolist(),
+    })
+
+
+def encode_hash(question: str, response: str, embedding: np.ndarray, fmt: EntryFormat) -> Dict[str, Union[str, bytes]]:
+    """
+    Layout binary: Redis hash gồm text + raw bytes của embedding.
+    - float32: 4 KB / entry (1024d), float16: 2 KB, int8: 1 KB + scale.
+    """
+    vec = np.asarray(embedding, dtype=np.float32).reshape(-1)
+    mapping: Dict[str, Union[str, bytes]] = {
+        FIELD_QUESTION: question,
+        FIELD_RESPONSE: response,
+        FIELD_DTYPE: fmt,
+    }
+    if fmt == "float32":
+        mapping[FIELD_EMBEDDING] = vec.tobytes()
+    elif fmt == "float16":
+        mapping[FIELD_EMBEDDING] = vec.astype(np.float16).tobytes()
+    elif fmt == "int8":
+        max_abs = float(np.max(np.abs(vec))) if vec.size else 0.0
+        scale = max_abs / 127.0 if max_abs > 0 else 1.0
+        mapping[FIELD_EMBEDDING] = np.clip(np.round(vec / scale), -127, 127).astype(np.int8).tobytes()
+        mapping[FIELD_SCALE] = repr(scale)
+    else:
+        raise ValueError(f"Định dạng entry không hỗ trợ cho hash: {fmt}")
+    return mapping
+
+
+def decode_embedding(raw: bytes, dtype: str, scale: Optional[str] = None) -> np.ndarray:
+    """Decode embedding bằng np.frombuffer (zero-copy với float32)."""
+    if dtype == "float32":
+        return np.frombuffer(raw, dtype=np.float32)
+    if dtype == "float16":
+        return np.frombuffer(raw, dtype=np.float16).astype(np.float32)
+    if dtype == "int8":
+        return np.frombuffer(raw, dtype=np.int8).astype(np.float32) * np.float32(float(scale))
+    raise ValueError(f"dtype embedding không hỗ trợ: {dtype}")
+
+
+def decode_json(raw: Union[bytes, str], with_embedding: bool = True) -> CacheEntry:
+    data = json.loads(raw)
+    embedding = np.array(data["embedding"], dtype=np.float32) if with_embedding else None
+    return CacheEntry(question=data["question"], response=data["response"], embedding=embedding)
+
+
+def decode_hash(fields: Mapping, with_embedding: bool = True) -> Optional[CacheEntry]:
+    """Decode kết quả HGETALL (key có thể là bytes hoặc str)."""
+    if not fields:
+        return None
+    fields = {_to_str(k): v for k, v in fields.items()}
+    embedding = None
+    if with_embedding:
+        embedding = decode_embedding(
+            fields[FIELD_EMBEDDING],
+            _to_str(fields[FIELD_DTYPE]),
+            _to_str(fields.get(FIELD_SCALE)),
+        )
+    return CacheEntry(
+        question=_to_str(fields[FIELD_QUESTION]),
+        response=_to_str(fields[FIELD_RESPONSE]),
+        embedding=embedding,
+    )
@@ -0,0 +1,75 @@
+"""
+Chuyển các entry Semantic Cache từ layout JSON cũ sang Redis hash binary.
+
+Chạy:
+    python -m src.cache.migrate_entries                 # dùng settings.semantic_cache.entry_format
+    python -m src.cache.migrate_entries --format int8
+    python -m src.cache.migrate_entries --dry-run
+"""
+import argparse
+import redis
+from src.cache.codec import decode_json, encode_hash
+from src.cache.semantic_cache import RedisSemanticCache
+from src.config.settings import settings
+
+
+def migrate(redis_url: str, entry_format: str, batch_size: int = 500, dry_run: bool = False) -> dict:
+    client = redis.Redis.from_url(redis_url, decode_responses=False)
+    stats = {"scanned": 0, "migrated": 0, "skipped": 0, "bytes_before": 0, "bytes_after": 0}
+
+    batch = []
+    for key in client.scan_iter(match=f"{RedisSemanticCache.KEY_PREFIX}*", count=batch_size):
+        batch.append(key)
+        if len(batch) >= batch_size:
+            _migrate_batch(client, batch, entry_format, dry_run, stats)
+            batch = []
+    if batch:
+        _migrate_batch(client, batch, entry_format, dry_run, stats)
+    return stats
+
+
+def _migrate_batch(client, keys, entry_format, dry_run, stats):
+    pipe = client.pipeline(transaction=False)
+    for key in keys:
+        pipe.type(key)
+        pipe.get(key)
+        pipe.pttl(key)
+    results = pipe.execute(raise_on_error=False)
+
+    write = client.pipeline(transaction=True)
+    for i, key in enumerate(keys):
+        key_type, raw, pttl = results[3 * i: 3 * i + 3]
+        stats["scanned"] += 1
+        if key_type != b"string" or not raw:
+            stats["skipped"] += 1
+            continue
+
+        entry = decode_json(raw)
+        mapping = encode_hash(entry.question, entry.response, entry.embedding, entry_format)
+        stats["bytes_before"] += len(raw)
+        stats["bytes_after"] += sum(len(v) if isinstance(v, bytes) else len(v.encode("utf-8")) for v in mapping.values())
+        stats["migrated"] += 1
+
+        if dry_run:
+            continue
+        write.delete(key)
+        write.hset(key, mapping=mapping)
+        if isinstance(pttl, int) and pttl > 0:
+            write.pexpire(key, pttl)
+    if not dry_run:
+        write.execute()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate Semantic Cache JSON → binary hash")
+    parser.add_argument("--format", default=settings.semantic_cache.entry_format, choices=["float32", "float16", "int8"])
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    print(f"=== Migrate Semantic Cache → {args.format} (dry_run={args.dry_run}) ===")
+    result = migrate(settings.chainlit.redis_url, args.format, args.batch_size, args.dry_run)
+    print(f"Đã duyệt: {result['scanned']:,} key | Chuyển đổi: {result['migrated']:,} | Bỏ qua: {result['skipped']:,}")
+    if result["bytes_before"]:
+        ratio = result["bytes_before"] / max(result["bytes_after"], 1)
+        print(f"Dung lượng entry: {result['bytes_before']:,} → {result['bytes_after']:,} bytes (giảm {ratio:.1f}x)")
@@ -0,0 +1,32 @@
+import re
+import unicodedata
+
+# Tăng khi đổi quy tắc chuẩn hoá → các cache key cũ tự động không còn khớp
+NORMALIZATION_VERSION = 1
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Chuẩn hoá câu hỏi để so khớp chính xác (exact-match):
+    - Unicode NFC (giữ nguyên dấu tiếng Việt).
+    - Lowercase.
+    - Bỏ dấu câu / ký hiệu (thay bằng khoảng trắng).
+    - Gộp khoảng trắng liên tiếp, strip hai đầu.
+    """
+    text = unicodedata.normalize("NFC", text or "").lower()
+    text = "".join(
+        " " if unicodedata.category(ch)[0] in ("P", "S") else ch
+        for ch in text
+    )
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def fold_whitespace(text: str) -> str:
+    """
+    Chuẩn hoá nhẹ cho key cần phân biệt nội dung (vd verdict guard):
+    chỉ Unicode NFC + gộp khoảng trắng, giữ nguyên hoa/thường và dấu câu.
+    """
+    text = unicodedata.normalize("NFC", text or "")
+    return _WHITESPACE_RE.sub(" ", text).strip()
@@ -0,0 +1,116 @@
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from llama_index.core.schema import NodeWithScore
+from src.cache.lru import TTLLRUCache
+from src.cache.normalize import NORMALIZATION_VERSION, normalize_text
+from src.storage.index_version import IndexVersion
+import logging
+logger = logging.getLogger(__name__)
+
+
+class RetrievalResultCache:
+    """
+    Cache kết quả retrieve (sau fusion) của HybridRetriever, in-process:
+    - Key = hash(index version, phiên bản chuẩn hoá, query đã chuẩn hoá, top_k, mode fusion).
+      Re-ingest bump index version → mọi entry cũ không còn khớp (tự bị LRU đẩy ra).
+    - Value = [(node, score)]: id + score kèm tham chiếu node (không copy text), mỗi lần hit trả NodeWithScore mới.
+    - Tuỳ chọn bucket theo embedding (SimHash bucket_bits bit): query khác chữ nhưng embedding gần như
+      trùng (cosine >= bucket_min_similarity) dùng lại kết quả.
+    - Giới hạn kích thước + TTL, đếm hit (exact / bucket) / miss.
+    """
+
+    def __init__(
+        self,
+        index_version: IndexVersion,
+        maxsize: int = 2048,
+        ttl_seconds: Optional[int] = 3600,
+        bucket_bits: int = 0,
+        bucket_min_similarity: float = 0.97,
+        seed: int = 0,
+    ):
+        self.index_version = index_version
+        self.local = TTLLRUCache(maxsize=maxsize, ttl_seconds=ttl_seconds)
+        self.bucket_bits = bucket_bits
+        self.bucket_min_similarity = bucket_min_similarity
+        self.buckets = TTLLRUCache(maxsize=maxsize, ttl_seconds=ttl_seconds) if bucket_bits > 0 else None
+        self._planes: Optional[np.ndarray] = None
+        self._seed = seed
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.bucket_hits = 0
+        self.misses = 0
+
+    def _key(self, *parts: Any) -> str:
+        raw = "\x1f".join(str(p) for p in (self.index_version.current(), f"norm{NORMALIZATION_VERSION}", *parts))
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _bucket(self, embedding: np.ndarray) -> str:
+        if self._planes is None or self._planes.shape[1] != embedding.shape[0]:
+            # Siêu phẳng ngẫu nhiên cố định theo seed → bucket ổn định giữa các lần chạy
+            self._planes = np.random.default_rng(self._seed).standard_normal((self.bucket_bits, embedding.shape[0])).astype(np.float32)
+        return np.packbits((self._planes @ embedding) > 0).tobytes().hex()
+
+    @staticmethod
+    def _unit(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @staticmethod
+    def _to_nodes(entry: List[Tuple[Any, float]]) -> List[NodeWithScore]:
+        return [NodeWithScore(node=node, score=score) for node, score in entry]
+
+    def get(
+        self,
+        query: str,
+        top_k: int,
+        mode: str,
+        embedding: Optional[Sequence[float]] = None,
+    ) -> Optional[List[NodeWithScore]]:
+        entry = self.local.get(self._key(normalize_text(query), top_k, mode))
+        if entry is not None:
+            with self._lock:
+                self.exact_hits += 1
+            return self._to_nodes(entry)
+
+        if self.buckets is not None and embedding is not None:
+            vector = self._unit(embedding)
+            bucket_entry = self.buckets.get(self._key("bucket", self._bucket(vector), top_k, mode))
+            if bucket_entry is not None:
+                stored_vector, entry = bucket_entry
+                if float(stored_vector @ vector) >= self.bucket_min_similarity:
+                    with self._lock:
+                        self.bucket_hits += 1
+                    return self._to_nodes(entry)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(
+        self,
+        query: str,
+        top_k: int,
+        mode: str,
+        nodes: List[NodeWithScore],
+        embedding: Optional[Sequence[float]] = None,
+    ):
+        entry = [(n.node, n.score) for n in nodes]
+        self.local.set(self._key(normalize_text(query), top_k, mode), entry)
+        if self.buckets is not None and embedding is not None:
+            vector = self._unit(embedding)
+            self.buckets.set(self._key("bucket", self._bucket(vector), top_k, mode), (vector, entry))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.exact_hits + self.bucket_hits + self.misses
+            return {
+                "index_version": self.index_version.current(),
+                "size": len(self.local),
+                "exact_hits": self.exact_hits,
+                "bucket_hits": self.bucket_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.bucket_hits) / total if total else 0.0,
+            }
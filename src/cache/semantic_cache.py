@@ -1,10 +1,24 @@
+import asyncio
 import hashlib
-import json
 import redis
+import redis.asyncio as aioredis
 import numpy as np
-from typing import Optional, Tuple
+from typing import Awaitable, Callable, List, Literal, Optional, Tuple
 from llama_index.core.schema import TextNode
 from langfuse import observe
+from src.cache.vector_index import SemanticVectorIndex
+from src.cache.lru import TTLLRUCache
+from src.cache.normalize import normalize_text
+from src.cache.codec import (
+    CacheEntry,
+    EntryFormat,
+    FIELD_QUESTION,
+    FIELD_RESPONSE,
+    decode_hash,
+    decode_json,
+    encode_hash,
+    encode_json,
+)
 import logging
 logger = logging.getLogger(__name__)
 
@@ -14,25 +28,169 @@ class RedisSemanticCache:
     - Cache response dựa trên cosine similarity của query.
     - Dùng Redis làm backend.
     - Embedding bằng bge-m3.
+    - Tầng L1 exact-match (LRU in-process + key Redis theo text đã chuẩn hoá)
+      được kiểm tra trước mọi bước embedding.
+    - index_mode="scan": duyệt toàn bộ key trong Redis mỗi lần get (cách cũ).
+    - index_mode="flat"/"hnsw"/"auto": giữ index vector in-process, load lúc khởi tạo và
+      đồng bộ khi set → mỗi lần get chỉ là một phép top-1 search. "auto" = flat, tự chuyển
+      sang HNSW khi vượt hnsw_threshold entry.
+    - aget/aset: API async (redis.asyncio, pipeline) cho pipeline Chainlit,
+      embedding chạy trong executor để không block event loop.
+    - entry_format: "json" (string JSON cũ) hoặc Redis hash với embedding dạng
+      raw bytes float32/float16/int8. Đọc được cả hai layout.
     """
+    KEY_PREFIX = "rag:semantic:"
+
     def __init__(
         self,
         redis_url: Optional[str] = None,
         embed_model=None,  # Truyền từ ngoài (từ HybridRetriever)
         similarity_threshold: float = 0.95,
         cache_ttl_days: int = 90,
+        index_mode: Literal["scan", "flat", "hnsw", "auto"] = "auto",
+        hnsw_threshold: int = 20_000,
+        scan_batch_size: int = 1000,
+        exact_cache_size: int = 2048,
+        exact_cache_ttl_seconds: int = 3600,
+        entry_format: EntryFormat = "float16",
+        embed_fn: Optional[Callable[[str], np.ndarray]] = None,
+        aembed_fn: Optional[Callable[[str], Awaitable[np.ndarray]]] = None,
     ):
         if embed_model is None:
             raise ValueError("embed_model (HuggingFaceEmbedding) phải được truyền vào khi khởi tạo RedisSemanticCache")
-        
-        self.redis_client = redis.Redis.from_url(redis_url, decode_responses=True)
+
+        # decode_responses=False vì embedding được lưu dạng raw bytes
+        self.redis_client = redis.Redis.from_url(redis_url, decode_responses=False)
+        self.async_redis_client = aioredis.Redis.from_url(redis_url, decode_responses=False)
         self.embed_model = embed_model
+        # embed_fn (vd. EmbeddingProvider.embed_query) cho phép dùng chung memo embedding với retriever
+        self.embed_fn = embed_fn
+        self.aembed_fn = aembed_fn
         self.threshold = similarity_threshold
         self.ttl_seconds = 3600 * 24 * cache_ttl_days
+        self.index_mode = index_mode
+        self.scan_batch_size = scan_batch_size
+        self.entry_format = entry_format
+        self.exact_cache = TTLLRUCache(maxsize=exact_cache_size, ttl_seconds=exact_cache_ttl_seconds)
+
+        self.vector_index: Optional[SemanticVectorIndex] = None
+        if index_mode != "scan":
+            self.vector_index = SemanticVectorIndex(backend=index_mode, hnsw_threshold=hnsw_threshold)
+            self._load_index()
+
+        logger.info(
+            f"[RedisSemanticCache] Khởi tạo: threshold={self.threshold}, TTL={cache_ttl_days} ngày, "
+            f"index_mode={self.index_mode}, entry_format={self.entry_format}"
+        )
+
+    # ────────────────────────────────────────────────
+    # Đọc entry (hash binary hoặc JSON cũ)
+    # ────────────────────────────────────────────────
+    @staticmethod
+    def _queue_fetch(pipe, keys: List[str], with_embedding: bool):
+        for key in keys:
+            if with_embedding:
+                pipe.hgetall(key)
+            else:
+                pipe.hmget(key, FIELD_QUESTION, FIELD_RESPONSE)
+
+    @staticmethod
+    def _legacy_positions(results: list) -> List[int]:
+        """Vị trí các key vẫn là string JSON (HGETALL/HMGET trả về WRONGTYPE)."""
+        return [i for i, r in enumerate(results) if isinstance(r, redis.ResponseError)]
+
+    @staticmethod
+    def _decode_fetched(results: list, legacy: dict, with_embedding: bool) -> List[Optional[CacheEntry]]:
+        entries: List[Optional[CacheEntry]] = []
+        for i, result in enumerate(results):
+            if i in legacy:
+                raw = legacy[i]
+                entries.append(decode_json(raw, with_embedding) if raw else None)
+            elif with_embedding:
+                entries.append(decode_hash(result))
+            else:
+                question, response = result
+                if question is None or response is None:
+                    entries.append(None)
+                else:
+                    entries.append(CacheEntry(question=question.decode("utf-8"), response=response.decode("utf-8")))
+        return entries
+
+    def _fetch_entries(self, keys: List[str], with_embedding: bool = True) -> List[Optional[CacheEntry]]:
+        """Lấy nhiều entry trong 1 round-trip (pipeline); fallback GET cho entry JSON cũ."""
+        if not keys:
+            return []
+        pipe = self.redis_client.pipeline(transaction=False)
+        self._queue_fetch(pipe, keys, with_embedding)
+        results = pipe.execute(raise_on_error=False)
+        positions = self._legacy_positions(results)
+        legacy = {}
+        if positions:
+            legacy = dict(zip(positions, self.redis_client.mget([keys[i] for i in positions])))
+        return self._decode_fetched(results, legacy, with_embedding)
+
+    async def _afetch_entries(self, keys: List[str], with_embedding: bool = True) -> List[Optional[CacheEntry]]:
+        if not keys:
+            return []
+        async with self.async_redis_client.pipeline(transaction=False) as pipe:
+            self._queue_fetch(pipe, keys, with_embedding)
+            results = await pipe.execute(raise_on_error=False)
+        positions = self._legacy_positions(results)
+        legacy = {}
+        if positions:
+            legacy = dict(zip(positions, await self.async_redis_client.mget([keys[i] for i in positions])))
+        return self._decode_fetched(results, legacy, with_embedding)
+
+    def _iter_entries(self):
+        """Duyệt các entry bằng SCAN + pipeline theo batch (không dùng KEYS để tránh block Redis)."""
+        batch = []
+        for key in self.redis_client.scan_iter(match=f"{self.KEY_PREFIX}*", count=self.scan_batch_size):
+            batch.append(key.decode("utf-8"))
+            if len(batch) >= self.scan_batch_size:
+                yield from zip(batch, self._fetch_entries(batch))
+                batch = []
+        if batch:
+            yield from zip(batch, self._fetch_entries(batch))
+
+    async def _aiter_entries(self):
+        """Bản async của _iter_entries."""
+        batch = []
+        async for key in self.async_redis_client.scan_iter(match=f"{self.KEY_PREFIX}*", count=self.scan_batch_size):
+            batch.append(key.decode("utf-8"))
+            if len(batch) >= self.scan_batch_size:
+                for item in zip(batch, await self._afetch_entries(batch)):
+                    yield item
+                batch = []
+        if batch:
+            for item in zip(batch, await self._afetch_entries(batch)):
+                yield item
+
+    def _load_index(self):
+        """Load toàn bộ embedding đang có trong Redis vào index in-process."""
+        keys, vectors = [], []
+        for key, entry in self._iter_entries():
+            if entry is None:
+                continue
+            keys.append(key)
+            vectors.append(entry.embedding)
+        self.vector_index.add_many(keys, vectors)
+        logger.info(f"[RedisSemanticCache] Đã load {len(keys):,} entries vào index ({self.index_mode})")
 
-        logger.info(f"[RedisSemanticCache] Khởi tạo: threshold={self.threshold}, TTL={cache_ttl_days} ngày")
+    # ────────────────────────────────────────────────
+    # Ghi entry
+    # ────────────────────────────────────────────────
+    def _queue_write(self, pipe, cache_key: str, question: str, response: str, embedding: np.ndarray):
+        if self.entry_format == "json":
+            pipe.set(cache_key, encode_json(question, response, embedding), ex=self.ttl_seconds)
+            return
+        # Key cũ có thể đang là string JSON → xoá trước khi HSET
+        pipe.delete(cache_key)
+        pipe.hset(cache_key, mapping=encode_hash(question, response, embedding, self.entry_format))
+        pipe.expire(cache_key, self.ttl_seconds)
 
     def _get_embedding(self, text: str) -> np.ndarray:
+        if self.embed_fn is not None:
+            return self.embed_fn(text)
         node = TextNode(text=text)
         embedding = self.embed_model.get_text_embedding(node.get_content())
         return np.array(embedding, dtype=np.float32)
@@ -43,50 +201,191 @@ class RedisSemanticCache:
         return np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
 
     def _get_cache_key(self, question: str) -> str:
-        return f"rag:semantic:{hashlib.md5(question.encode()).hexdigest()}"
+        normalized = normalize_text(question)
+        return f"{self.KEY_PREFIX}{hashlib.md5(normalized.encode()).hexdigest()}"
+
+    def _get_exact(self, cache_key: str) -> Optional[Tuple[str, str]]:
+        """Tầng exact-match: LRU in-process → lấy trực tiếp key trên Redis."""
+        cached = self.exact_cache.get(cache_key)
+        if cached is not None:
+            logger.debug("[RedisSemanticCache EXACT HIT] L1 in-process")
+            return cached
+
+        entry = self._fetch_entries([cache_key], with_embedding=False)[0]
+        return self._remember_exact(cache_key, entry)
+
+    def _remember_exact(self, cache_key: str, entry: Optional[CacheEntry]) -> Optional[Tuple[str, str]]:
+        if entry is None:
+            return None
+        result = (entry.response, entry.question)
+        self.exact_cache.set(cache_key, result)
+        logger.debug("[RedisSemanticCache EXACT HIT] Redis key")
+        return result
 
     @observe(name="semantic_cache_get")
-    def get(self, question: str) -> Optional[Tuple[str, str]]:
+    def get(self, question: str, embedding: Optional[np.ndarray] = None) -> Optional[Tuple[str, str]]:
         """
         Lấy từ cache nếu có query tương tự (cosine >= threshold).
         Trả về (response, original_question) nếu hit, None nếu miss.
+        embedding: embedding đã tính sẵn của question (bỏ qua bước embed).
         """
-        question_embedding = self._get_embedding(question)
+        cache_key = self._get_cache_key(question)
+        exact = self._get_exact(cache_key)
+        if exact is not None:
+            return exact
+
+        question_embedding = embedding if embedding is not None else self._get_embedding(question)
+
+        if self.vector_index is not None:
+            result = self._get_indexed(question_embedding)
+            if result is not None:
+                self.exact_cache.set(cache_key, result)
+            return result
 
-        # Lấy tất cả key cache
-        keys = self.redis_client.keys("rag:semantic:*")
+        best = _ScanBest(self.threshold)
+        for _, entry in self._iter_entries():
+            best.update(question_embedding, entry, self._cosine_similarity)
+        return best.result(cache_key, self.exact_cache)
+
+    def _get_indexed(self, question_embedding: np.ndarray, max_attempts: int = 3) -> Optional[Tuple[str, str]]:
+        """
+        Top-1 search trên index in-process, sau đó đọc đúng 1 key từ Redis.
+        Nếu key đã hết TTL (hoặc bị xoá) → gỡ khỏi index và search lại.
+        """
         best_score = 0.0
-        best_response = None
-        best_original_q = None
+        for _ in range(max_attempts):
+            result = self.vector_index.search(question_embedding)
+            if result is None:
+                break
+            key, best_score = result
+            if best_score < self.threshold:
+                break
 
-        for key in keys:
-            cached_data = self.redis_client.get(key)
-            if cached_data:
-                data = json.loads(cached_data)
-                cached_embedding = np.array(data["embedding"], dtype=np.float32)
-                similarity = self._cosine_similarity(question_embedding, cached_embedding)
-
-                if similarity >= self.threshold and similarity > best_score:
-                    best_score = similarity
-                    best_response = data["response"]
-                    best_original_q = data["question"]
-
-        if best_response:
-            logger.debug(f"[RedisSemanticCache HIT] Similarity={best_score:.4f} với query gốc: {best_original_q}")
-            return best_response, best_original_q
-
-        logger.debug(f"[RedisSemanticCache MISS] Similarity={best_score:.4f} với query gốc: {best_original_q}")
+            entry = self._fetch_entries([key], with_embedding=False)[0]
+            if entry is None:
+                self.vector_index.remove(key)
+                continue
+
+            logger.debug(f"[RedisSemanticCache HIT] Similarity={best_score:.4f} với query gốc: {entry.question}")
+            return entry.response, entry.question
+
+        logger.debug(f"[RedisSemanticCache MISS] Similarity={best_score:.4f}")
         return None
 
     @observe(name="semantic_cache_set")
-    def set(self, question: str, response: str):
+    def set(self, question: str, response: str, embedding: Optional[np.ndarray] = None):
         """Lưu query + response + embedding vào cache."""
-        embedding = self._get_embedding(question).tolist()
-        data = {
-            "question": question,
-            "response": response,
-            "embedding": embedding
-        }
+        if embedding is None:
+            embedding = self._get_embedding(question)
         cache_key = self._get_cache_key(question)
-        self.redis_client.setex(cache_key, self.ttl_seconds, json.dumps(data))
-        logger.info(f"[RedisSemanticCache] Đã lưu cache cho query: {question[:50]}...")
\ No newline at end of file
+        pipe = self.redis_client.pipeline(transaction=True)
+        self._queue_write(pipe, cache_key, question, response, embedding)
+        pipe.execute()
+        self._after_set(cache_key, question, response, embedding)
+
+    def _after_set(self, cache_key: str, question: str, response: str, embedding: np.ndarray):
+        self.exact_cache.set(cache_key, (response, question))
+        if self.vector_index is not None:
+            self.vector_index.add(cache_key, embedding)
+        logger.info(f"[RedisSemanticCache] Đã lưu cache cho query: {question[:50]}...")
+
+    # ────────────────────────────────────────────────
+    # API async (dùng trong Rag.get_response)
+    # ────────────────────────────────────────────────
+    async def _run_in_executor(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, func, *args)
+
+    async def _aget_embedding(self, text: str) -> np.ndarray:
+        if self.aembed_fn is not None:
+            return await self.aembed_fn(text)
+        return await self._run_in_executor(self._get_embedding, text)
+
+    @observe(name="semantic_cache_aget")
+    async def aget(self, question: str, embedding: Optional[np.ndarray] = None) -> Optional[Tuple[str, str]]:
+        """Bản async của get(): không block event loop khi gọi Redis / embedding."""
+        cache_key = self._get_cache_key(question)
+        exact = self.exact_cache.get(cache_key)
+        if exact is not None:
+            logger.debug("[RedisSemanticCache EXACT HIT] L1 in-process")
+            return exact
+
+        entry = (await self._afetch_entries([cache_key], with_embedding=False))[0]
+        exact = self._remember_exact(cache_key, entry)
+        if exact is not None:
+            return exact
+
+        question_embedding = embedding
+        if question_embedding is None:
+            question_embedding = await self._aget_embedding(question)
+
+        if self.vector_index is not None:
+            result = await self._aget_indexed(question_embedding)
+            if result is not None:
+                self.exact_cache.set(cache_key, result)
+            return result
+
+        best = _ScanBest(self.threshold)
+        async for _, entry in self._aiter_entries():
+            best.update(question_embedding, entry, self._cosine_similarity)
+        return best.result(cache_key, self.exact_cache)
+
+    async def _aget_indexed(self, question_embedding: np.ndarray, max_attempts: int = 3) -> Optional[Tuple[str, str]]:
+        best_score = 0.0
+        for _ in range(max_attempts):
+            result = await self._run_in_executor(self.vector_index.search, question_embedding)
+            if result is None:
+                break
+            key, best_score = result
+            if best_score < self.threshold:
+                break
+
+            entry = (await self._afetch_entries([key], with_embedding=False))[0]
+            if entry is None:
+                self.vector_index.remove(key)
+                continue
+
+            logger.debug(f"[RedisSemanticCache HIT] Similarity={best_score:.4f} với query gốc: {entry.question}")
+            return entry.response, entry.question
+
+        logger.debug(f"[RedisSemanticCache MISS] Similarity={best_score:.4f}")
+        return None
+
+    @observe(name="semantic_cache_aset")
+    async def aset(self, question: str, response: str, embedding: Optional[np.ndarray] = None):
+        """Bản async của set(): embedding trong executor, ghi Redis qua pipeline."""
+        if embedding is None:
+            embedding = await self._aget_embedding(question)
+        cache_key = self._get_cache_key(question)
+        async with self.async_redis_client.pipeline(transaction=True) as pipe:
+            self._queue_write(pipe, cache_key, question, response, embedding)
+            await pipe.execute()
+        self._after_set(cache_key, question, response, embedding)
+
+
+class _ScanBest:
+    """Giữ entry tốt nhất khi duyệt tuần tự (index_mode="scan")."""
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.score = 0.0
+        self.response = None
+        self.original_q = None
+
+    def update(self, question_embedding: np.ndarray, entry: Optional[CacheEntry], cosine):
+        if entry is None:
+            return
+        similarity = cosine(question_embedding, entry.embedding)
+        if similarity >= self.threshold and similarity > self.score:
+            self.score = similarity
+            self.response = entry.response
+            self.original_q = entry.question
+
+    def result(self, cache_key: str, exact_cache: TTLLRUCache) -> Optional[Tuple[str, str]]:
+        if self.response:
+            logger.debug(f"[RedisSemanticCache HIT] Similarity={self.score:.4f} với query gốc: {self.original_q}")
+            exact_cache.set(cache_key, (self.response, self.original_q))
+            return self.response, self.original_q
+
+        logger.debug(f"[RedisSemanticCache MISS] Similarity={self.score:.4f} với query gốc: {self.original_q}")
+        return None
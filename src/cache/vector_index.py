@@ -0,0 +1,246 @@
+import threading
+import numpy as np
+from typing import Dict, List, Literal, Optional, Tuple
+import logging
+logger = logging.getLogger(__name__)
+
+
+class SemanticVectorIndex:
+    """
+    Index vector in-process cho Semantic Cache:
+    - Lưu embedding (float32, đã chuẩn hoá L2) của các entry đang có trong Redis.
+    - "flat": ma trận numpy, top-1 = một phép nhân ma trận-vector.
+    - "hnsw": faiss IndexHNSWFlat (inner product), dùng khi số entry rất lớn.
+    - "auto": bắt đầu "flat", tự chuyển sang "hnsw" khi số entry vượt hnsw_threshold
+      (flat ~ vài chục ms / lookup ở 100k × 1024 chiều). Không có faiss → giữ "flat".
+    - Thread-safe (cache được gọi từ nhiều session cùng lúc).
+    """
+
+    def __init__(
+        self,
+        backend: Literal["flat", "hnsw", "auto"] = "flat",
+        hnsw_m: int = 32,
+        hnsw_ef_search: int = 64,
+        initial_capacity: int = 1024,
+        hnsw_threshold: int = 20_000,
+    ):
+        self.mode = backend
+        self.backend = "flat" if backend == "auto" else backend
+        self.hnsw_threshold = hnsw_threshold
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_search = hnsw_ef_search
+        self.dim: Optional[int] = None
+
+        self._lock = threading.Lock()
+        self._initial_capacity = initial_capacity
+
+        # flat: ma trận + mapping key <-> row (xoá bằng cách swap với row cuối)
+        self._matrix: Optional[np.ndarray] = None
+        self._keys: List[str] = []
+        self._key_to_row: Dict[str, int] = {}
+
+        # hnsw: faiss không hỗ trợ xoá → dùng tombstone và rebuild khi quá nhiều
+        self._faiss_index = None
+        self._faiss_ids: List[Optional[str]] = []
+        self._key_to_faiss_id: Dict[str, int] = {}
+        self._tombstones = 0
+
+        if backend == "hnsw":
+            try:
+                import faiss  # noqa: F401
+            except ImportError as e:
+                raise RuntimeError(f"Backend 'hnsw' cần faiss-cpu: {e}")
+        self._can_switch = False
+        if backend == "auto":
+            try:
+                import faiss  # noqa: F401
+                self._can_switch = True
+            except ImportError:
+                logger.warning("[SemanticVectorIndex] index_mode='auto' nhưng thiếu faiss-cpu → giữ 'flat'")
+
+    def __len__(self) -> int:
+        with self._lock:
+            if self.backend == "flat":
+                return len(self._keys)
+            return len(self._key_to_faiss_id)
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        vec = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vec)
+        if norm == 0:
+            return vec
+        return vec / norm
+
+    def _ensure_dim(self, dim: int):
+        if self.dim is None:
+            self.dim = dim
+            if self.backend == "flat":
+                self._matrix = np.zeros((self._initial_capacity, dim), dtype=np.float32)
+            else:
+                self._faiss_index = self._new_faiss_index(dim)
+        elif self.dim != dim:
+            raise ValueError(f"Dimension mismatch trong SemanticVectorIndex: {dim} != {self.dim}")
+
+    def _new_faiss_index(self, dim: int):
+        import faiss
+        index = faiss.IndexHNSWFlat(dim, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efSearch = self.hnsw_ef_search
+        return index
+
+    # ────────────────────────────────────────────────
+    # Ghi
+    # ────────────────────────────────────────────────
+    def add(self, key: str, vector: np.ndarray):
+        """Thêm hoặc cập nhật embedding của một cache key."""
+        self.add_many([key], [vector])
+
+    def add_many(self, keys: List[str], vectors: List[np.ndarray]):
+        if not keys:
+            return
+        normed = np.stack([self._normalize(v) for v in vectors])
+        with self._lock:
+            self._ensure_dim(normed.shape[1])
+            if self.backend == "flat":
+                self._add_flat(keys, normed)
+                if self._can_switch and len(self._keys) > self.hnsw_threshold:
+                    self._switch_to_hnsw()
+            else:
+                self._add_hnsw(keys, normed)
+                # Ghi đè key cũ cũng tạo tombstone → kiểm tra rebuild cả ở đường add
+                self._maybe_rebuild_hnsw()
+
+    def _add_flat(self, keys: List[str], normed: np.ndarray):
+        for key, vec in zip(keys, normed):
+            row = self._key_to_row.get(key)
+            if row is None:
+                row = len(self._keys)
+                if row >= self._matrix.shape[0]:
+                    grown = np.zeros((self._matrix.shape[0] * 2, self.dim), dtype=np.float32)
+                    grown[:row] = self._matrix[:row]
+                    self._matrix = grown
+                self._keys.append(key)
+                self._key_to_row[key] = row
+            self._matrix[row] = vec
+
+    def _add_hnsw(self, keys: List[str], normed: np.ndarray):
+        # Key lặp trong cùng batch (SCAN của Redis có thể trả một key nhiều lần) → chỉ giữ lần cuối,
+        # nếu không row trước sẽ "sống" mà không có tombstone, remove() không gỡ được
+        last_row = {key: row for row, key in enumerate(keys)}
+        if len(last_row) < len(keys):
+            rows = sorted(last_row.values())
+            keys = [keys[row] for row in rows]
+            normed = normed[rows]
+        for key in keys:
+            self._remove_hnsw(key)
+        start = len(self._faiss_ids)
+        self._faiss_index.add(normed)
+        for offset, key in enumerate(keys):
+            self._faiss_ids.append(key)
+            self._key_to_faiss_id[key] = start + offset
+
+    def _switch_to_hnsw(self):
+        """Chuyển dữ liệu flat sang HNSW (một lần, khi vượt hnsw_threshold)."""
+        size = len(self._keys)
+        index = self._new_faiss_index(self.dim)
+        index.add(self._matrix[:size])
+        self._faiss_index = index
+        self._faiss_ids = list(self._keys)
+        self._key_to_faiss_id = dict(self._key_to_row)
+        self._tombstones = 0
+        self._matrix = None
+        self._keys = []
+        self._key_to_row = {}
+        self.backend = "hnsw"
+        logger.info(f"[SemanticVectorIndex] {size:,} entries > {self.hnsw_threshold:,} → chuyển sang HNSW")
+
+    def remove(self, key: str):
+        """Xoá key khỏi index (ví dụ khi entry đã hết TTL trong Redis)."""
+        with self._lock:
+            if self.backend == "flat":
+                self._remove_flat(key)
+            else:
+                self._remove_hnsw(key)
+                self._maybe_rebuild_hnsw()
+
+    def _remove_flat(self, key: str):
+        row = self._key_to_row.pop(key, None)
+        if row is None:
+            return
+        last = len(self._keys) - 1
+        if row != last:
+            last_key = self._keys[last]
+            self._matrix[row] = self._matrix[last]
+            self._keys[row] = last_key
+            self._key_to_row[last_key] = row
+        self._keys.pop()
+
+    def _remove_hnsw(self, key: str):
+        faiss_id = self._key_to_faiss_id.pop(key, None)
+        if faiss_id is not None:
+            self._faiss_ids[faiss_id] = None
+            self._tombstones += 1
+
+    def _maybe_rebuild_hnsw(self):
+        total = len(self._faiss_ids)
+        if total == 0 or self._tombstones / total < 0.2:
+            return
+        live = [(fid, key) for fid, key in enumerate(self._faiss_ids) if key is not None]
+        index = self._new_faiss_index(self.dim)
+        if live:
+            vectors = np.stack([self._faiss_index.reconstruct(fid) for fid, _ in live])
+            index.add(vectors)
+        self._faiss_index = index
+        self._faiss_ids = [key for _, key in live]
+        self._key_to_faiss_id = {key: i for i, key in enumerate(self._faiss_ids)}
+        self._tombstones = 0
+        logger.debug(f"[SemanticVectorIndex] Rebuild HNSW: {len(live):,} entries")
+
+    def clear(self):
+        with self._lock:
+            self.backend = "flat" if self.mode == "auto" else self.mode
+            self.dim = None
+            self._matrix = None
+            self._keys = []
+            self._key_to_row = {}
+            self._faiss_index = None
+            self._faiss_ids = []
+            self._key_to_faiss_id = {}
+            self._tombstones = 0
+
+    # ────────────────────────────────────────────────
+    # Tìm kiếm
+    # ────────────────────────────────────────────────
+    def search(self, vector: np.ndarray) -> Optional[Tuple[str, float]]:
+        """Trả về (key, cosine) của entry gần nhất, None nếu index rỗng."""
+        query = self._normalize(vector)
+        with self._lock:
+            if self.dim is None:
+                return None
+            if query.shape[0] != self.dim:
+                raise ValueError(f"Dimension mismatch khi search: {query.shape[0]} != {self.dim}")
+            if self.backend == "flat":
+                size = len(self._keys)
+                if size == 0:
+                    return None
+                scores = self._matrix[:size] @ query
+                row = int(np.argmax(scores))
+                return self._keys[row], float(scores[row])
+
+            live = len(self._key_to_faiss_id)
+            if not live:
+                return None
+            total = len(self._faiss_ids)
+            # k theo tỉ lệ tombstone (kỳ vọng ~4 kết quả còn sống), nới dần nếu cả lượt toàn tombstone
+            k = min(total, max(4, int(np.ceil(4 * total / live))))
+            while True:
+                scores, ids = self._faiss_index.search(query.reshape(1, -1), k)
+                for score, fid in zip(scores[0], ids[0]):
+                    if fid < 0:
+                        continue
+                    key = self._faiss_ids[fid]
+                    if key is not None:
+                        return key, float(score)
+                if k >= total:
+                    return None
+                k = min(total, k * 4)
@@ -0,0 +1,135 @@
+import asyncio
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBatcher:
+    """
+    Hàng đợi embedding async dùng chung cho mọi session:
+    - Gom request trong tối đa max_batch_size text hoặc max_wait_ms mili giây,
+      rồi chạy một lần forward theo batch trong worker thread riêng.
+    - Text trùng nhau trong cùng batch chỉ embed một lần.
+    - Caller nhận asyncio.Future; lỗi của batch được trả về cho từng caller.
+    - stats(): độ sâu hàng đợi + phân bố kích thước batch.
+    """
+
+    def __init__(
+        self,
+        embed_batch_fn: Callable[[List[str]], Sequence[Sequence[float]]],
+        max_batch_size: int = 16,
+        max_wait_ms: float = 5.0,
+    ):
+        if max_batch_size <= 0:
+            raise ValueError("max_batch_size phải > 0")
+        self.embed_batch_fn = embed_batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_ms / 1000
+        # Một thread duy nhất: các forward pass không tranh CPU với nhau
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-batcher")
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.batches = 0
+        self.items = 0
+        self.max_observed_batch = 0
+        self.last_batch_size = 0
+        self.last_batch_ms = 0.0
+        self._histogram: Counter = Counter()
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def embed(self, text: str) -> np.ndarray:
+        """Đưa một text vào hàng đợi, chờ kết quả của batch chứa nó."""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[str, asyncio.Future]]:
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait_seconds
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        # Lấy nốt phần đã nằm sẵn trong queue mà không chờ thêm
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            batch = [(text, future) for text, future in batch if not future.cancelled()]
+            if not batch:
+                continue
+
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            start = time.perf_counter()
+            try:
+                vectors = await self._loop.run_in_executor(self._executor, self.embed_batch_fn, texts)
+            except Exception as e:
+                logger.warning(f"[EmbeddingBatcher] Lỗi embed batch {len(texts)} text: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self._record(len(texts), time.perf_counter() - start)
+            by_text: Dict[str, np.ndarray] = {}
+            for text, vector in zip(texts, vectors):
+                embedding = np.asarray(vector, dtype=np.float32)
+                embedding.setflags(write=False)
+                by_text[text] = embedding
+            for text, future in batch:
+                if not future.done():
+                    future.set_result(by_text[text])
+
+    def _record(self, size: int, elapsed: float):
+        self.batches += 1
+        self.items += size
+        self.last_batch_size = size
+        self.last_batch_ms = elapsed * 1000
+        self.max_observed_batch = max(self.max_observed_batch, size)
+        self._histogram[size] += 1
+        logger.debug(
+            f"[EmbeddingBatcher] Batch {size} text trong {self.last_batch_ms:.1f} ms "
+            f"(còn {self.queue_depth} trong hàng đợi)"
+        )
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_observed_batch,
+            "last_batch_size": self.last_batch_size,
+            "last_batch_ms": self.last_batch_ms,
+            "batch_size_histogram": dict(sorted(self._histogram.items())),
+        }
+
+    async def aclose(self):
+        if self._worker is not None:
+            self._worker.cancel()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,161 @@
+import os
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.embeddings import BaseEmbedding
+from src.cache.lru import TTLLRUCache
+import logging
+
+logger = logging.getLogger(__name__)
+
+SparseWeights = Dict[int, float]
+
+
+class BGEM3Encoder:
+    """
+    Encoder bge-m3 trả về cả vector dense và trọng số lexical (sparse) trong CÙNG một forward pass:
+    - dense: [CLS] của last_hidden_state, chuẩn hoá L2 (giống HuggingFaceEmbedding).
+    - sparse: relu(sparse_linear(hidden_state)) cho từng token, lấy max theo token id,
+      bỏ các token đặc biệt (giống BGEM3FlagModel của FlagEmbedding).
+    """
+
+    def __init__(self, model_name: str = "BAAI/bge-m3", device: str = "cpu", num_threads: Optional[int] = None):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.torch = torch
+        self.device = device
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModel.from_pretrained(model_name).eval().to(device)
+
+        self.sparse_linear = torch.nn.Linear(self.model.config.hidden_size, 1)
+        self.sparse_linear.load_state_dict(torch.load(self._sparse_weights_path(model_name), map_location="cpu"))
+        self.sparse_linear = self.sparse_linear.eval().to(device)
+        if device.startswith("cuda"):
+            self.model.half()
+            self.sparse_linear.half()
+
+        self.special_token_ids = {
+            token_id
+            for token_id in (
+                self.tokenizer.cls_token_id,
+                self.tokenizer.eos_token_id,
+                self.tokenizer.pad_token_id,
+                self.tokenizer.unk_token_id,
+            )
+            if token_id is not None
+        }
+        self.vocab_size = len(self.tokenizer)
+
+    @staticmethod
+    def _sparse_weights_path(model_name: str) -> str:
+        local = os.path.join(model_name, "sparse_linear.pt")
+        if os.path.isfile(local):
+            return local
+        from huggingface_hub import hf_hub_download
+
+        return hf_hub_download(repo_id=model_name, filename="sparse_linear.pt")
+
+    def encode(
+        self,
+        texts: List[str],
+        max_length: int = 8192,
+        return_dense: bool = True,
+        return_sparse: bool = True,
+    ) -> Tuple[Optional[np.ndarray], Optional[List[SparseWeights]]]:
+        torch = self.torch
+        encoded = self.tokenizer(texts, padding=True, truncation=True, max_length=max_length, return_tensors="pt")
+        encoded = {k: v.to(self.device) for k, v in encoded.items()}
+        with torch.inference_mode():
+            hidden = self.model(**encoded).last_hidden_state
+
+            dense = None
+            if return_dense:
+                cls = torch.nn.functional.normalize(hidden[:, 0].float(), dim=-1)
+                dense = cls.cpu().numpy().astype(np.float32)
+
+            sparse = None
+            if return_sparse:
+                token_weights = torch.relu(self.sparse_linear(hidden)).squeeze(-1).float().cpu().numpy()
+                input_ids = encoded["input_ids"].cpu().numpy()
+                sparse = [self._aggregate(ids, weights) for ids, weights in zip(input_ids, token_weights)]
+        return dense, sparse
+
+    def _aggregate(self, input_ids: np.ndarray, weights: np.ndarray) -> SparseWeights:
+        result: SparseWeights = {}
+        for token_id, weight in zip(input_ids.tolist(), weights.tolist()):
+            if weight <= 0 or token_id in self.special_token_ids:
+                continue
+            if weight > result.get(token_id, 0.0):
+                result[token_id] = weight
+        return result
+
+
+class BGEM3Embedding(BaseEmbedding):
+    """
+    BaseEmbedding dùng BGEM3Encoder: trả vector dense như HuggingFaceEmbedding, đồng thời
+    giữ trọng số sparse của query vừa embed → sparse retriever dùng lại, không cần forward lần hai.
+    Dense + sparse của query được memo CHUNG một entry (query_cache_size): hit dense thì sparse cũng hit.
+    EmbeddingProvider không đặt thêm cache dense-only trước backend này.
+    """
+
+    device: str = Field(default="cpu")
+    max_length: int = Field(default=8192)
+    query_max_length: int = Field(default=512)
+    num_threads: Optional[int] = Field(default=None)
+    query_cache_size: int = Field(default=1024)
+
+    _encoder: Any = PrivateAttr()
+    _query_cache: Any = PrivateAttr()
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._encoder = BGEM3Encoder(self.model_name, device=self.device, num_threads=self.num_threads)
+        self._query_cache = TTLLRUCache(maxsize=self.query_cache_size)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "BGEM3Embedding"
+
+    @property
+    def encoder(self) -> BGEM3Encoder:
+        return self._encoder
+
+    def _encode_queries(self, queries: List[str]) -> List[Tuple[List[float], SparseWeights]]:
+        """(dense, sparse) của từng query: tra memo, phần thiếu chạy một forward pass theo query_max_length."""
+        found = {}
+        for query in queries:
+            cached = self._query_cache.get(query)
+            if cached is not None:
+                found[query] = cached
+        missing = [query for query in dict.fromkeys(queries) if query not in found]
+        for start in range(0, len(missing), self.embed_batch_size):
+            batch = missing[start: start + self.embed_batch_size]
+            dense, sparse = self._encoder.encode(batch, max_length=self.query_max_length)
+            for query, vector, weights in zip(batch, dense.tolist(), sparse):
+                found[query] = (vector, weights)
+                self._query_cache.set(query, (vector, weights))
+        return [found[query] for query in queries]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._encode_queries([query])[0][0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def get_query_embedding_batch(self, queries: List[str]) -> List[List[float]]:
+        """Embedding nhiều query theo batch embed_batch_size, cắt theo query_max_length (không phải max_length của document)."""
+        return [dense for dense, _ in self._encode_queries(queries)]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        dense, _ = self._encoder.encode(texts, max_length=self.max_length, return_sparse=False)
+        return dense.tolist()
+
+    def sparse_query(self, query: str) -> SparseWeights:
+        """Trọng số lexical của query: lấy từ memo chung với dense, chỉ forward khi query chưa được embed."""
+        return self._encode_queries([query])[0][1]
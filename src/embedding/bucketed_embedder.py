@@ -0,0 +1,124 @@
+import time
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Sequence
+from tqdm import tqdm
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class EmbedStats:
+    docs: int = 0
+    batches: int = 0
+    real_tokens: int = 0
+    padded_tokens: int = 0
+    seconds: float = 0.0
+    batch_sizes: List[int] = field(default_factory=list)
+
+    @property
+    def docs_per_second(self) -> float:
+        return self.docs / self.seconds if self.seconds else 0.0
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.real_tokens / self.seconds if self.seconds else 0.0
+
+    @property
+    def padding_efficiency(self) -> float:
+        """Tỉ lệ token thật / token sau padding (1.0 = không lãng phí)."""
+        return self.real_tokens / self.padded_tokens if self.padded_tokens else 1.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.docs:,} docs | {self.batches:,} batch | {self.seconds:.1f}s | "
+            f"{self.docs_per_second:.1f} docs/s | {self.tokens_per_second:,.0f} tokens/s | "
+            f"padding hiệu quả {self.padding_efficiency:.1%}"
+        )
+
+
+class BucketedEmbedder:
+    """
+    Embedding hàng loạt cho ingestion, giảm tối đa padding:
+    - Đếm token bằng tokenizer của model, sắp text theo độ dài (text cùng độ dài nằm cạnh nhau).
+    - Chia batch theo ngân sách token sau padding: len(batch) * max_len(batch) <= max_tokens_per_batch
+      (và không quá max_batch_size text) → text ngắn đi batch lớn, text dài đi batch nhỏ.
+    - Trả kết quả đúng thứ tự đầu vào; thống kê docs/s, tokens/s, hiệu quả padding.
+    """
+
+    def __init__(
+        self,
+        tokenizer,
+        embed_fn: Callable[[List[str]], Sequence[Sequence[float]]],
+        max_tokens_per_batch: int = 32_768,
+        max_batch_size: int = 256,
+        max_length: int = 8192,
+        on_batch_end: Optional[Callable[[], None]] = None,
+    ):
+        self.tokenizer = tokenizer
+        self.embed_fn = embed_fn
+        self.max_tokens_per_batch = max_tokens_per_batch
+        self.max_batch_size = max_batch_size
+        self.max_length = max_length
+        self.on_batch_end = on_batch_end
+        self.stats = EmbedStats()
+
+    def count_tokens(self, texts: List[str], chunk_size: int = 4096) -> List[int]:
+        lengths: List[int] = []
+        for start in range(0, len(texts), chunk_size):
+            encoded = self.tokenizer(
+                texts[start: start + chunk_size],
+                add_special_tokens=True,
+                truncation=True,
+                max_length=self.max_length,
+            )
+            lengths.extend(len(ids) for ids in encoded["input_ids"])
+        return lengths
+
+    def plan_batches(self, lengths: List[int]) -> List[List[int]]:
+        """Danh sách batch (index trong texts), text dài nhất trước để lỗi OOM lộ ra sớm."""
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+        batches: List[List[int]] = []
+        current: List[int] = []
+        current_max = 0
+        for i in order:
+            longest = max(current_max, lengths[i])
+            if current and (
+                (len(current) + 1) * longest > self.max_tokens_per_batch
+                or len(current) >= self.max_batch_size
+            ):
+                batches.append(current)
+                current, longest = [], lengths[i]
+            current.append(i)
+            current_max = longest
+        if current:
+            batches.append(current)
+        return batches
+
+    def embed(self, texts: List[str], desc: str = "Embed") -> List[List[float]]:
+        if not texts:
+            return []
+        lengths = self.count_tokens(texts)
+        batches = self.plan_batches(lengths)
+        results: List[Optional[Sequence[float]]] = [None] * len(texts)
+
+        start = time.perf_counter()
+        with tqdm(total=len(texts), desc=desc, unit="doc") as progress:
+            for batch in batches:
+                vectors = self.embed_fn([texts[i] for i in batch])
+                for i, vector in zip(batch, vectors):
+                    results[i] = vector
+
+                self.stats.batches += 1
+                self.stats.batch_sizes.append(len(batch))
+                self.stats.real_tokens += sum(lengths[i] for i in batch)
+                self.stats.padded_tokens += len(batch) * max(lengths[i] for i in batch)
+                if self.on_batch_end is not None:
+                    self.on_batch_end()
+                progress.update(len(batch))
+                progress.set_postfix(docs_s=f"{progress.n / (time.perf_counter() - start):.1f}")
+
+        self.stats.docs += len(texts)
+        self.stats.seconds += time.perf_counter() - start
+        logger.info(f"[BucketedEmbedder] {desc}: {self.stats.summary()}")
+        return results
@@ -1,35 +1,70 @@
+import asyncio
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Literal, Optional, Union
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 from llama_index.core.embeddings import BaseEmbedding
+from src.cache.lru import TTLLRUCache
+from src.embedding.batcher import EmbeddingBatcher
+from src.embedding.persistent_cache import PersistentEmbeddingCache
 import logging
 
 logger = logging.getLogger(__name__)
 
+EmbeddingBackend = Literal["torch", "torch_int8", "onnx", "onnx_int8", "bgem3"]
+
+
 class EmbeddingProvider:
     """
     Class đơn giản để load và cung cấp embedding model.
     Chỉ load model khi khởi tạo instance.
+    - backend: "torch" (HuggingFaceEmbedding gốc), "torch_int8" (quantize dynamic
+      các lớp Linear, CPU), "onnx" / "onnx_int8" (ONNX Runtime CPU, xem export_onnx.py),
+      "bgem3" (dense + trọng số lexical sparse trong cùng một forward pass, xem sparse_query).
+    - num_threads: số thread tính toán (torch / ONNX Runtime), None = mặc định.
+    - query_max_length: giới hạn số token của query cho backend ONNX / bgem3; backend torch giữ
+      max_length mặc định của HuggingFaceEmbedding (độ dài tối đa của model) như trước.
+    - embed_query: embedding query có memo LRU, để cache + dense retriever
+      trong cùng một request dùng lại đúng một lần tính.
+    - aembed_query: bản async; khi bật batching, query của mọi session đi qua
+      EmbeddingBatcher để gộp thành một forward pass theo batch.
+    - persistent_cache_path: cache embedding query trên đĩa (SQLite), được tra
+      trước khi chạy model → không phải tính lại sau restart / giữa các replica.
     """
 
     def __init__(
         self,
         model_name: str = "BAAI/bge-m3",
         device: str = "cuda",
+        query_cache_size: int = 1024,
+        backend: EmbeddingBackend = "torch",
+        num_threads: Optional[int] = None,
+        query_max_length: int = 512,
+        onnx_dir: Optional[Union[str, Path]] = None,
+        batching: bool = False,
+        batch_max_size: int = 16,
+        batch_max_wait_ms: float = 5.0,
+        persistent_cache_path: Optional[Union[str, Path]] = None,
+        persistent_cache_max_entries: int = 200_000,
     ):
         logger.info(
-            "[EmbeddingProvider] Bắt đầu load embedding model: %s trên device %s",
-            model_name, device
+            "[EmbeddingProvider] Bắt đầu load embedding model: %s trên device %s (backend=%s)",
+            model_name, device, backend
         )
+        self.backend = backend
 
         try:
-            self._embed_model = HuggingFaceEmbedding(
-                model_name=model_name,
-                device=device,
+            self._embed_model = self._load(
+                model_name, device, backend, num_threads, query_max_length, onnx_dir,
+                # Batch của EmbeddingBatcher phải chạy trong đúng một forward pass
+                embed_batch_size=max(batch_max_size, 10),
+                query_cache_size=query_cache_size,
             )
             # Optional: kiểm tra dimension để debug
-            test_dim = len(self._embed_model.get_text_embedding("kiểm tra"))
+            test_dim = self.dim = len(self._embed_model.get_text_embedding("kiểm tra"))
             logger.debug(
-                "[EmbeddingProvider] Đã load thành công embedding model: %s | device: %s | dimension: %d",
-                model_name, device, test_dim
+                "[EmbeddingProvider] Đã load thành công embedding model: %s | device: %s | backend: %s | dimension: %d",
+                model_name, device, backend, test_dim
             )
             logger.info("Embedding model sẵn sàng sử dụng.")
 
@@ -41,6 +76,155 @@ class EmbeddingProvider:
             )
             raise RuntimeError(f"Không thể load embedding model: {e}")
 
+        # bgem3 tự memo dense + sparse chung một entry; cache chỉ có dense đặt phía trước sẽ làm
+        # sparse_query phải forward lại khi dense hit → bỏ qua memo + cache trên đĩa của provider
+        dense_only_caches = backend != "bgem3"
+        self._query_cache = TTLLRUCache(maxsize=query_cache_size) if query_cache_size > 0 and dense_only_caches else None
+        self.persistent_cache: Optional[PersistentEmbeddingCache] = None
+        if persistent_cache_path is not None and dense_only_caches:
+            # Backend / max_length khác nhau cho vector khác nhau → nằm trong model_id
+            max_length_id = "default" if backend in ("torch", "torch_int8") else query_max_length
+            self.persistent_cache = PersistentEmbeddingCache(
+                path=persistent_cache_path,
+                model_id=f"{model_name}|{backend}|max{max_length_id}",
+                max_entries=persistent_cache_max_entries,
+            )
+        self.batcher: Optional[EmbeddingBatcher] = None
+        if batching:
+            self.batcher = EmbeddingBatcher(
+                self.embed_queries,
+                max_batch_size=batch_max_size,
+                max_wait_ms=batch_max_wait_ms,
+            )
+
+    @staticmethod
+    def _load(
+        model_name: str,
+        device: str,
+        backend: EmbeddingBackend,
+        num_threads: Optional[int],
+        query_max_length: int,
+        onnx_dir: Optional[Union[str, Path]],
+        embed_batch_size: int = 10,
+        query_cache_size: int = 1024,
+    ) -> BaseEmbedding:
+        if backend in ("onnx", "onnx_int8"):
+            from src.embedding.onnx_embedding import ONNX_FP32_FILE, ONNX_INT8_FILE, OnnxEmbedding
+
+            if onnx_dir is None:
+                raise ValueError("backend ONNX cần onnx_dir (thư mục export từ src.embedding.export_onnx)")
+            return OnnxEmbedding(
+                model_name=model_name,
+                onnx_dir=str(onnx_dir),
+                file_name=ONNX_INT8_FILE if backend == "onnx_int8" else ONNX_FP32_FILE,
+                query_max_length=query_max_length,
+                num_threads=num_threads,
+                embed_batch_size=embed_batch_size,
+            )
+
+        if backend == "bgem3":
+            from src.embedding.bge_m3 import BGEM3Embedding
+
+            return BGEM3Embedding(
+                model_name=model_name,
+                device=device,
+                query_max_length=query_max_length,
+                query_cache_size=max(query_cache_size, 1),
+                num_threads=num_threads,
+                embed_batch_size=embed_batch_size,
+            )
+
+        import torch
+
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        if backend == "torch_int8" and device != "cpu":
+            logger.warning("[EmbeddingProvider] torch_int8 chỉ chạy trên CPU → bỏ qua device=%s", device)
+            device = "cpu"
+
+        # Giữ max_length mặc định (độ dài tối đa của model) → không cắt query dài hơn query_max_length
+        embed_model = HuggingFaceEmbedding(
+            model_name=model_name,
+            device=device,
+            embed_batch_size=embed_batch_size,
+        )
+        if backend == "torch_int8":
+            torch.quantization.quantize_dynamic(
+                embed_model._model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+            )
+        return embed_model
+
     @property
     def embed_model(self) -> BaseEmbedding:
-        return self._embed_model
\ No newline at end of file
+        return self._embed_model
+
+    def embed_query(self, text: str) -> np.ndarray:
+        """
+        Embedding cho query (float32), memo theo text nguyên văn.
+        Hàm blocking → gọi qua run_in_executor từ code async.
+        """
+        if self._query_cache is not None:
+            cached = self._query_cache.get(text)
+            if cached is not None:
+                return cached
+
+        embedding = self.persistent_cache.get(text) if self.persistent_cache is not None else None
+        if embedding is None:
+            embedding = np.asarray(self._embed_model.get_query_embedding(text), dtype=np.float32)
+            # Mảng dùng chung giữa các lần gọi → không cho sửa tại chỗ
+            embedding.setflags(write=False)
+            if self.persistent_cache is not None:
+                self.persistent_cache.set(text, embedding)
+        if self._query_cache is not None:
+            self._query_cache.set(text, embedding)
+        return embedding
+
+    def embed_queries(self, texts: List[str]) -> List[np.ndarray]:
+        """Embedding một batch query (blocking): tra cache trên đĩa, phần còn thiếu chạy một lần forward."""
+        found = self.persistent_cache.get_many(texts) if self.persistent_cache is not None else {}
+        missing = [text for text in dict.fromkeys(texts) if text not in found]
+        if missing:
+            vectors = self._embed_query_batch(missing)
+            computed = {text: np.asarray(vector, dtype=np.float32) for text, vector in zip(missing, vectors)}
+            if self.persistent_cache is not None:
+                self.persistent_cache.set_many(computed)
+            found.update(computed)
+        return [found[text] for text in texts]
+
+    def embed_texts(self, texts: List[str]) -> List[np.ndarray]:
+        """
+        Embedding text (chunk, không phải query) chạy thẳng model, KHÔNG qua memo / cache trên đĩa:
+        chunk không bao giờ là query → ghi vào cache query chỉ đẩy query thật ra ngoài.
+        """
+        return [np.asarray(vector, dtype=np.float32) for vector in self._embed_model.get_text_embedding_batch(texts)]
+
+    def _embed_query_batch(self, texts: List[str]) -> List[List[float]]:
+        # ONNX / bgem3: batch theo đường query (query_max_length); HuggingFaceEmbedding không có API batch
+        # cho query, nhưng bge-m3 không có query instruction và cùng max_length → embedding query = embedding text
+        query_batch = getattr(self._embed_model, "get_query_embedding_batch", None)
+        if query_batch is not None:
+            return query_batch(texts)
+        return self._embed_model.get_text_embedding_batch(texts)
+
+    async def aembed_query(self, text: str) -> np.ndarray:
+        """Bản async của embed_query: memo → batcher (nếu bật) hoặc executor."""
+        if self._query_cache is not None:
+            cached = self._query_cache.get(text)
+            if cached is not None:
+                return cached
+
+        if self.batcher is None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.embed_query, text)
+
+        embedding = await self.batcher.embed(text)
+        if self._query_cache is not None:
+            self._query_cache.set(text, embedding)
+        return embedding
+
+    def sparse_query(self, text: str) -> Dict[int, float]:
+        """Trọng số lexical của query (chỉ backend "bgem3"), dùng lại kết quả của lần embed dense."""
+        sparse_query = getattr(self._embed_model, "sparse_query", None)
+        if sparse_query is None:
+            raise ValueError(f"Backend '{self.backend}' không hỗ trợ trọng số sparse, cần backend 'bgem3'")
+        return sparse_query(text)
@@ -0,0 +1,61 @@
+"""
+Export bge-m3 sang ONNX (fp32) + bản quantize dynamic int8 cho backend CPU.
+
+Chạy:
+    python -m src.embedding.export_onnx
+    python -m src.embedding.export_onnx --skip-int8
+Kết quả nằm trong settings.paths.embedding_onnx_dir:
+    model.onnx (+ model.onnx.data), model_int8.onnx, tokenizer.
+"""
+import argparse
+from pathlib import Path
+import torch
+from transformers import AutoModel, AutoTokenizer
+from src.embedding.onnx_embedding import ONNX_FP32_FILE, ONNX_INT8_FILE
+from src.config.settings import settings
+
+
+def export(model_name: str, output_dir: Path, opset: int = 17, with_int8: bool = True):
+    output_dir.mkdir(parents=True, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    tokenizer.save_pretrained(output_dir)
+
+    sample = tokenizer(["kiểm tra export onnx"], return_tensors="pt")
+    fp32_path = output_dir / ONNX_FP32_FILE
+    print(f"Export fp32 → {fp32_path}")
+    with torch.no_grad():
+        # Model > 2GB → torch tự ghi trọng số ra file external data cạnh model.onnx
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            str(fp32_path),
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+
+    if with_int8:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_path = output_dir / ONNX_INT8_FILE
+        print(f"Quantize dynamic int8 → {int8_path}")
+        quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export embedding model sang ONNX")
+    parser.add_argument("--model", default=settings.embedding.model_name)
+    parser.add_argument("--output-dir", type=Path, default=settings.paths.embedding_onnx_dir)
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--skip-int8", action="store_true")
+    args = parser.parse_args()
+
+    export(args.model, args.output_dir, args.opset, with_int8=not args.skip_int8)
+    print("Xong.")
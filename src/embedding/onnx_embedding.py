@@ -0,0 +1,89 @@
+import numpy as np
+from pathlib import Path
+from typing import Any, List, Optional
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.embeddings import BaseEmbedding
+import logging
+
+logger = logging.getLogger(__name__)
+
+ONNX_FP32_FILE = "model.onnx"
+ONNX_INT8_FILE = "model_int8.onnx"
+
+
+class OnnxEmbedding(BaseEmbedding):
+    """
+    Embedding bge-m3 (dense) chạy bằng ONNX Runtime trên CPU:
+    - Load model đã export bởi `python -m src.embedding.export_onnx`
+      (model.onnx fp32 hoặc model_int8.onnx quantize dynamic).
+    - Pooling giống bge-m3 gốc: vector [CLS] của last_hidden_state rồi chuẩn hoá L2.
+    - query_max_length: cắt query ngắn hơn document để giảm chi phí attention.
+    """
+
+    onnx_dir: str = Field(description="Thư mục chứa model ONNX + tokenizer")
+    file_name: str = Field(default=ONNX_FP32_FILE)
+    max_length: int = Field(default=8192)
+    query_max_length: int = Field(default=512)
+    num_threads: Optional[int] = Field(default=None)
+
+    _session: Any = PrivateAttr()
+    _tokenizer: Any = PrivateAttr()
+    _input_names: List[str] = PrivateAttr()
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_path = Path(self.onnx_dir) / self.file_name
+        if not model_path.exists():
+            raise FileNotFoundError(
+                f"Không tìm thấy {model_path}. Chạy `python -m src.embedding.export_onnx` để export model."
+            )
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+            options.inter_op_num_threads = 1
+
+        self._session = ort.InferenceSession(str(model_path), sess_options=options, providers=["CPUExecutionProvider"])
+        self._tokenizer = AutoTokenizer.from_pretrained(self.onnx_dir)
+        self._input_names = [i.name for i in self._session.get_inputs()]
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "OnnxEmbedding"
+
+    def _encode(self, texts: List[str], max_length: int) -> List[List[float]]:
+        encoded = self._tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=max_length,
+            return_tensors="np",
+        )
+        feeds = {name: encoded[name].astype(np.int64) for name in self._input_names}
+        last_hidden_state = self._session.run(None, feeds)[0]
+        cls = last_hidden_state[:, 0]
+        cls = cls / np.clip(np.linalg.norm(cls, axis=1, keepdims=True), 1e-12, None)
+        return cls.astype(np.float32).tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._encode([query], self.query_max_length)[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def get_query_embedding_batch(self, queries: List[str]) -> List[List[float]]:
+        """Embedding nhiều query theo batch embed_batch_size, cắt theo query_max_length (không phải max_length của document)."""
+        vectors: List[List[float]] = []
+        for start in range(0, len(queries), self.embed_batch_size):
+            vectors.extend(self._encode(queries[start: start + self.embed_batch_size], self.query_max_length))
+        return vectors
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._encode([text], self.max_length)[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._encode(texts, self.max_length)
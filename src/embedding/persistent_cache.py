@@ -0,0 +1,135 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Literal, Optional, Union
+import numpy as np
+from src.cache.codec import decode_embedding
+from src.cache.normalize import NORMALIZATION_VERSION, normalize_text
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PersistentEmbeddingCache:
+    """
+    Cache embedding query trên đĩa (SQLite), sống qua restart và dùng chung giữa
+    các process trên cùng máy:
+    - Key = sha256(model_id, phiên bản chuẩn hoá, text đã chuẩn hoá).
+    - Vector lưu dạng raw bytes (float16 mặc định, 2 KB / vector 1024d).
+    - Giới hạn max_entries theo LRU (cột last_access), dọn theo lô khi vượt ngưỡng.
+    - Thread-safe (một connection + lock), lỗi SQLite chỉ log, không làm hỏng luồng embed.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        model_id: str,
+        max_entries: int = 200_000,
+        dtype: Literal["float32", "float16"] = "float16",
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.dtype = dtype
+        # Dọn thêm ~5% mỗi lần vượt ngưỡng để không phải xoá sau từng lần ghi
+        self._evict_slack = max(1, max_entries // 20)
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " dtype TEXT NOT NULL,"
+            " vec BLOB NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        logger.info(f"[PersistentEmbeddingCache] {self.path} | {self._count:,} vector | model_id={model_id}")
+
+    def make_key(self, text: str) -> str:
+        parts = [self.model_id, f"norm{NORMALIZATION_VERSION}", normalize_text(text)]
+        return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+    def get_many(self, texts: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Trả về {text: embedding} cho các text đã có trong cache."""
+        keys = {self.make_key(text): text for text in texts}
+        if not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        try:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT key, dtype, vec FROM embeddings WHERE key IN ({placeholders})",
+                    list(keys),
+                ).fetchall()
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_access = ? WHERE key IN ({','.join('?' * len(rows))})",
+                        [time.time()] + [key for key, _, _ in rows],
+                    )
+        except sqlite3.Error as e:
+            logger.warning(f"[PersistentEmbeddingCache] Lỗi đọc: {e}")
+            return {}
+
+        found = {}
+        for key, dtype, vec in rows:
+            embedding = decode_embedding(vec, dtype)
+            embedding.setflags(write=False)
+            found[keys[key]] = embedding
+        return found
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        return self.get_many([text]).get(text)
+
+    def set_many(self, embeddings: Dict[str, np.ndarray]):
+        if not embeddings:
+            return
+        now = time.time()
+        rows = [
+            (self.make_key(text), self.dtype, np.asarray(vec, dtype=np.float32).astype(self.dtype).tobytes(), now)
+            for text, vec in embeddings.items()
+        ]
+        try:
+            with self._lock:
+                self._conn.execute("BEGIN")
+                before = self._conn.total_changes
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO embeddings (key, dtype, vec, last_access) VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+                self._count += self._conn.total_changes - before
+                self._conn.execute("COMMIT")
+                if self._count > self.max_entries + self._evict_slack:
+                    self._evict()
+        except sqlite3.Error as e:
+            logger.warning(f"[PersistentEmbeddingCache] Lỗi ghi: {e}")
+            try:
+                self._conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+
+    def set(self, text: str, embedding: np.ndarray):
+        self.set_many({text: embedding})
+
+    def _evict(self):
+        """Xoá các vector ít được dùng gần đây nhất cho tới khi còn max_entries (gọi khi đang giữ lock)."""
+        excess = self._count - self.max_entries
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+            (excess,),
+        )
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        logger.debug(f"[PersistentEmbeddingCache] Đã dọn {excess:,} vector (LRU), còn {self._count:,}")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,5 +1,5 @@
 import os
-from typing import Optional
+from typing import AsyncIterator, Optional
 from groq import AsyncGroq
 from dotenv import load_dotenv
 from src.generator.prompt import PromptTemplate
@@ -68,4 +68,47 @@ class LLMGenerator:
                 "Vui lòng thử lại sau vài giây hoặc đặt câu hỏi khác nhé!"
             )
 
+    @observe(name="llm_stream")
+    async def stream_response(
+        self,
+        question: str,
+        retrieved_context: str,
+    ) -> AsyncIterator[str]:
+        """
+        Giống generate_response nhưng stream từng token (stream=True).
+        Nếu lỗi trước khi có token nào → yield câu trả lời fallback.
+        """
+        messages = PromptTemplate.build_messages(
+            question=question,
+            retrieved_context=retrieved_context
+        )
 
+        logger.debug(f"Prompt sau khi thêm context: {messages}")
+        produced = 0
+        try:
+            stream = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=self.temperature,
+                max_completion_tokens=self.max_completion_tokens,
+                reasoning_effort="none",
+                top_p=0.9,
+                stream=True,
+            )
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    produced += len(delta)
+                    yield delta
+
+            logger.debug(f"[LLMGenerator] Đã stream xong câu trả lời, độ dài: {produced} ký tự")
+
+        except Exception as e:
+            logger.error(f"[LLMGenerator] Lỗi khi stream từ Groq: {str(e)}")
+            if produced == 0:
+                yield (
+                    "Xin lỗi, hệ thống đang gặp sự cố khi xử lý câu hỏi. "
+                    "Vui lòng thử lại sau vài giây hoặc đặt câu hỏi khác nhé!"
+                )
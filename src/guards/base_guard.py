@@ -1,29 +1,74 @@
 import asyncio
+import hashlib
+import json
 import os
+import re
 from dotenv import load_dotenv
 from groq import AsyncGroq
 import fasttext
 import unicodedata
 import ahocorasick
 from pathlib import Path
-from src.guards.prompts import prompts
+from typing import Dict, List, Literal, Optional, Tuple
+from src.guards.prompts import SafetyPrompts, prompts
+from src.guards.verdict_cache import GuardVerdictCache
 from langfuse import observe
 import logging
 logger = logging.getLogger(__name__)
 # load_dotenv()
 
+DEFAULT_SYSTEM_PROMPT = "Bạn là trợ lý an toàn. TUYỆT ĐỐI CHỈ TRẢ LỜI 'Có' hoặc 'Không'. KHÔNG dùng <think>, KHÔNG giải thích, KHÔNG thêm text nào khác."
+_JSON_OBJECT_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+# Đổi bất kỳ prompt nào → verdict cũ trong cache tự động không còn khớp
+PROMPT_VERSION = hashlib.md5(
+    "\x1f".join(
+        [DEFAULT_SYSTEM_PROMPT]
+        + [value for name, value in sorted(vars(SafetyPrompts).items()) if isinstance(value, str) and not name.startswith("_")]
+    ).encode()
+).hexdigest()[:12]
+
+def load_language_model(fasttext_model_dir):
+    return fasttext.load_model(str(fasttext_model_dir))
+
+
 class BaseGuard:
     def __init__(
         self,
         guard_model: str,
         fasttext_model_dir: str,
         blocked_file_path: str,
+        check_timeout_seconds: float = 8.0,
+        check_timeouts: Optional[Dict[str, float]] = None,
+        guard_mode: Literal["separate", "combined"] = "separate",
+        verdict_cache_size: int = 4096,
+        verdict_cache_ttl_seconds: int = 86400,
+        verdict_redis_url: Optional[str] = None,
+        language_model=None,
     ):
         self.groq_client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
         self.model = guard_model  # hoặc model Groq khác nếu muốn
 
-        # FastText language detection
-        self.language_model = fasttext.load_model(str(fasttext_model_dir))
+        # Timeout cho từng LLM check (override theo tên check, ví dụ {"hallucination": 15})
+        self.check_timeout_seconds = check_timeout_seconds
+        self.check_timeouts = check_timeouts or {}
+
+        # "separate": 4 prompt riêng chạy song song | "combined": 1 prompt trả về verdict JSON
+        self.guard_mode = guard_mode
+
+        # Cache verdict theo text đã chuẩn hoá (0 = tắt)
+        self.verdict_cache: Optional[GuardVerdictCache] = None
+        if verdict_cache_size > 0:
+            self.verdict_cache = GuardVerdictCache(
+                model=self.model,
+                prompt_version=PROMPT_VERSION,
+                maxsize=verdict_cache_size,
+                ttl_seconds=verdict_cache_ttl_seconds,
+                redis_url=verdict_redis_url,
+            )
+
+        # FastText language detection (truyền model đã load để dùng chung giữa các guard)
+        self.language_model = language_model if language_model is not None else load_language_model(fasttext_model_dir)
         self.max_chars = 4000
         self.lang_threshold = 0.80
         self.allowed_lang = "__label__vi"
@@ -76,12 +121,12 @@ class BaseGuard:
 
         return True, ""
 
-    async def _check_with_llm(self, prompt: str) -> str:
+    async def _check_with_llm(self, prompt: str, system_prompt: str = DEFAULT_SYSTEM_PROMPT) -> str:
         try:
             response = await self.groq_client.chat.completions.create(
                 model=self.model,
                 messages=[
-                    {"role": "system", "content": "Bạn là trợ lý an toàn. TUYỆT ĐỐI CHỈ TRẢ LỜI 'Có' hoặc 'Không'. KHÔNG dùng <think>, KHÔNG giải thích, KHÔNG thêm text nào khác."},
+                    {"role": "system", "content": system_prompt},
                     {"role": "user", "content": prompt}
                 ],
                 temperature=0.0,
@@ -91,6 +136,162 @@ class BaseGuard:
             logger.error(f"Lỗi gọi Groq: {e}")
             return "ERROR"
 
+    async def _run_check(self, name: str, prompt: str) -> str:
+        timeout = self.check_timeouts.get(name, self.check_timeout_seconds)
+        try:
+            return await asyncio.wait_for(self._check_with_llm(prompt), timeout=timeout)
+        except asyncio.TimeoutError:
+            # Giống nhánh lỗi Groq: không chặn request khi check không trả lời kịp
+            logger.warning(f"[BaseGuard] Check '{name}' quá {timeout}s → bỏ qua")
+            return "TIMEOUT"
+
+    def _verdict_keys(self, checks: List[Tuple[str, str, str]], text: str, context: Optional[str]) -> Dict[str, str]:
+        if self.verdict_cache is None:
+            return {}
+        return {name: self.verdict_cache.make_key(name, text, context) for name, _, _ in checks}
+
+    async def _cached_verdicts(self, keys: Dict[str, str]) -> Dict[str, bool]:
+        """{tên check: blocked} cho các check đã có verdict trong cache."""
+        if not keys:
+            return {}
+        found = await self.verdict_cache.get_many(keys.values())
+        return {name: found[key] for name, key in keys.items() if key in found}
+
+    async def _store_verdicts(self, keys: Dict[str, str], verdicts: Dict[str, bool]):
+        if keys and verdicts:
+            await self.verdict_cache.set_many({keys[name]: blocked for name, blocked in verdicts.items() if name in keys})
+
+    async def _run_checks(
+        self,
+        checks: List[Tuple[str, str, str]],
+        text: str,
+        context: Optional[str] = None,
+    ) -> Optional[str]:
+        """
+        Chạy song song các LLM check (name, prompt, error_message).
+        Trả về error_message của check đầu tiên báo "Có" và huỷ các check còn lại;
+        None nếu tất cả đều pass. Check đã có verdict trong cache thì không gọi Groq.
+        """
+        keys = self._verdict_keys(checks, text, context)
+        cached = await self._cached_verdicts(keys)
+        remaining = []
+        for name, prompt, error_message in checks:
+            if name not in cached:
+                remaining.append((name, prompt, error_message))
+            elif cached[name]:
+                logger.debug(f"[BaseGuard] Verdict cache: '{name}' block")
+                return error_message
+        if not remaining:
+            logger.debug("[BaseGuard] Verdict cache: pass toàn bộ, bỏ qua Groq")
+            return None
+
+        tasks = {
+            asyncio.create_task(self._run_check(name, prompt)): (order, name, error_message)
+            for order, (name, prompt, error_message) in enumerate(remaining)
+        }
+        pending = set(tasks)
+        new_verdicts: Dict[str, bool] = {}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=lambda t: tasks[t][0]):
+                    _, name, error_message = tasks[task]
+                    result = task.result()
+                    blocked = "Có" in result
+                    # Chỉ cache câu trả lời thật của model (không cache ERROR / TIMEOUT)
+                    if result not in ("ERROR", "TIMEOUT"):
+                        new_verdicts[name] = blocked
+                    if blocked:
+                        logger.debug(f"[BaseGuard] Check '{name}' block → huỷ {len(pending)} check còn lại")
+                        return error_message
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+            await self._store_verdicts(keys, new_verdicts)
+
+    @staticmethod
+    def _parse_verdict(text: str) -> Optional[Dict[str, bool]]:
+        """Parse verdict JSON {"tiêu chí": "Có"/"Không"} → {tiêu chí: bị block?}. None nếu không parse được."""
+        match = _JSON_OBJECT_RE.search(text or "")
+        if not match:
+            return None
+        try:
+            data = json.loads(match.group(0))
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        verdict = {}
+        for name, value in data.items():
+            if isinstance(value, bool):
+                verdict[name] = value
+            else:
+                verdict[name] = str(value).strip().lower() in ("có", "co", "yes", "true")
+        return verdict
+
+    async def _run_combined(
+        self,
+        checks: List[Tuple[str, str, str]],
+        combined_prompt: str,
+        text: str,
+        context: Optional[str] = None,
+    ) -> Optional[str]:
+        """
+        Một lần gọi LLM cho tất cả tiêu chí, map verdict về error message cũ.
+        Tiêu chí thiếu trong JSON (hoặc JSON lỗi) → fallback chạy riêng các check đó.
+        """
+        keys = self._verdict_keys(checks, text, context)
+        cached = await self._cached_verdicts(keys)
+        for name, _, error_message in checks:
+            if cached.get(name):
+                logger.debug(f"[BaseGuard] Verdict cache: '{name}' block")
+                return error_message
+        if len(cached) == len(checks):
+            logger.debug("[BaseGuard] Verdict cache: pass toàn bộ, bỏ qua Groq")
+            return None
+
+        timeout = self.check_timeouts.get("combined", self.check_timeout_seconds)
+        try:
+            raw = await asyncio.wait_for(
+                self._check_with_llm(combined_prompt, system_prompt=prompts.combined_system),
+                timeout=timeout,
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"[BaseGuard] Combined check quá {timeout}s → fallback từng check")
+            raw = ""
+
+        verdict = self._parse_verdict(raw) or {}
+        await self._store_verdicts(keys, verdict)
+        missing = []
+        for name, prompt, error_message in checks:
+            if name not in verdict:
+                missing.append((name, prompt, error_message))
+            elif verdict[name]:
+                logger.debug(f"[BaseGuard] Combined verdict block: {name}")
+                return error_message
+
+        if missing:
+            logger.warning(f"[BaseGuard] Verdict JSON thiếu {[name for name, _, _ in missing]} → chạy riêng")
+            return await self._run_checks(missing, text, context)
+        return None
+
+    def _input_checks(self, user_input: str) -> List[Tuple[str, str, str]]:
+        return [
+            ("toxicity",          prompts.toxicity.format(relevant_text=user_input),          "Nội dung truy vấn có chứa yếu tố độc hại, xúc phạm, bạo lực, phân biệt đối xử, khiêu dâm, khuyến khích tự hại hoặc bất hợp pháp."),
+            ("topic_restriction", prompts.topic_restriction.format(relevant_text=user_input), "Nội dung truy vấn không thuộc chủ đề về y tế, sức khỏe."),
+            ("prompt_injection",  prompts.prompt_injection.format(relevant_text=user_input),  "Nội dung có dấu hiệu thao túng hoặc jailbreak. Không được phép."),
+            ("code_injection",    prompts.code_injection.format(relevant_text=user_input),    "Nội dung chứa mã nguy hiểm hoặc injection. Không được phép."),
+        ]
+
+    def _output_checks(self, response: str, context: str) -> List[Tuple[str, str, str]]:
+        return [
+            ("toxicity",          prompts.toxicity.format(relevant_text=response),          "Nội dung output có chứa yếu tố độc hại, xúc phạm, bạo lực, phân biệt đối xử, khiêu dâm, khuyến khích tự hại hoặc bất hợp pháp."),
+            ("topic_restriction", prompts.topic_restriction.format(relevant_text=response), "Nội dung output không thuộc chủ đề về y tế, sức khỏe."),
+            ("hallucination",     prompts.hallucination_prompt.format(relevant_text=response, context=context),  "Nội dung có dấu hiệu bịa đặt hoặc mâu thuẫn với context."),
+            ("refusal_leak",      prompts.refusal_leak_prompt.format(relevant_text=response),    "Nội dung output từ chối nhưng vẫn leak thông tin nguy hiểm."),
+        ]
+
     @observe(name="input_guard")
     async def check_input(self, user_input: str) -> tuple[bool, str]:
         # Bước 1 & 2: kiểm tra nhanh
@@ -103,17 +304,13 @@ class BaseGuard:
             return False, "Nội dung chứa các từ nhạy cảm hoặc bị cấm"
 
         # Bước 4: Kiểm tra LLM - dùng prompts từ file riêng
-        checks = [
-            (prompts.toxicity.format(relevant_text=user_input),          "Nội dung truy vấn có chứa yếu tố độc hại, xúc phạm, bạo lực, phân biệt đối xử, khiêu dâm, khuyến khích tự hại hoặc bất hợp pháp."),
-            (prompts.topic_restriction.format(relevant_text=user_input), "Nội dung truy vấn không thuộc chủ đề về y tế, sức khỏe."),
-            (prompts.prompt_injection.format(relevant_text=user_input),  "Nội dung có dấu hiệu thao túng hoặc jailbreak. Không được phép."),
-            (prompts.code_injection.format(relevant_text=user_input),    "Nội dung chứa mã nguy hiểm hoặc injection. Không được phép."),
-        ]
-
-        for prompt, error_message in checks:
-            result = await self._check_with_llm(prompt)
-            if "Có" in result:
-                return False, error_message
+        checks = self._input_checks(user_input)
+        if self.guard_mode == "combined":
+            error_message = await self._run_combined(checks, prompts.combined_input.format(relevant_text=user_input), user_input)
+        else:
+            error_message = await self._run_checks(checks, user_input)
+        if error_message is not None:
+            return False, error_message
 
         # Pass hết
         return True, user_input
@@ -125,17 +322,13 @@ class BaseGuard:
             return False, "Nội dung chứa các từ nhạy cảm hoặc bị cấm"
 
         # Bước 2-5: Kiểm tra LLM - dùng prompts từ file riêng
-        checks = [
-            (prompts.toxicity.format(relevant_text=response),          "Nội dung output có chứa yếu tố độc hại, xúc phạm, bạo lực, phân biệt đối xử, khiêu dâm, khuyến khích tự hại hoặc bất hợp pháp."),
-            (prompts.topic_restriction.format(relevant_text=response), "Nội dung output không thuộc chủ đề về y tế, sức khỏe."),
-            (prompts.hallucination_prompt.format(relevant_text=response, context=context),  "Nội dung có dấu hiệu bịa đặt hoặc mâu thuẫn với context."),
-            (prompts.refusal_leak_prompt.format(relevant_text=response),    "Nội dung output từ chối nhưng vẫn leak thông tin nguy hiểm."),
-        ]
-
-        for prompt, error_message in checks:
-            result = await self._check_with_llm(prompt)
-            if "Có" in result:
-                return False, error_message
+        checks = self._output_checks(response, context)
+        if self.guard_mode == "combined":
+            error_message = await self._run_combined(checks, prompts.combined_output.format(relevant_text=response, context=context), response, context)
+        else:
+            error_message = await self._run_checks(checks, response, context)
+        if error_message is not None:
+            return False, error_message
 
         # Pass hết
         return True, response
\ No newline at end of file
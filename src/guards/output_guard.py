@@ -4,4 +4,8 @@ logger = logging.getLogger(__name__)
 
 class OutputGuard(BaseGuard):
     async def guard(self, response: str, context: str) -> tuple[bool, str]:
-        return await self.check_output(response, context)
\ No newline at end of file
+        return await self.check_output(response, context)
+
+    def contains_blocked_keywords(self, text: str) -> bool:
+        """Kiểm tra nhanh từ cấm (dùng khi stream, trước khi gửi token ra UI)."""
+        return self._has_blocked_keywords(text)
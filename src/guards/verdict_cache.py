@@ -0,0 +1,86 @@
+import hashlib
+from typing import Dict, Iterable, Optional
+import redis.asyncio as aioredis
+from src.cache.lru import TTLLRUCache
+from src.cache.normalize import fold_whitespace
+import logging
+logger = logging.getLogger(__name__)
+
+
+class GuardVerdictCache:
+    """
+    Cache verdict của từng LLM check trong guard:
+    - Key = hash(model, phiên bản prompt, tên check, text (chỉ NFC + gộp khoảng trắng), context).
+      Không dùng normalize_text: bỏ dấu câu / lowercase sẽ cho payload injection trùng key
+      với câu vô hại đã pass.
+    - Value = True (block) / False (pass).
+    - L1: LRU in-process có TTL; L2 (tuỳ chọn): Redis, dùng chung giữa các replica.
+    - Lỗi Redis chỉ log, không bao giờ làm hỏng luồng guard.
+    """
+    KEY_PREFIX = "rag:guard:"
+
+    def __init__(
+        self,
+        model: str,
+        prompt_version: str,
+        maxsize: int = 4096,
+        ttl_seconds: int = 86400,
+        redis_url: Optional[str] = None,
+    ):
+        self.model = model
+        self.prompt_version = prompt_version
+        self.ttl_seconds = ttl_seconds
+        self.local = TTLLRUCache(maxsize=maxsize, ttl_seconds=ttl_seconds)
+        self.redis_client = aioredis.Redis.from_url(redis_url, decode_responses=True) if redis_url else None
+
+    def make_key(self, check_name: str, text: str, context: Optional[str] = None) -> str:
+        parts = [
+            self.model,
+            self.prompt_version,
+            "ws1",
+            check_name,
+            fold_whitespace(text),
+            # Context (output guard) giữ nguyên, chỉ cần hash
+            hashlib.sha256(context.encode()).hexdigest() if context else "",
+        ]
+        digest = hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+        return f"{self.KEY_PREFIX}{digest}"
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, bool]:
+        """Trả về {key: blocked} cho các key đã có verdict."""
+        found: Dict[str, bool] = {}
+        missing = []
+        for key in keys:
+            value = self.local.get(key)
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+
+        if missing and self.redis_client is not None:
+            try:
+                values = await self.redis_client.mget(missing)
+            except Exception as e:
+                logger.warning(f"[GuardVerdictCache] Lỗi đọc Redis: {e}")
+                return found
+            for key, value in zip(missing, values):
+                if value is not None:
+                    blocked = value == "1"
+                    found[key] = blocked
+                    self.local.set(key, blocked)
+        return found
+
+    async def set_many(self, verdicts: Dict[str, bool]):
+        if not verdicts:
+            return
+        for key, blocked in verdicts.items():
+            self.local.set(key, blocked)
+
+        if self.redis_client is not None:
+            try:
+                async with self.redis_client.pipeline(transaction=False) as pipe:
+                    for key, blocked in verdicts.items():
+                        pipe.set(key, "1" if blocked else "0", ex=self.ttl_seconds)
+                    await pipe.execute()
+            except Exception as e:
+                logger.warning(f"[GuardVerdictCache] Lỗi ghi Redis: {e}")
@@ -1,76 +1,396 @@
+import asyncio
 import os
-from typing import Optional, List, Dict, Any
+import numpy as np
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional, List, Dict, Any, Tuple
 from datetime import datetime
 from dotenv import load_dotenv
 from langfuse import observe
 from langchain_core.messages import HumanMessage, AIMessage
+from llama_index.core.schema import NodeWithScore
 from src.embedding.embedding import EmbeddingProvider
+from src.guards.base_guard import load_language_model
 from src.guards.input_guard import InputGuard
 from src.guards.output_guard import OutputGuard
 from src.rewriter.query_rewriter import QueryRewriter
 from src.retrievers.hybrid import HybridRetriever
+from src.retrievers.dense import DenseRetrieverBuilder
+from src.retrievers.bm25 import BM25RetrieverBuilder, NativeBM25Retriever
+from src.retrievers.sparse import SparseRetrieverBuilder
+from src.retrievers.faiss_dense import FaissRetrieverBuilder
+from src.retrievers.context_builder import ContextBuilder, load_token_counter
+from src.reranker.cross_encoder import CrossEncoderReranker
+from src.storage.node_hydrator import NodeHydrator
+from src.storage.node_file_store import NODE_IDS_FILE, NodeFileStore
+from src.storage.index_version import IndexVersion
+from src.cache.retrieval_cache import RetrievalResultCache
 from src.generator.llm_generator import LLMGenerator
 from src.cache.semantic_cache import RedisSemanticCache
+from src.pipeline.startup import StartupOrchestrator
 from src.config.settings import settings
 import logging
 logger = logging.getLogger(__name__)
 load_dotenv()
 
+@dataclass
+class StreamChunk:
+    """Một phần câu trả lời khi stream. replace=True → thay toàn bộ nội dung đã gửi."""
+    text: str
+    replace: bool = False
+
+
+@dataclass
+class _PreparedQuery:
+    rejection: Optional[str] = None
+    rewritten_question: str = ""
+    cached_result: Optional[Tuple[str, str]] = None
+    retrieved: Optional[Tuple[List[NodeWithScore], str, str]] = None    # (nodes, context, degraded)
+    query_embedding: Optional[np.ndarray] = None
+
+
 class Rag:
     def __init__(self):
-        logger.info("[Rag] Đang khởi tạo pipeline...")
-        
-        self.input_guard = InputGuard(
-            guard_model=settings.llm.guard_model,
-            fasttext_model_dir=settings.paths.fasttext_model_dir,
-            blocked_file_path=settings.paths.blocked_file_path,
+        """
+        Không load gì ở đây: các component được StartupOrchestrator khởi tạo nền, song song
+        theo phụ thuộc. Semantic cache không bắt buộc → request đến trước khi cache load xong
+        thì bỏ qua bước cache thay vì chờ.
+        """
+        logger.info("[Rag] Đang khởi tạo pipeline (nền)...")
+        self.startup = StartupOrchestrator(
+            max_workers=settings.pipeline.startup_workers,
+            ready_file=settings.paths.ready_file,
         )
+        self.startup.register("language_model", self._build_language_model)
+        self.startup.register("input_guard", self._build_input_guard, deps=("language_model",))
+        self.startup.register("output_guard", self._build_output_guard, deps=("language_model",))
+        self.startup.register("query_rewriter", self._build_query_rewriter)
+        self.startup.register("generator", self._build_generator)
+        self.startup.register("embedding_provider", self._build_embedding_provider)
+        self.startup.register("dense_retriever", self._build_dense_retriever, deps=("embedding_provider",))
+        if settings.retriever.lexical == "sparse":
+            # Trọng số lexical lấy từ cùng lần embed query → cần embedding_provider, không cần BM25 / Mongo
+            self.startup.register("lexical_retriever", self._build_sparse_retriever, deps=("embedding_provider",))
+        else:
+            self.startup.register("lexical_retriever", self._build_bm25_retriever)
+        retriever_deps = ("embedding_provider", "dense_retriever", "lexical_retriever")
+        if settings.reranker.enabled:
+            # Load model song song với các nhánh retriever
+            self.startup.register("reranker", self._build_reranker)
+            retriever_deps += ("reranker",)
+        self.startup.register("retriever", self._build_retriever, deps=retriever_deps)
+        self.startup.register(
+            "semantic_cache",
+            self._build_semantic_cache,
+            deps=("embedding_provider",),
+            critical=False,
+        )
+        if settings.context.enabled:
+            # Tokenizer tải từ HF Hub → không bắt buộc; chưa sẵn sàng thì dùng get_context_string như cũ
+            self.startup.register(
+                "context_builder",
+                self._build_context_builder,
+                deps=("embedding_provider",),
+                critical=False,
+            )
+        self.startup.start()
 
-        self.output_guard = OutputGuard(
+    # ────────────────────────────────────────────────
+    # Khởi tạo component (chạy trong thread của StartupOrchestrator)
+    # ────────────────────────────────────────────────
+    @staticmethod
+    def _build_language_model():
+        # Một model fastText dùng chung cho cả input guard và output guard
+        return load_language_model(settings.paths.fasttext_model_dir)
+
+    @staticmethod
+    def _guard_kwargs(language_model) -> dict:
+        return dict(
             guard_model=settings.llm.guard_model,
             fasttext_model_dir=settings.paths.fasttext_model_dir,
             blocked_file_path=settings.paths.blocked_file_path,
+            check_timeout_seconds=settings.guard.check_timeout_seconds,
+            check_timeouts=settings.guard.check_timeouts,
+            guard_mode=settings.guard.mode,
+            verdict_cache_size=settings.guard.verdict_cache_size,
+            verdict_cache_ttl_seconds=settings.guard.verdict_cache_ttl_seconds,
+            verdict_redis_url=settings.chainlit.redis_url if settings.guard.verdict_cache_redis else None,
+            language_model=language_model,
         )
 
-        self.query_rewriter = QueryRewriter(
+    def _build_input_guard(self, language_model) -> InputGuard:
+        return InputGuard(**self._guard_kwargs(language_model))
+
+    def _build_output_guard(self, language_model) -> OutputGuard:
+        return OutputGuard(**self._guard_kwargs(language_model))
+
+    @staticmethod
+    def _build_query_rewriter() -> QueryRewriter:
+        return QueryRewriter(
             small_model=settings.llm.small_model,
         )
 
-        self.embedding_provider = EmbeddingProvider(
+    @staticmethod
+    def _build_generator() -> LLMGenerator:
+        return LLMGenerator(
+            model=settings.llm.model,
+        )
+
+    @staticmethod
+    def _build_embedding_provider() -> EmbeddingProvider:
+        backend = settings.embedding.backend
+        if settings.retriever.lexical == "sparse" and backend != "bgem3":
+            logger.warning(f"[Rag] retriever.lexical='sparse' cần backend 'bgem3' → bỏ qua backend '{backend}'")
+            backend = "bgem3"
+        return EmbeddingProvider(
             model_name=settings.embedding.model_name,
             device=settings.embedding.device,
-        )           
-        self.embed_model = self.embedding_provider.embed_model
-        
-        self.retriever = HybridRetriever(
+            query_cache_size=settings.embedding.query_cache_size,
+            backend=backend,
+            num_threads=settings.embedding.num_threads,
+            query_max_length=settings.embedding.query_max_length,
+            onnx_dir=settings.paths.embedding_onnx_dir,
+            batching=settings.embedding.batching,
+            batch_max_size=settings.embedding.batch_max_size,
+            batch_max_wait_ms=settings.embedding.batch_max_wait_ms,
+            persistent_cache_path=settings.paths.embedding_cache_path if settings.embedding.persistent_cache else None,
+            persistent_cache_max_entries=settings.embedding.persistent_cache_max_entries,
+        )
+
+    @staticmethod
+    def _build_dense_retriever(embedding_provider: EmbeddingProvider):
+        if settings.retriever.dense_backend == "faiss":
+            return FaissRetrieverBuilder.build(
+                index_dir=settings.paths.faiss_index_dir,
+                embed_model=embedding_provider.embed_model,
+                similarity_top_k=settings.retriever.top_k_dense,
+                nprobe=settings.faiss.nprobe,
+                ef_search=settings.faiss.ef_search,
+                num_threads=settings.faiss.num_threads,
+                expected_model=settings.embedding.model_name,
+            )
+        return DenseRetrieverBuilder.build(
+            api_key=os.getenv("PINECONE_API_KEY"),
+            index_name=settings.pinecone.index_name,
+            embed_model=embedding_provider.embed_model,
+            similarity_top_k=settings.retriever.top_k_dense,
+            namespace=settings.pinecone.namespace,      # Optional, có thể None
+            text_key=settings.pinecone.text_key or "text",  # Optional, mặc định "text"
+            embed_dim=embedding_provider.dim,
+            query_client=settings.pinecone.query_client,
+            index_host=settings.pinecone.index_host,
+            client_options=dict(
+                include_metadata=Rag._pinecone_include_metadata(),
+                timeout_seconds=settings.pinecone.timeout_seconds,
+                max_connections=settings.pinecone.max_connections,
+                keepalive_expiry_seconds=settings.pinecone.keepalive_expiry_seconds,
+                hedge=settings.pinecone.hedge,
+                hedge_percentile=settings.pinecone.hedge_percentile,
+                hedge_min_samples=settings.pinecone.hedge_min_samples,
+                hedge_min_delay_ms=settings.pinecone.hedge_min_delay_ms,
+            ),
+        )
+
+    @staticmethod
+    def _build_bm25_retriever():
+        return BM25RetrieverBuilder.build(
+            persist_dir=settings.paths.bm25_persist_dir,
+            mongo_uri=settings.doc_store.uri,
+            mongo_db_name=settings.doc_store.db_name,
+            mongo_namespace=settings.doc_store.namespace,
+            similarity_top_k=settings.retriever.top_k_bm25,
+            id_only=settings.retriever.bm25_id_only,
+        )
+
+    @staticmethod
+    def _build_sparse_retriever(embedding_provider: EmbeddingProvider):
+        return SparseRetrieverBuilder.build(
+            index_dir=settings.paths.sparse_index_dir,
+            sparse_fn=embedding_provider.sparse_query,
+            similarity_top_k=settings.retriever.top_k_bm25,
+            expected_model=settings.embedding.model_name,
+        )
+
+    @staticmethod
+    def _build_reranker() -> CrossEncoderReranker:
+        return CrossEncoderReranker(
+            model_name=settings.reranker.model_name,
+            backend=settings.reranker.backend,
+            onnx_dir=settings.paths.reranker_onnx_dir,
+            max_length=settings.reranker.max_length,
+            batch_size=settings.reranker.batch_size,
+            time_budget_ms=settings.reranker.time_budget_ms,
+            num_threads=settings.reranker.num_threads,
+            cache_size=settings.reranker.cache_size,
+            cache_ttl_seconds=settings.reranker.cache_ttl_seconds,
+        )
+
+    @staticmethod
+    def _build_retriever(
+        embedding_provider: EmbeddingProvider,
+        dense_retriever,
+        lexical_retriever,
+        reranker: Optional[CrossEncoderReranker] = None,
+    ) -> HybridRetriever:
+        return HybridRetriever(
             pinecone_api_key=os.getenv("PINECONE_API_KEY"),          
             pinecone_index_name=settings.pinecone.index_name,    
-            embed_model=self.embed_model,
+            embed_model=embedding_provider.embed_model,
             mongo_uri=settings.doc_store.uri,
             mongo_db_name=settings.doc_store.db_name,
             mongo_namespace=settings.doc_store.namespace,
             bm25_persist_dir=settings.paths.bm25_persist_dir,
-            small_model=settings.llm.small_model,
-            pinecone_namespace=settings.pinecone.namespace,      # Optional, có thể None
-            pinecone_text_key=settings.pinecone.text_key or "text",  # Optional, mặc định "text"
+            pinecone_namespace=settings.pinecone.namespace,
+            pinecone_text_key=settings.pinecone.text_key or "text",
             top_k_dense=settings.retriever.top_k_dense,
             top_k_bm25=settings.retriever.top_k_bm25,
             top_k_final=settings.retriever.top_k_final,
             use_rrf=settings.retriever.use_rrf,
+            fusion_mode=settings.retriever.fusion_mode,
+            rrf_k=settings.retriever.rrf_k,
+            dense_retriever=dense_retriever,
+            bm25_retriever=lexical_retriever,
+            hydrator=Rag._build_hydrator(lexical_retriever),
+            result_cache=RetrievalResultCache(
+                index_version=IndexVersion(settings.paths.index_version_file),
+                maxsize=settings.retriever.result_cache_size,
+                ttl_seconds=settings.retriever.result_cache_ttl_seconds,
+                bucket_bits=settings.retriever.result_cache_bucket_bits,
+                bucket_min_similarity=settings.retriever.result_cache_bucket_min_similarity,
+            ) if settings.retriever.result_cache_size > 0 else None,
+            reranker=reranker,
+            rerank_candidates=settings.reranker.candidates,
+            dense_timeout_seconds=settings.retriever.dense_timeout_seconds,
+            lexical_timeout_seconds=settings.retriever.lexical_timeout_seconds,
+            hydration_timeout_seconds=settings.retriever.hydration_timeout_seconds,
         )
 
-        self.generator = LLMGenerator(
-            model=settings.llm.model,
+    @staticmethod
+    def _node_store_ready() -> bool:
+        return (settings.paths.node_store_dir / NODE_IDS_FILE).exists()
+
+    @staticmethod
+    def _pinecone_include_metadata() -> bool:
+        """
+        Mặc định chỉ lấy id + score (không tải _node_content / metadata của từng match) khi node store
+        id Pinecone đã có để hydrate; chưa có thì phải lấy kèm metadata, nếu không node dense sẽ rỗng.
+        """
+        if settings.pinecone.include_metadata is not None:
+            return settings.pinecone.include_metadata
+        return not Rag._node_store_ready()
+
+    @staticmethod
+    def _build_hydrator(lexical_retriever) -> NodeHydrator:
+        """
+        Hydrate theo đúng namespace id của từng retriever: node store từ embedded_nodes.pkl cho id
+        Pinecone / FAISS, node store của BM25 native cho id BM25, Mongo (tuỳ chọn) cho phần còn lại.
+        """
+        stores = []
+        if Rag._node_store_ready():
+            stores.append(NodeFileStore(settings.paths.node_store_dir))
+        elif (
+            settings.retriever.dense_backend == "pinecone"
+            and settings.pinecone.query_client == "http"
+            and not Rag._pinecone_include_metadata()
+        ):
+            logger.warning(
+                f"[Rag] Pinecone chỉ trả id nhưng chưa có node store {settings.paths.node_store_dir} "
+                "→ node dense không hydrate được (chạy python -m src.storage.build_node_store)"
+            )
+        if isinstance(lexical_retriever, NativeBM25Retriever) and lexical_retriever.id_only:
+            stores.append(lexical_retriever.index.store)
+
+        mongo = settings.doc_store.hydrate_from_mongo
+        return NodeHydrator(
+            uri=settings.doc_store.uri if mongo else None,
+            db_name=settings.doc_store.db_name,
+            namespace=settings.doc_store.namespace,
+            stores=stores,
+            cache_size=settings.doc_store.hydration_cache_size,
+            cache_ttl_seconds=settings.doc_store.hydration_cache_ttl_seconds,
+            max_pool_size=settings.doc_store.max_pool_size,
         )
 
-        self.semantic_cache = RedisSemanticCache(
+    @staticmethod
+    def _build_semantic_cache(embedding_provider: EmbeddingProvider) -> RedisSemanticCache:
+        return RedisSemanticCache(
             redis_url=settings.chainlit.redis_url,
-            embed_model=self.embed_model,
+            embed_model=embedding_provider.embed_model,
             similarity_threshold=settings.semantic_cache.similarity_threshold,
             cache_ttl_days=settings.semantic_cache.cache_ttl_days,
+            index_mode=settings.semantic_cache.index_mode,
+            hnsw_threshold=settings.semantic_cache.hnsw_threshold,
+            exact_cache_size=settings.semantic_cache.exact_cache_size,
+            exact_cache_ttl_seconds=settings.semantic_cache.exact_cache_ttl_seconds,
+            entry_format=settings.semantic_cache.entry_format,
+            embed_fn=embedding_provider.embed_query,
+            aembed_fn=embedding_provider.aembed_query,
         )
 
-        logger.info("[Rag] Khởi tạo xong.")
+    @staticmethod
+    def _build_context_builder(embedding_provider: EmbeddingProvider) -> ContextBuilder:
+        return ContextBuilder(
+            count_tokens=load_token_counter(settings.context.tokenizer_name),
+            max_tokens=settings.context.max_tokens,
+            min_chunks=settings.context.min_chunks,
+            max_chunks=settings.context.max_chunks,
+            score_ratio=settings.context.score_ratio,
+            similarity_threshold=settings.context.similarity_threshold,
+            embed_fn=embedding_provider.embed_texts if settings.context.dedup_with_embeddings else None,
+        )
+
+    # Các component bắt buộc: sau khi ready thì get() trả về ngay
+    @property
+    def input_guard(self) -> InputGuard:
+        return self.startup.get("input_guard")
+
+    @property
+    def output_guard(self) -> OutputGuard:
+        return self.startup.get("output_guard")
+
+    @property
+    def query_rewriter(self) -> QueryRewriter:
+        return self.startup.get("query_rewriter")
+
+    @property
+    def generator(self) -> LLMGenerator:
+        return self.startup.get("generator")
+
+    @property
+    def embedding_provider(self) -> EmbeddingProvider:
+        return self.startup.get("embedding_provider")
+
+    @property
+    def embed_model(self):
+        return self.embedding_provider.embed_model
+
+    @property
+    def retriever(self) -> HybridRetriever:
+        return self.startup.get("retriever")
+
+    @property
+    def semantic_cache(self) -> Optional[RedisSemanticCache]:
+        """None khi cache còn đang load nền (hoặc load lỗi)."""
+        return self.startup.peek("semantic_cache")
+
+    @property
+    def context_builder(self) -> Optional[ContextBuilder]:
+        """None khi tắt trong settings, tokenizer còn đang load hoặc load lỗi."""
+        return self.startup.peek("context_builder")
+
+    async def _cache_lookup(self, question: str, embedding: Optional[np.ndarray] = None) -> Optional[Tuple[str, str]]:
+        cache = self.semantic_cache
+        if cache is None:
+            logger.debug("[Semantic Cache] Chưa sẵn sàng → bỏ qua lookup")
+            return None
+        return await cache.aget(question, embedding=embedding)
+
+    async def _cache_store(self, question: str, response: str, embedding: Optional[np.ndarray] = None):
+        cache = self.semantic_cache
+        if cache is None:
+            logger.debug("[Semantic Cache] Chưa sẵn sàng → không lưu response")
+            return
+        await cache.aset(question, response, embedding=embedding)
+        logger.info("[Semantic Cache] Đã lưu response mới")
 
     @observe(name="get_response")
     async def get_response(
@@ -86,67 +406,26 @@ class Rag:
 
         start_time = datetime.now()
 
-        # Bước 1: Input Guardrail
-        is_safe, processed_input_or_error = await self.input_guard.guard(question)
-        if not is_safe:
-            error_msg = (
-                "Xin lỗi, câu hỏi của bạn không đáp ứng được các tiêu chuẩn an toàn hoặc phù hợp.\n"
-                f"Lý do: {processed_input_or_error}\n\n"
-                "Vui lòng thử lại với câu hỏi khác về sức khỏe hoặc y tế nhé!"
-            )
-            logger.debug(f"[Rag] Input bị từ chối: {processed_input_or_error}")
-            return error_msg
-
-        safe_question = processed_input_or_error
-        logger.debug(f"[Rag] Input đã được anonymized và pass guardrail: {safe_question[:100]}...")
+        prepared = await self._prepare(question, chat_history or [])
+        if prepared.rejection is not None:
+            return prepared.rejection
 
-        # Bước 2: Rewrite query nếu có lịch sử
-        rewritten_question = safe_question
-      
-        if len(chat_history) > 0:
-            logger.info(f"[Rag] Có lịch sử chat: {len(chat_history)} tin nhắn")
-            try:
-                formatted_history = []
-                for msg in chat_history:
-                    if isinstance(msg, dict):
-                        role = msg.get("role", "user")
-                        content = msg.get("content", "")
-                        if role == "user":
-                            formatted_history.append(HumanMessage(content=content))
-                        elif role == "assistant":
-                            formatted_history.append(AIMessage(content=content))
-                    else:
-                        formatted_history.append(msg)
-
-                rewritten_question = await self.query_rewriter.rewrite(
-                    question=safe_question,
-                    chat_history=formatted_history
-                )
-                logger.debug(f"[Rag] Query sau rewrite: {rewritten_question}")
-            except Exception as e:
-                logger.warning(f"[Rag] Lỗi khi rewrite query: {e}")
-                rewritten_question = safe_question
-        else:
-            logger.debug("[Rag] Đây là tin nhắn đầu tiên → không rewrite, dùng query gốc")
-        
-        # Bước 2.1 Kiểm tra cache
-        cached_result = self.semantic_cache.get(rewritten_question)
-        if cached_result:
-            response, original_q = cached_result
+        if prepared.cached_result:
+            response, original_q = prepared.cached_result
             logger.debug(f"[Semantic Cache HIT] Từ query gốc: {original_q}")
             time_taken = datetime.now() - start_time
             debug_info = f"\n\n(Thời gian xử lý: {time_taken.total_seconds():.2f}s | Cache HIT - không cần retrieve)"
             return response + debug_info
 
+        rewritten_question = prepared.rewritten_question
+        query_embedding = prepared.query_embedding
+        retrieved = prepared.retrieved
+
         # Bước 3: Retrieve
-        try:
-            nodes = await self.retriever.retrieve(rewritten_question)
-            context = self.retriever.get_context_string(nodes)
-            logger.info(f"[Rag] Retrieve thành công: {len(nodes)} nodes")
-            logger.debug(context)
-        except Exception as e:
-            logger.warning(f"[Rag] Lỗi retrieve: {e}")
-            context = "Không tìm thấy tài liệu liên quan."
+        if retrieved is None:
+            query_embedding = await self._embed_query(rewritten_question)
+            retrieved = await self._retrieve_context(rewritten_question, query_embedding)
+        nodes, context, degraded = retrieved
 
         # Bước 4: Generate response bằng LLMGenerator
         try:
@@ -155,9 +434,9 @@ class Rag:
                 retrieved_context=context
             )
             logger.info(f"[Rag] Generate thành công, độ dài: {len(final_response)} ký tự")
-            # Lưu vào cache
-            self.semantic_cache.set(rewritten_question, final_response)
-            logger.info("[Semantic Cache] Đã lưu response mới")
+            # Lưu vào cache (câu trả lời dựa trên retrieve degraded thì không lưu)
+            if not degraded:
+                await self._cache_store(rewritten_question, final_response, query_embedding)
         except Exception as e:
             logger.error(f"[Rag] Lỗi generate: {e}")
             final_response = (
@@ -169,19 +448,260 @@ class Rag:
         is_safe, response_or_error = await self.output_guard.guard(final_response, context)
         if not is_safe:
             logger.warning(f"[Output Guard] Blocked: {response_or_error}")
-            
-            return (
-                "Xin lỗi, câu trả lời này không đáp ứng được tiêu chuẩn an toàn.\n\n"
-                f"Lý do: {response_or_error}\n\n"
-                "Vui lòng hỏi lại với nội dung chỉ liên quan đến y tế và sức khỏe."
-            )
+            return self._output_blocked_message(response_or_error)
         
         # Bước 6: Thời gian xử lý + debug info
         time_taken = datetime.now() - start_time
-        debug_info = f"\n\n(Thời gian xử lý: {time_taken.total_seconds():.2f}s | Docs retrieved: {len(nodes) if 'nodes' in locals() else 0})"
+        debug_info = f"\n\n(Thời gian xử lý: {time_taken.total_seconds():.2f}s | {self._retrieval_info(nodes, degraded)})"
 
         return final_response + debug_info
 
+    @observe(name="stream_response")
+    async def stream_response(
+        self,
+        question: str,
+        session_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        chat_history: Optional[List[Dict[str, str]]] = None,
+    ) -> AsyncIterator[StreamChunk]:
+        """
+        Bản streaming của get_response:
+        - Token được đẩy ra ngay khi Groq trả về (sau khi qua kiểm tra từ cấm).
+        - Output guard (LLM) chạy nền trên từng đoạn đã buffer; nếu một đoạn bị block
+          → yield StreamChunk(replace=True) để thay toàn bộ nội dung đã hiển thị.
+          Người dùng có thể đã thấy phần bị block trước khi bị thay → tắt mặc định (settings.pipeline.streaming).
+        - Chỉ lưu cache khi toàn bộ câu trả lời đã pass guard.
+        """
+        logger.debug(f"[Rag] Nhận câu hỏi (stream): {question}")
+        logger.debug(f"        session_id: {session_id}")
+        logger.debug(f"        user_id: {user_id}")
+
+        start_time = datetime.now()
+
+        prepared = await self._prepare(question, chat_history or [])
+        if prepared.rejection is not None:
+            yield StreamChunk(prepared.rejection)
+            return
+
+        if prepared.cached_result:
+            response, original_q = prepared.cached_result
+            logger.debug(f"[Semantic Cache HIT] Từ query gốc: {original_q}")
+            time_taken = datetime.now() - start_time
+            yield StreamChunk(response + f"\n\n(Thời gian xử lý: {time_taken.total_seconds():.2f}s | Cache HIT - không cần retrieve)")
+            return
+
+        rewritten_question = prepared.rewritten_question
+        query_embedding = prepared.query_embedding
+        retrieved = prepared.retrieved
+        if retrieved is None:
+            query_embedding = await self._embed_query(rewritten_question)
+            retrieved = await self._retrieve_context(rewritten_question, query_embedding)
+        nodes, context, degraded = retrieved
+
+        chunk_chars = settings.pipeline.stream_guard_chunk_chars
+        guard_tasks: List[asyncio.Task] = []
+        parts: List[str] = []
+        segment = ""
+        previous_tail = ""
+        try:
+            async for token in self.generator.stream_response(
+                question=rewritten_question,
+                retrieved_context=context,
+            ):
+                segment += token
+                # Từ cấm có thể nằm vắt qua ranh giới 2 đoạn → ghép thêm đuôi đoạn trước
+                if self.output_guard.contains_blocked_keywords(previous_tail + segment):
+                    logger.warning("[Output Guard] Blocked khi stream: từ cấm")
+                    yield StreamChunk(self._output_blocked_message("Nội dung chứa các từ nhạy cảm hoặc bị cấm"), replace=True)
+                    return
+
+                parts.append(token)
+                yield StreamChunk(token)
+
+                if len(segment) >= chunk_chars and segment.rstrip().endswith((".", "!", "?", "\n")):
+                    guard_tasks.append(asyncio.create_task(self.output_guard.guard(segment, context)))
+                    previous_tail, segment = segment[-64:], ""
+
+                blocked = self._first_blocked(guard_tasks)
+                if blocked is not None:
+                    logger.warning(f"[Output Guard] Blocked khi stream: {blocked}")
+                    yield StreamChunk(self._output_blocked_message(blocked), replace=True)
+                    return
+
+            if segment:
+                guard_tasks.append(asyncio.create_task(self.output_guard.guard(segment, context)))
+
+            results = await asyncio.gather(*guard_tasks)
+            for is_safe, response_or_error in results:
+                if not is_safe:
+                    logger.warning(f"[Output Guard] Blocked: {response_or_error}")
+                    yield StreamChunk(self._output_blocked_message(response_or_error), replace=True)
+                    return
+        finally:
+            for task in guard_tasks:
+                task.cancel()
+
+        final_response = "".join(parts)
+        logger.info(f"[Rag] Stream thành công, độ dài: {len(final_response)} ký tự, {len(guard_tasks)} đoạn guard")
+        if not degraded:
+            await self._cache_store(rewritten_question, final_response, query_embedding)
+
+        time_taken = datetime.now() - start_time
+        yield StreamChunk(f"\n\n(Thời gian xử lý: {time_taken.total_seconds():.2f}s | {self._retrieval_info(nodes, degraded)})")
+
+    @staticmethod
+    def _retrieval_info(nodes: List[NodeWithScore], degraded: str) -> str:
+        info = f"Docs retrieved: {len(nodes)}"
+        return f"{info} | Degraded: {degraded}" if degraded else info
+
+    @staticmethod
+    def _first_blocked(guard_tasks: List[asyncio.Task]) -> Optional[str]:
+        for task in guard_tasks:
+            if task.done() and not task.cancelled():
+                is_safe, response_or_error = task.result()
+                if not is_safe:
+                    return response_or_error
+        return None
+
+    @staticmethod
+    def _output_blocked_message(reason: str) -> str:
+        return (
+            "Xin lỗi, câu trả lời này không đáp ứng được tiêu chuẩn an toàn.\n\n"
+            f"Lý do: {reason}\n\n"
+            "Vui lòng hỏi lại với nội dung chỉ liên quan đến y tế và sức khỏe."
+        )
+
+    async def _prepare(self, question: str, chat_history: List) -> "_PreparedQuery":
+        """Bước 1-3 dùng chung cho get_response và stream_response: guard → rewrite → cache (→ retrieve)."""
+        if not self.startup.is_ready():
+            logger.info("[Rag] Pipeline chưa khởi tạo xong → chờ")
+            await self.startup.wait_ready()
+        if settings.pipeline.speculative:
+            # Bước 1-3 chạy song song: guard || (rewrite → cache || retrieve).
+            # Kết quả speculative chỉ được dùng khi guard pass.
+            guard_task = asyncio.create_task(self.input_guard.guard(question))
+            speculative_task = asyncio.create_task(self._speculate(question, chat_history))
+            try:
+                is_safe, processed_input_or_error = await guard_task
+                if not is_safe:
+                    speculative_task.cancel()
+                    logger.debug(f"[Rag] Input bị từ chối: {processed_input_or_error} → huỷ nhánh speculative")
+                    return _PreparedQuery(rejection=self._input_rejected_message(processed_input_or_error))
+                return await speculative_task
+            finally:
+                guard_task.cancel()
+                speculative_task.cancel()
+
+        # Bước 1: Input Guardrail
+        is_safe, processed_input_or_error = await self.input_guard.guard(question)
+        if not is_safe:
+            logger.debug(f"[Rag] Input bị từ chối: {processed_input_or_error}")
+            return _PreparedQuery(rejection=self._input_rejected_message(processed_input_or_error))
+
+        safe_question = processed_input_or_error
+        logger.debug(f"[Rag] Input đã được anonymized và pass guardrail: {safe_question[:100]}...")
+
+        # Bước 2: Rewrite query nếu có lịch sử
+        rewritten_question = await self._rewrite_question(safe_question, chat_history)
+
+        # Bước 2.1 Kiểm tra cache (embedding chỉ tính khi trượt exact-match, được memo
+        # trong EmbeddingProvider nên bước retrieve dùng lại mà không embed lần nữa)
+        cached_result = await self._cache_lookup(rewritten_question)
+        return _PreparedQuery(rewritten_question=rewritten_question, cached_result=cached_result)
+
+    @staticmethod
+    def _input_rejected_message(reason: str) -> str:
+        return (
+            "Xin lỗi, câu hỏi của bạn không đáp ứng được các tiêu chuẩn an toàn hoặc phù hợp.\n"
+            f"Lý do: {reason}\n\n"
+            "Vui lòng thử lại với câu hỏi khác về sức khỏe hoặc y tế nhé!"
+        )
+
+    async def _rewrite_question(self, question: str, chat_history: List) -> str:
+        if len(chat_history) == 0:
+            logger.debug("[Rag] Đây là tin nhắn đầu tiên → không rewrite, dùng query gốc")
+            return question
+
+        logger.info(f"[Rag] Có lịch sử chat: {len(chat_history)} tin nhắn")
+        try:
+            formatted_history = []
+            for msg in chat_history:
+                if isinstance(msg, dict):
+                    role = msg.get("role", "user")
+                    content = msg.get("content", "")
+                    if role == "user":
+                        formatted_history.append(HumanMessage(content=content))
+                    elif role == "assistant":
+                        formatted_history.append(AIMessage(content=content))
+                else:
+                    formatted_history.append(msg)
+
+            rewritten_question = await self.query_rewriter.rewrite(
+                question=question,
+                chat_history=formatted_history
+            )
+            logger.debug(f"[Rag] Query sau rewrite: {rewritten_question}")
+            return rewritten_question
+        except Exception as e:
+            logger.warning(f"[Rag] Lỗi khi rewrite query: {e}")
+            return question
+
+    async def _embed_query(self, question: str) -> Optional[np.ndarray]:
+        """Embedding query một lần cho cả request (memo trong EmbeddingProvider)."""
+        try:
+            return await self.embedding_provider.aembed_query(question)
+        except Exception as e:
+            logger.warning(f"[Rag] Lỗi embedding query: {e}")
+            return None
+
+    async def _retrieve_context(
+        self,
+        question: str,
+        query_embedding: Optional[np.ndarray] = None,
+    ) -> Tuple[List[NodeWithScore], str, str]:
+        """(nodes, context, degraded): degraded = mô tả các bước retrieve trễ deadline / lỗi, rỗng nếu đầy đủ."""
+        try:
+            nodes, status = await self.retriever.retrieve_with_status(question, query_embedding=query_embedding)
+            baseline = self.retriever.get_context_string(nodes)
+            builder = self.context_builder
+            if builder is None:
+                context = baseline
+            else:
+                # Embed chunk để so trùng là tác vụ CPU/GPU → chạy trong executor
+                loop = asyncio.get_running_loop()
+                context, report = await loop.run_in_executor(None, builder.build, nodes, baseline, status.reranked)
+                logger.info(f"[ContextBuilder] {report.summary()}")
+            logger.info(f"[Rag] Retrieve thành công: {len(nodes)} nodes" + (f" (degraded: {status.summary()})" if status.is_degraded else ""))
+            logger.debug(context)
+            return nodes, context, status.summary()
+        except Exception as e:
+            logger.warning(f"[Rag] Lỗi retrieve: {e}")
+            return [], "Không tìm thấy tài liệu liên quan.", f"retrieve lỗi: {type(e).__name__}"
+
+    async def _speculate(self, question: str, chat_history: List) -> "_PreparedQuery":
+        """
+        Nhánh speculative chạy song song với input guard:
+        rewrite → embed → (cache lookup || retrieve). Không sinh câu trả lời ở đây.
+        Guard chỉ trả về đúng input khi pass nên có thể dùng luôn `question`.
+        """
+        rewritten_question = await self._rewrite_question(question, chat_history)
+        query_embedding = await self._embed_query(rewritten_question)
+
+        cache_task = asyncio.create_task(self._cache_lookup(rewritten_question, query_embedding))
+        retrieve_task = asyncio.create_task(self._retrieve_context(rewritten_question, query_embedding))
+        try:
+            cached_result = await cache_task
+            if cached_result:
+                return _PreparedQuery(rewritten_question=rewritten_question, cached_result=cached_result)
+            return _PreparedQuery(
+                rewritten_question=rewritten_question,
+                retrieved=await retrieve_task,
+                query_embedding=query_embedding,
+            )
+        finally:
+            cache_task.cancel()
+            retrieve_task.cancel()
+
 
 # Instance global
 rag_service = Rag()
\ No newline at end of file
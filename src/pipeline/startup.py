@@ -0,0 +1,170 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Component:
+    name: str
+    factory: Callable[..., Any]
+    deps: Tuple[str, ...] = ()
+    critical: bool = True
+    future: Future = field(default_factory=Future)
+    started_at: Optional[float] = None
+    seconds: Optional[float] = None
+
+
+class StartupOrchestrator:
+    """
+    Khởi tạo các component của pipeline theo đồ thị phụ thuộc:
+    - Component độc lập được khởi tạo song song trong thread pool (load model, kết nối
+      mạng đều là I/O hoặc code native nhả GIL).
+    - factory nhận các dependency đã sẵn sàng dưới dạng keyword argument.
+    - critical=True: cần xong trước khi báo ready. critical=False: chạy nền, ai cần
+      thì get() (chờ) hoặc peek() (không chờ, None nếu chưa xong).
+    - Ghi lại thời gian khởi tạo từng component + sự kiện / file báo ready.
+    """
+
+    def __init__(self, max_workers: int = 4, ready_file: Optional[Path] = None):
+        self.max_workers = max_workers
+        self.ready_file = Path(ready_file) if ready_file else None
+        self.ready = threading.Event()
+        self.error: Optional[BaseException] = None
+        self._settled = threading.Event()    # ready hoặc có component bắt buộc lỗi
+        self._components: Dict[str, _Component] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._started_at: Optional[float] = None
+        self.ready_seconds: Optional[float] = None
+
+    def register(
+        self,
+        name: str,
+        factory: Callable[..., Any],
+        deps: Tuple[str, ...] = (),
+        critical: bool = True,
+    ):
+        if name in self._components:
+            raise ValueError(f"Component '{name}' đã được đăng ký")
+        self._components[name] = _Component(name=name, factory=factory, deps=tuple(deps), critical=critical)
+
+    def start(self):
+        """Bắt đầu khởi tạo nền, trả về ngay."""
+        for component in self._components.values():
+            missing = [dep for dep in component.deps if dep not in self._components]
+            if missing:
+                raise ValueError(f"Component '{component.name}' phụ thuộc vào component chưa đăng ký: {missing}")
+
+        if self.ready_file is not None:
+            self.ready_file.unlink(missing_ok=True)
+        self._started_at = time.perf_counter()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="startup")
+        for component in self._components.values():
+            self._schedule_when_deps_done(component)
+
+        critical = [c.future for c in self._components.values() if c.critical]
+        threading.Thread(target=self._watch_ready, args=(critical,), name="startup-ready", daemon=True).start()
+
+    def _schedule_when_deps_done(self, component: _Component):
+        pending = [self._components[dep].future for dep in component.deps]
+        if not pending:
+            self._executor.submit(self._build, component)
+            return
+
+        remaining = [len(pending)]
+
+        def on_dep_done(_):
+            with self._lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            self._executor.submit(self._build, component)
+
+        for dep_future in pending:
+            dep_future.add_done_callback(on_dep_done)
+
+    def _build(self, component: _Component):
+        try:
+            kwargs = {dep: self._components[dep].future.result() for dep in component.deps}
+        except Exception as e:
+            component.future.set_exception(RuntimeError(f"Dependency của '{component.name}' lỗi: {e}"))
+            return
+
+        component.started_at = time.perf_counter()
+        try:
+            value = component.factory(**kwargs)
+        except Exception as e:
+            component.seconds = time.perf_counter() - component.started_at
+            logger.error(f"[Startup] Khởi tạo '{component.name}' lỗi sau {component.seconds:.2f}s: {e}", exc_info=True)
+            component.future.set_exception(e)
+            return
+        component.seconds = time.perf_counter() - component.started_at
+        logger.info(f"[Startup] '{component.name}' sẵn sàng sau {component.seconds:.2f}s")
+        component.future.set_result(value)
+
+    def _watch_ready(self, critical: List[Future]):
+        for future in critical:
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"[Startup] Component bắt buộc khởi tạo lỗi → pipeline không ready\n{self.report()}")
+                self.error = e
+                self._settled.set()
+                return
+        self.ready_seconds = time.perf_counter() - self._started_at
+        if self.ready_file is not None:
+            self.ready_file.parent.mkdir(parents=True, exist_ok=True)
+            self.ready_file.write_text(f"{time.time():.0f}\n")
+        self.ready.set()
+        self._settled.set()
+        logger.info(f"[Startup] Pipeline ready sau {self.ready_seconds:.2f}s\n{self.report()}")
+
+    def get(self, name: str, timeout: Optional[float] = None) -> Any:
+        """Lấy component, chờ nếu đang khởi tạo (raise nếu khởi tạo lỗi)."""
+        return self._components[name].future.result(timeout=timeout)
+
+    def peek(self, name: str) -> Any:
+        """Lấy component nếu đã sẵn sàng, ngược lại None (không chờ, kể cả khi không được đăng ký)."""
+        component = self._components.get(name)
+        if component is None:
+            return None
+        future = component.future
+        if future.done() and future.exception() is None:
+            return future.result()
+        return None
+
+    async def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Chờ tới khi ready (True) / hết timeout (False); raise nếu component bắt buộc lỗi."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._settled.wait, timeout)
+        if self.error is not None:
+            raise RuntimeError(f"Khởi tạo pipeline thất bại: {self.error}") from self.error
+        return self.ready.is_set()
+
+    def is_ready(self) -> bool:
+        return self.ready.is_set()
+
+    def timings(self) -> Dict[str, Optional[float]]:
+        return {name: component.seconds for name, component in self._components.items()}
+
+    def report(self) -> str:
+        lines = ["[Startup] Thời gian khởi tạo:"]
+        for component in sorted(self._components.values(), key=lambda c: c.seconds or 0.0, reverse=True):
+            if component.future.done() and component.future.exception() is not None:
+                status = "lỗi"
+            elif component.seconds is None:
+                status = "đang chạy" if component.started_at else "chờ"
+            else:
+                status = f"{component.seconds:.2f}s"
+            kind = "" if component.critical else " (nền)"
+            lines.append(f"  - {component.name:<20} {status}{kind}")
+        if self.ready_seconds is not None:
+            lines.append(f"  = ready sau {self.ready_seconds:.2f}s")
+        return "\n".join(lines)
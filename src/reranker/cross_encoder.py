@@ -0,0 +1,211 @@
+import asyncio
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Literal, Optional, Tuple, Union
+import numpy as np
+from llama_index.core.schema import NodeWithScore
+from src.cache.lru import TTLLRUCache
+from src.cache.normalize import normalize_text
+import logging
+logger = logging.getLogger(__name__)
+
+RerankerBackend = Literal["torch", "onnx", "onnx_int8"]
+
+ONNX_FP32_FILE = "model.onnx"
+ONNX_INT8_FILE = "model_int8.onnx"
+
+
+@dataclass
+class RerankResult:
+    nodes: List[NodeWithScore]
+    reranked: bool              # False = hết time budget trước khi chấm được node nào → giữ thứ tự fusion (RRF)
+    partial: bool = False       # True = chỉ chấm được một phần, phần chưa chấm nối sau theo thứ tự fusion
+    elapsed_ms: float = 0.0
+    cache_hits: int = 0
+    scored: int = 0
+
+
+class CrossEncoderReranker:
+    """
+    Rerank kết quả fusion bằng cross-encoder nhỏ đa ngôn ngữ chạy trên CPU:
+    - Backend ONNX Runtime (fp32 / int8, export bằng `python -m src.reranker.export_onnx`) hoặc torch.
+    - Chấm điểm theo batch; cặp (query đã chuẩn hoá, node id) đã chấm được cache (LRU + TTL).
+    - Time budget theo request: kích thước batch co lại theo thời gian chấm một cặp đo được (EMA) để
+      batch cuối vẫn kịp deadline. Quá hạn thì phần đã chấm được xếp theo điểm, phần chưa chấm nối sau
+      theo thứ tự fusion; batch đang chấm dở vẫn chạy nốt trong thread riêng và ghi vào cache cho lần sau.
+    - Score trả về = sigmoid(logit) ∈ (0, 1).
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        backend: RerankerBackend = "onnx_int8",
+        onnx_dir: Optional[Union[str, Path]] = None,
+        max_length: int = 256,
+        batch_size: int = 16,
+        time_budget_ms: float = 250.0,
+        num_threads: Optional[int] = None,
+        cache_size: int = 50_000,
+        cache_ttl_seconds: Optional[int] = 86400,
+    ):
+        self.model_name = model_name
+        self.backend = backend
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self.time_budget_ms = time_budget_ms
+        self.cache = TTLLRUCache(maxsize=cache_size, ttl_seconds=cache_ttl_seconds) if cache_size > 0 else None
+        self._pair_seconds: Optional[float] = None    # EMA thời gian chấm một cặp, chỉ cập nhật trong thread reranker
+        # Một thread: các request xếp hàng thay vì tranh nhau CPU
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reranker")
+
+        if backend in ("onnx", "onnx_int8"):
+            self._score_batch = self._load_onnx(onnx_dir, ONNX_INT8_FILE if backend == "onnx_int8" else ONNX_FP32_FILE, num_threads)
+        else:
+            self._score_batch = self._load_torch(num_threads)
+        logger.info(f"[Reranker] Đã load {model_name} (backend={backend}, budget={time_budget_ms:.0f}ms)")
+
+    def _load_onnx(self, onnx_dir, file_name: str, num_threads: Optional[int]):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_path = Path(onnx_dir) / file_name
+        if not model_path.exists():
+            raise FileNotFoundError(
+                f"Không tìm thấy {model_path}. Chạy `python -m src.reranker.export_onnx` để export model."
+            )
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+            options.inter_op_num_threads = 1
+        session = ort.InferenceSession(str(model_path), sess_options=options, providers=["CPUExecutionProvider"])
+        tokenizer = AutoTokenizer.from_pretrained(str(onnx_dir))
+        input_names = [i.name for i in session.get_inputs()]
+
+        def score_batch(query: str, texts: List[str]) -> np.ndarray:
+            encoded = tokenizer([query] * len(texts), texts, padding=True, truncation="only_second",
+                                max_length=self.max_length, return_tensors="np")
+            feeds = {name: encoded[name].astype(np.int64) for name in input_names if name in encoded}
+            return self._logits_to_scores(session.run(None, feeds)[0])
+
+        return score_batch
+
+    def _load_torch(self, num_threads: Optional[int]):
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        model = AutoModelForSequenceClassification.from_pretrained(self.model_name).eval()
+
+        def score_batch(query: str, texts: List[str]) -> np.ndarray:
+            encoded = tokenizer([query] * len(texts), texts, padding=True, truncation="only_second",
+                                max_length=self.max_length, return_tensors="pt")
+            with torch.inference_mode():
+                logits = model(**encoded).logits
+            return self._logits_to_scores(logits.float().numpy())
+
+        return score_batch
+
+    @staticmethod
+    def _logits_to_scores(logits: np.ndarray) -> np.ndarray:
+        logits = np.asarray(logits, dtype=np.float32)
+        if logits.ndim == 2 and logits.shape[1] > 1:
+            # Model 2 lớp (không liên quan / liên quan) → lấy logit lớp liên quan so với lớp kia
+            logits = logits[:, 1] - logits[:, 0]
+        return 1.0 / (1.0 + np.exp(-logits.reshape(-1)))
+
+    def _key(self, query: str, node_id: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\x1f{normalize_text(query)}\x1f{node_id}".encode()).hexdigest()
+
+    def _next_batch_size(self, remaining: float) -> int:
+        if self._pair_seconds is None:
+            return self.batch_size
+        return max(1, min(self.batch_size, int(remaining / self._pair_seconds)))
+
+    def _score(self, query: str, pending: List[Tuple[str, str]], deadline: float, scores: Dict[str, float]):
+        """
+        Chấm các cặp chưa có trong cache theo batch, ghi dần vào scores (người gọi đọc được phần đã chấm
+        khi hết hạn), dừng khi quá deadline (monotonic). Batch co lại để vừa thời gian còn lại.
+        """
+        start = 0
+        while start < len(pending):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            batch = pending[start: start + self._next_batch_size(remaining)]
+            batch_start = time.monotonic()
+            batch_scores = self._score_batch(query, [text for _, text in batch])
+            pair_seconds = (time.monotonic() - batch_start) / len(batch)
+            self._pair_seconds = pair_seconds if self._pair_seconds is None else 0.8 * self._pair_seconds + 0.2 * pair_seconds
+            for (node_id, _), score in zip(batch, batch_scores):
+                scores[node_id] = float(score)
+                if self.cache is not None:
+                    self.cache.set(self._key(query, node_id), float(score))
+            start += len(batch)
+
+    async def arerank(self, query: str, nodes: List[NodeWithScore], top_n: int) -> RerankResult:
+        start = time.monotonic()
+        deadline = start + self.time_budget_ms / 1000
+
+        scores: Dict[str, float] = {}
+        pending: List[Tuple[str, str]] = []
+        seen = set()
+        for n in nodes:
+            node_id = n.node.node_id
+            if node_id in seen:
+                continue
+            seen.add(node_id)
+            cached = self.cache.get(self._key(query, node_id)) if self.cache is not None else None
+            if cached is None:
+                pending.append((node_id, n.node.get_content(metadata_mode="none")))
+            else:
+                scores[node_id] = cached
+        cache_hits = len(scores)
+
+        scored = 0
+        if pending:
+            loop = asyncio.get_running_loop()
+            fresh: Dict[str, float] = {}
+            future = loop.run_in_executor(self._executor, self._score, query, pending, deadline, fresh)
+            try:
+                await asyncio.wait_for(asyncio.shield(future), timeout=max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
+            # Thread có thể vẫn đang ghi batch dở → chụp lại phần đã chấm
+            fresh = dict(fresh)
+            scored = len(fresh)
+            scores.update(fresh)
+
+        elapsed_ms = (time.monotonic() - start) * 1000
+        if not scores:
+            logger.warning(
+                f"[Reranker] Hết time budget ({elapsed_ms:.0f}ms > {self.time_budget_ms:.0f}ms) → giữ thứ tự fusion"
+            )
+            return RerankResult(nodes=nodes[:top_n], reranked=False, elapsed_ms=elapsed_ms, cache_hits=cache_hits)
+
+        ranked = sorted((n for n in nodes if n.node.node_id in scores), key=lambda n: scores[n.node.node_id], reverse=True)
+        result = [NodeWithScore(node=n.node, score=scores[n.node.node_id]) for n in ranked]
+        unscored = [n for n in nodes if n.node.node_id not in scores]
+        if unscored:
+            logger.warning(
+                f"[Reranker] Hết time budget ({elapsed_ms:.0f}ms > {self.time_budget_ms:.0f}ms) → "
+                f"chấm {len(ranked)}/{len(nodes)} node, phần còn lại giữ thứ tự fusion"
+            )
+            # Node chưa chấm xếp sau, score 0 (không so được với xác suất của cross-encoder)
+            result.extend(NodeWithScore(node=n.node, score=0.0) for n in unscored)
+        return RerankResult(
+            nodes=result[:top_n],
+            reranked=True,
+            partial=bool(unscored),
+            elapsed_ms=elapsed_ms,
+            cache_hits=cache_hits,
+            scored=scored,
+        )
+
+    def stats(self) -> dict:
+        return self.cache.stats() if self.cache is not None else {}
@@ -1,13 +1,149 @@
-from typing import Optional
-from llama_index.retrievers.bm25 import BM25Retriever
-from llama_index.core.schema import BaseNode
+import asyncio
+import json
+import re
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+import numpy as np
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import BaseNode, NodeWithScore, QueryBundle, TextNode
 from src.storage.document_store_mongo import MongoDocumentStoreManager
+from src.storage.node_file_store import NODE_IDS_FILE, NodeFileStore
+from src.storage.node_hydrator import IdOnlyNode
 import logging
 logger = logging.getLogger(__name__)
 
+# File do bm25s.BM25.save ghi (BM25Retriever.persist của llama-index)
+DATA_FILE = "data.csc.index.npy"
+INDICES_FILE = "indices.csc.index.npy"
+INDPTR_FILE = "indptr.csc.index.npy"
+VOCAB_FILE = "vocab.index.json"
+NONOCCURRENCE_FILE = "nonoccurrence_array.index.npy"
+PARAMS_FILE = "params.index.json"
+RETRIEVER_FILE = "retriever.json"
+DEFAULT_TOKEN_PATTERN = r"(?u)\b\w\w+\b"
+
+
+class NativeBM25Index:
+    """
+    BM25 đọc thẳng ma trận điểm đã tính sẵn của bm25s (CSC theo token), không qua llama-index:
+    - data / indices / indptr được memory-map → load tức thì, chỉ các cột token của query vào RAM.
+    - score(q, d) = Σ_{t ∈ q} score(t, d), gom bằng một lần np.bincount + argpartition top-k.
+    - Text + metadata của node nằm trong NodeFileStore cùng thư mục (src.storage.build_bm25_native),
+      chỉ đọc top-k → không cần kéo toàn bộ docstore Mongo lên lúc start.
+    - Query được tokenize như lúc build index (lowercase + token_pattern, không stem, không stopwords).
+    """
+
+    def __init__(self, persist_dir: Union[str, Path], mmap: bool = True):
+        self.persist_dir = Path(persist_dir)
+        mode = "r" if mmap else None
+        self.data = np.load(self.persist_dir / DATA_FILE, mmap_mode=mode)
+        self.indices = np.load(self.persist_dir / INDICES_FILE, mmap_mode=mode)
+        self.indptr = np.load(self.persist_dir / INDPTR_FILE, mmap_mode=mode)
+        nonoccurrence_path = self.persist_dir / NONOCCURRENCE_FILE
+        # Chỉ có với BM25L / BM25+ (điểm cộng thêm cho doc không chứa token)
+        self.nonoccurrence = np.load(nonoccurrence_path) if nonoccurrence_path.exists() else None
+        with open(self.persist_dir / VOCAB_FILE, encoding="utf-8") as f:
+            self.vocab = json.load(f)
+
+        token_pattern = DEFAULT_TOKEN_PATTERN
+        retriever_file = self.persist_dir / RETRIEVER_FILE
+        if retriever_file.exists():
+            token_pattern = json.loads(retriever_file.read_text(encoding="utf-8")).get("token_pattern", token_pattern)
+        self.token_pattern = re.compile(token_pattern)
+
+        self.store = NodeFileStore(self.persist_dir, mmap=mmap)
+        self.num_docs = len(self.store)
+        # Node store build từ corpus khác (hoặc index được persist lại sau đó) → doc index lệch id / text
+        params_file = self.persist_dir / PARAMS_FILE
+        if params_file.exists():
+            index_num_docs = int(json.loads(params_file.read_text(encoding="utf-8"))["num_docs"])
+            if index_num_docs != self.num_docs:
+                raise ValueError(
+                    f"Node store ({self.num_docs:,} node) không khớp index BM25 ({index_num_docs:,} doc) "
+                    f"trong {self.persist_dir}. Chạy lại python -m src.storage.build_bm25_native."
+                )
+        logger.info(
+            f"[NativeBM25Index] {self.persist_dir} | {self.num_docs:,} node | "
+            f"{len(self.vocab):,} token | {len(self.data):,} posting"
+        )
+
+    def tokenize(self, query: str) -> np.ndarray:
+        """Token id của query (giữ token lặp như bm25s, bỏ token ngoài vocab)."""
+        ids = [self.vocab[t] for t in self.token_pattern.findall(query.lower()) if t in self.vocab]
+        return np.asarray(ids, dtype=np.int64)
+
+    def search(self, query: str, top_k: int = 15) -> List[Tuple[int, float]]:
+        """Trả về [(doc_index, score)] giảm dần, chỉ các doc có score > 0."""
+        token_ids = self.tokenize(query)
+        if token_ids.size == 0:
+            return []
+        starts, ends = self.indptr[token_ids], self.indptr[token_ids + 1]
+        docs = np.concatenate([self.indices[s:e] for s, e in zip(starts, ends)])
+        weights = np.concatenate([self.data[s:e] for s, e in zip(starts, ends)])
+        if docs.size == 0:
+            return []
+        scores = np.bincount(docs, weights=weights, minlength=self.num_docs)
+        if self.nonoccurrence is not None:
+            scores += self.nonoccurrence[token_ids].sum()
+
+        top_k = min(top_k, self.num_docs)
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(i), float(scores[i])) for i in candidates if scores[i] > 0]
+
+
+class NativeBM25Retriever(BaseRetriever):
+    """
+    Retriever BM25 trên NativeBM25Index, trả node đã có text (chỉ top-k).
+    id_only=True: chỉ trả id + score (IdOnlyNode), text đọc sau fusion bằng NodeHydrator
+    (đăng ký index.store vào hydrator) → chỉ top-k cuối cùng được đọc từ đĩa.
+    """
+
+    def __init__(self, index: NativeBM25Index, similarity_top_k: int = 15, id_only: bool = False):
+        super().__init__()
+        self.index = index
+        self.similarity_top_k = similarity_top_k
+        self.id_only = id_only
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        hits = self.index.search(query_bundle.query_str, top_k=self.similarity_top_k)
+        if self.id_only:
+            return [NodeWithScore(node=IdOnlyNode(id_=self.index.store.node_id(i), text=""), score=score) for i, score in hits]
+        docs = self.index.store.load_docs(doc_index for doc_index, _ in hits)
+        return [
+            NodeWithScore(node=TextNode(id_=doc["id"], text=doc["text"], metadata=doc["metadata"]), score=score)
+            for doc, (_, score) in zip(docs, hits)
+        ]
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._retrieve, query_bundle)
+
+
+class ExecutorBM25Retriever(BaseRetriever):
+    """
+    Bọc BM25Retriever của llama-index: bản gốc không có _aretrieve → aretrieve chấm điểm bm25s đồng bộ
+    ngay trên event loop (chặn mọi request khác, deadline nhánh lexical không có tác dụng).
+    Chạy trong executor như NativeBM25Retriever.
+    """
+
+    def __init__(self, retriever: BaseRetriever):
+        super().__init__()
+        self.retriever = retriever
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return self.retriever.retrieve(query_bundle)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.retriever.retrieve, query_bundle)
+
+
 class BM25RetrieverBuilder:
     """
-    Builder chuyên trách tạo BM25 Retriever với docstore từ MongoDB.
+    Builder chuyên trách tạo BM25 Retriever:
+    - Nếu persist dir đã có node store (src.storage.build_bm25_native) → NativeBM25Retriever (mmap, không cần Mongo).
+    - Ngược lại → BM25Retriever của llama-index với docstore từ MongoDB (cách cũ), chạy trong executor.
     """
 
     @staticmethod
@@ -17,10 +153,27 @@ class BM25RetrieverBuilder:
         mongo_db_name: str,
         mongo_namespace: str,
         similarity_top_k: int = 15,
-    ) -> BM25Retriever:
+        id_only: bool = False,
+    ) -> BaseRetriever:
         """
-        Load BM25 từ persist dir + gán docstore từ Mongo → trả về retriever sẵn sàng.
+        Load BM25 từ persist dir → trả về retriever sẵn sàng.
+        id_only chỉ áp dụng cho bản native (cần NodeHydrator có index.store).
         """
+        if (Path(persist_dir) / NODE_IDS_FILE).exists():
+            try:
+                index = NativeBM25Index(persist_dir)
+            except ValueError as e:
+                logger.error(f"[BM25] {e} → dùng BM25Retriever + Mongo docstore")
+            else:
+                logger.info(f"BM25 retriever (native, mmap) sẵn sàng (top_k={similarity_top_k}, nodes={index.num_docs:,})")
+                return NativeBM25Retriever(index=index, similarity_top_k=similarity_top_k, id_only=id_only)
+        else:
+            logger.warning(
+                "BM25 persist dir chưa có node store → dùng BM25Retriever + Mongo docstore "
+                "(chạy python -m src.storage.build_bm25_native để bỏ bước này)"
+            )
+        from llama_index.retrievers.bm25 import BM25Retriever
+
         # Kết nối Mongo
         mongo_manager = MongoDocumentStoreManager(
             uri=mongo_uri,
@@ -38,8 +191,8 @@ class BM25RetrieverBuilder:
         # Override top_k
         bm25_retriever.similarity_top_k = similarity_top_k
 
-        logger.info(f"BM25 retriever sẵn sàng (top_k={similarity_top_k}, nodes={len(docstore.docs):,})")
-        return bm25_retriever
+        logger.info(f"BM25 retriever sẵn sàng (top_k={similarity_top_k}, nodes={int(bm25_retriever.bm25.scores['num_docs']):,})")
+        return ExecutorBM25Retriever(bm25_retriever)
 
 
 class BM25RetrieverWrapper:
@@ -47,7 +200,7 @@ class BM25RetrieverWrapper:
     Wrapper tiện (dễ mở rộng sau này: custom scoring, filter...).
     """
 
-    def __init__(self, retriever: BM25Retriever):
+    def __init__(self, retriever: BaseRetriever):
         self.retriever = retriever
 
     async def aretrieve(self, query: str, **kwargs):
@@ -0,0 +1,213 @@
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from llama_index.core.schema import NodeWithScore
+import logging
+logger = logging.getLogger(__name__)
+
+HEADER = "Các nguồn tham khảo (sắp xếp theo độ liên quan cao nhất):\n\n"
+EMPTY_CONTEXT = "Không tìm thấy tài liệu liên quan."
+SEPARATOR = "-" * 60
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def load_token_counter(tokenizer_name: str) -> Callable[[str], int]:
+    """Đếm token bằng tokenizer thật của LLM sinh câu trả lời (HuggingFace tokenizer.json)."""
+    from tokenizers import Tokenizer
+
+    tokenizer = Tokenizer.from_pretrained(tokenizer_name)
+    logger.info(f"[ContextBuilder] Đã load tokenizer: {tokenizer_name}")
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+@dataclass
+class ContextReport:
+    """Thống kê một lần dựng context (log theo từng request)."""
+    chunks_in: int = 0
+    chunks_used: int = 0
+    sources_used: int = 0
+    collapsed_by_url: int = 0
+    collapsed_similar: int = 0
+    dropped_low_score: int = 0
+    dropped_budget: int = 0
+    tokens_used: int = 0
+    baseline_tokens: int = 0
+    used_nodes: List[NodeWithScore] = field(default_factory=list, repr=False)
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.baseline_tokens - self.tokens_used)
+
+    def summary(self) -> str:
+        return (
+            f"{self.chunks_used}/{self.chunks_in} chunk → {self.sources_used} nguồn | "
+            f"gộp theo URL: {self.collapsed_by_url}, trùng nội dung: {self.collapsed_similar} | "
+            f"bỏ (score thấp): {self.dropped_low_score}, bỏ (hết budget): {self.dropped_budget} | "
+            f"{self.tokens_used:,} token (tiết kiệm {self.tokens_saved:,} / {self.baseline_tokens:,})"
+        )
+
+
+@dataclass
+class _Source:
+    title: str
+    url: str
+    score: float
+    texts: List[str]
+
+
+class ContextBuilder:
+    """
+    Dựng context cho LLM theo ngân sách token (đếm bằng tokenizer thật), thay cho cắt theo số ký tự:
+    - Số chunk thích ứng theo score của reranker (reranked=True, xác suất cross-encoder): giữ tối thiểu
+      min_chunks, sau đó chỉ giữ chunk có score >= score_ratio * score cao nhất. Score RRF (~1/(k + rank),
+      node trùng 2 nhánh ~gấp đôi) không hiệu chỉnh được → không cắt theo score, chỉ giới hạn bởi
+      max_chunks nguồn và ngân sách token.
+    - Chunk cùng URL (subtitle / main của cùng một trang) gộp vào một nguồn, chỉ một header.
+    - Chunk gần trùng nội dung (cosine embedding >= similarity_threshold, hoặc Jaccard từ
+      >= lexical_threshold nếu không có embed_fn) với chunk đã chọn bị bỏ.
+    - Báo cáo số token đã dùng / tiết kiệm so với context cũ (baseline).
+    """
+
+    def __init__(
+        self,
+        count_tokens: Callable[[str], int],
+        max_tokens: int = 4000,
+        min_chunks: int = 2,
+        max_chunks: int = 8,
+        score_ratio: float = 0.35,
+        similarity_threshold: float = 0.95,
+        lexical_threshold: float = 0.8,
+        embed_fn: Optional[Callable[[List[str]], Sequence[Sequence[float]]]] = None,
+    ):
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens
+        self.min_chunks = min_chunks
+        self.max_chunks = max_chunks
+        self.score_ratio = score_ratio
+        self.similarity_threshold = similarity_threshold
+        self.lexical_threshold = lexical_threshold
+        self.embed_fn = embed_fn
+
+    # ────────────────────────────────────────────────
+    # Chọn chunk
+    # ────────────────────────────────────────────────
+    def _adaptive_cut(self, nodes: List[NodeWithScore]) -> List[NodeWithScore]:
+        if not nodes:
+            return []
+        top_score = nodes[0].score or 0.0
+        if top_score <= 0:
+            return nodes
+        return [
+            n for i, n in enumerate(nodes)
+            if i < self.min_chunks or (n.score or 0.0) >= self.score_ratio * top_score
+        ]
+
+    def _similarity_matrix(self, texts: List[str]) -> np.ndarray:
+        if self.embed_fn is not None:
+            try:
+                vectors = np.asarray(self.embed_fn(texts), dtype=np.float32)
+                vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+                return (vectors @ vectors.T) >= self.similarity_threshold
+            except Exception as e:
+                logger.warning(f"[ContextBuilder] Lỗi embed chunk ({e}) → so trùng theo từ")
+
+        shingles = [set(_WORD_RE.findall(text.lower())) for text in texts]
+        n = len(texts)
+        similar = np.zeros((n, n), dtype=bool)
+        for i in range(n):
+            for j in range(i + 1, n):
+                union = len(shingles[i] | shingles[j])
+                if union and len(shingles[i] & shingles[j]) / union >= self.lexical_threshold:
+                    similar[i, j] = similar[j, i] = True
+        return similar
+
+    @staticmethod
+    def _url(node_with_score: NodeWithScore) -> Optional[str]:
+        metadata = node_with_score.node.metadata
+        return metadata.get("url", metadata.get("source_url"))
+
+    @staticmethod
+    def _render(index: int, source: _Source) -> str:
+        body = "\n".join(source.texts)
+        return f"[{index}] {source.title} - {source.url} (Score: {source.score:.4f})\n{body}\n{SEPARATOR}\n"
+
+    # ────────────────────────────────────────────────
+    # API
+    # ────────────────────────────────────────────────
+    def build(
+        self,
+        nodes: List[NodeWithScore],
+        baseline: Optional[str] = None,
+        reranked: bool = False,
+    ) -> Tuple[str, ContextReport]:
+        """reranked: score là xác suất cross-encoder → áp dụng cắt theo score_ratio; False (RRF) → không cắt."""
+        report = ContextReport(chunks_in=len(nodes))
+        if baseline is not None:
+            report.baseline_tokens = self.count_tokens(baseline)
+        if not nodes:
+            report.tokens_used = self.count_tokens(EMPTY_CONTEXT)
+            return EMPTY_CONTEXT, report
+
+        ordered = sorted(nodes, key=lambda x: x.score if x.score is not None else float("-inf"), reverse=True)
+        candidates = self._adaptive_cut(ordered) if reranked else ordered
+        report.dropped_low_score = len(ordered) - len(candidates)
+
+        texts = [n.node.get_content(metadata_mode="none").strip() for n in candidates]
+        similar = self._similarity_matrix(texts)
+
+        sources: Dict[str, _Source] = {}
+        source_nodes: Dict[str, List[NodeWithScore]] = {}
+        kept: List[int] = []
+        for i, node_with_score in enumerate(candidates):
+            if not texts[i] or any(similar[i, j] for j in kept):
+                report.collapsed_similar += 1
+                continue
+            url = self._url(node_with_score)
+            # Chunk không có URL là một nguồn riêng
+            key = url or f"node:{node_with_score.node.node_id}"
+            if key in sources:
+                sources[key].texts.append(texts[i])
+                source_nodes[key].append(node_with_score)
+                report.collapsed_by_url += 1
+            elif len(sources) < self.max_chunks:
+                sources[key] = _Source(
+                    title=node_with_score.node.metadata.get("title", "Không có tiêu đề"),
+                    url=url or "Không có link",
+                    score=node_with_score.score or 0.0,
+                    texts=[texts[i]],
+                )
+                source_nodes[key] = [node_with_score]
+            else:
+                report.dropped_budget += 1
+                continue
+            kept.append(i)
+
+        # Ghép theo ngân sách token; nguồn không vừa thì bỏ qua, thử nguồn sau (ngắn hơn)
+        parts = [HEADER]
+        used_tokens = self.count_tokens(HEADER)
+        index = 0
+        for key, source in sources.items():
+            segment = self._render(index + 1, source)
+            segment_tokens = self.count_tokens(segment)
+            if used_tokens + segment_tokens > self.max_tokens:
+                if index > 0:
+                    report.dropped_budget += len(source.texts)
+                    continue
+                # Nguồn tốt nhất quá dài → cắt bớt theo tỉ lệ ký tự, vẫn giữ lại
+                body = "\n".join(source.texts)
+                overhead = self.count_tokens(self._render(index + 1, _Source(source.title, source.url, source.score, [""])))
+                keep_ratio = max(0.0, 0.95 * (self.max_tokens - used_tokens - overhead) / max(self.count_tokens(body), 1))
+                source.texts = [body[: int(len(body) * keep_ratio)]]
+                segment = self._render(index + 1, source)
+                segment_tokens = self.count_tokens(segment)
+            parts.append(segment)
+            used_tokens += segment_tokens
+            index += 1
+            report.chunks_used += len(source_nodes[key])
+            report.used_nodes.extend(source_nodes[key])
+
+        report.sources_used = index
+        report.tokens_used = used_tokens
+        return "".join(parts), report
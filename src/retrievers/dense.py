@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Literal, Optional
 from llama_index.core.retrievers import BaseRetriever
 from llama_index.core.embeddings import BaseEmbedding
 from src.storage.vector_store_pinecone import PineconeVectorStoreManager   # ← import class mới
@@ -18,6 +18,10 @@ class DenseRetrieverBuilder:
         similarity_top_k: int = 10,
         namespace: Optional[str] = None,
         text_key: str = "text",
+        embed_dim: Optional[int] = None,
+        query_client: Literal["llama", "http"] = "llama",
+        index_host: Optional[str] = None,
+        client_options: Optional[dict] = None,
     ) -> BaseRetriever:
         """
         Tạo và trả về retriever từ Pinecone index đã tồn tại.
@@ -28,6 +32,10 @@ class DenseRetrieverBuilder:
             embed_model=embed_model,
             namespace=namespace,
             text_key=text_key,
+            embed_dim=embed_dim,
+            query_client=query_client,
+            index_host=index_host,
+            client_options=client_options,
         )
 
         retriever = manager.get_retriever(similarity_top_k=similarity_top_k)
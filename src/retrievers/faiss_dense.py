@@ -0,0 +1,164 @@
+import asyncio
+import json
+from pathlib import Path
+from typing import List, Literal, Optional, Tuple, Union
+import faiss
+import numpy as np
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+from src.storage.node_file_store import NodeFileStore, write_node_store
+import logging
+
+logger = logging.getLogger(__name__)
+
+FaissIndexType = Literal["flat", "ivfpq", "hnsw"]
+
+INDEX_FILE = "index.faiss"
+META_FILE = "meta.json"
+
+
+class FaissDenseIndex:
+    """
+    Index dense local (FAISS, inner product trên vector đã chuẩn hoá = cosine):
+    - index.faiss được memory-map khi load (IO_FLAG_MMAP), fallback đọc thường nếu không hỗ trợ.
+    - Text + metadata của node nằm trong NodeFileStore cùng thư mục, chỉ đọc top-k.
+    - nprobe (IVF-PQ) / ef_search (HNSW) chỉnh được lúc load để cân bằng recall / độ trễ.
+    """
+
+    def __init__(
+        self,
+        index_dir: Union[str, Path],
+        nprobe: int = 32,
+        ef_search: int = 128,
+        num_threads: Optional[int] = None,
+    ):
+        self.index_dir = Path(index_dir)
+        self.meta = json.loads((self.index_dir / META_FILE).read_text(encoding="utf-8"))
+        path = str(self.index_dir / INDEX_FILE)
+        try:
+            self.index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            logger.warning(f"[FaissDenseIndex] Không mmap được index ({e}) → đọc toàn bộ vào RAM")
+            self.index = faiss.read_index(path)
+        if num_threads:
+            faiss.omp_set_num_threads(num_threads)
+
+        index_type = self.meta.get("index_type")
+        if index_type == "ivfpq":
+            faiss.extract_index_ivf(self.index).nprobe = nprobe
+        elif index_type == "hnsw":
+            self.index.hnsw.efSearch = ef_search
+
+        self.store = NodeFileStore(self.index_dir)
+        self.dim = self.index.d
+        logger.info(
+            f"[FaissDenseIndex] {self.index_dir} | {self.index.ntotal:,} vector | type={index_type} | dim={self.dim}"
+        )
+
+    def search(self, query_embedding, top_k: int = 10) -> List[Tuple[int, float]]:
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(1, -1).copy()
+        faiss.normalize_L2(query)
+        scores, indices = self.index.search(query, top_k)
+        return [(int(i), float(s)) for i, s in zip(indices[0], scores[0]) if i >= 0]
+
+
+def build_faiss_index(
+    embeddings: np.ndarray,
+    index_type: FaissIndexType = "hnsw",
+    nlist: Optional[int] = None,
+    pq_m: int = 64,
+    hnsw_m: int = 32,
+    ef_construction: int = 200,
+) -> faiss.Index:
+    """Tạo index FAISS (METRIC_INNER_PRODUCT) từ ma trận embedding đã chuẩn hoá L2."""
+    n, dim = embeddings.shape
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ef_construction
+    elif index_type == "ivfpq":
+        nlist = nlist or max(1, int(4 * np.sqrt(n)))
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, 8, faiss.METRIC_INNER_PRODUCT)
+        # Train trên mẫu ngẫu nhiên (~256 điểm / cluster là đủ)
+        sample_size = min(n, nlist * 256)
+        sample = embeddings[np.random.default_rng(0).choice(n, sample_size, replace=False)]
+        index.train(sample)
+    else:
+        raise ValueError(f"index_type không hỗ trợ: {index_type}")
+    index.add(embeddings)
+    return index
+
+
+def write_faiss_index(
+    index_dir: Union[str, Path],
+    index: faiss.Index,
+    index_type: FaissIndexType,
+    node_ids: List[str],
+    texts: List[str],
+    metadatas: List[dict],
+    model_name: str,
+):
+    index_dir = Path(index_dir)
+    index_dir.mkdir(parents=True, exist_ok=True)
+    faiss.write_index(index, str(index_dir / INDEX_FILE))
+    write_node_store(index_dir, node_ids, texts, metadatas)
+    (index_dir / META_FILE).write_text(
+        json.dumps({"model_name": model_name, "index_type": index_type, "num_docs": len(node_ids), "dim": index.d}),
+        encoding="utf-8",
+    )
+
+
+class FaissDenseRetriever(BaseRetriever):
+    """
+    Dense retriever local thay cho Pinecone: dùng query_bundle.embedding nếu đã có
+    (embedding tính một lần cho cả request), ngược lại tự embed bằng embed_model.
+    """
+
+    def __init__(self, index: FaissDenseIndex, embed_model: BaseEmbedding, similarity_top_k: int = 10):
+        super().__init__()
+        self.index = index
+        self.embed_model = embed_model
+        self.similarity_top_k = similarity_top_k
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        embedding = query_bundle.embedding
+        if embedding is None:
+            embedding = self.embed_model.get_query_embedding(query_bundle.query_str)
+        hits = self.index.search(embedding, top_k=self.similarity_top_k)
+        docs = self.index.store.load_docs(doc_index for doc_index, _ in hits)
+        return [
+            NodeWithScore(node=TextNode(id_=doc["id"], text=doc["text"], metadata=doc["metadata"]), score=score)
+            for doc, (_, score) in zip(docs, hits)
+        ]
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._retrieve, query_bundle)
+
+
+class FaissRetrieverBuilder:
+    """
+    Builder tạo FaissDenseRetriever từ index đã build bằng src.storage.build_faiss_index.
+    """
+
+    @staticmethod
+    def build(
+        index_dir: Union[str, Path],
+        embed_model: BaseEmbedding,
+        similarity_top_k: int = 10,
+        nprobe: int = 32,
+        ef_search: int = 128,
+        num_threads: Optional[int] = None,
+        expected_model: Optional[str] = None,
+    ) -> FaissDenseRetriever:
+        index = FaissDenseIndex(index_dir, nprobe=nprobe, ef_search=ef_search, num_threads=num_threads)
+        if expected_model and index.meta.get("model_name") != expected_model:
+            raise ValueError(
+                f"FAISS index được build bằng '{index.meta.get('model_name')}', "
+                f"nhưng embedding model hiện tại là '{expected_model}'"
+            )
+        logger.info(f"Dense retriever (FAISS) sẵn sàng (top_k={similarity_top_k}, nodes={len(index.store):,})")
+        return FaissDenseRetriever(index=index, embed_model=embed_model, similarity_top_k=similarity_top_k)
@@ -0,0 +1,177 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Literal, Optional, Sequence, Tuple
+import numpy as np
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+import logging
+logger = logging.getLogger(__name__)
+
+FusionMode = Literal["rrf", "relative_score", "dist_based_score", "simple"]
+
+
+@dataclass
+class FusionStatus:
+    """Trạng thái các nhánh của một lần retrieve: nhánh nào trễ deadline / lỗi thì fusion chỉ dùng phần còn lại."""
+    degraded: Dict[str, str] = field(default_factory=dict)     # tên nhánh → lý do ("timeout 1.5s", "lỗi: ...")
+    elapsed_ms: Dict[str, float] = field(default_factory=dict)
+    reranked: bool = False      # True = score là xác suất của cross-encoder (so được giữa các query), không phải RRF
+
+    @property
+    def is_degraded(self) -> bool:
+        return bool(self.degraded)
+
+    def summary(self) -> str:
+        return ", ".join(f"{name} ({reason})" for name, reason in self.degraded.items())
+
+
+class FusionEngine:
+    """
+    Fusion nhiều retriever (dense + lexical) thay cho QueryFusionRetriever của llama-index:
+    - Các nhánh chạy song song (asyncio.gather), không cần LLM (không sinh thêm query).
+    - Tham số theo từng lần gọi (top_k, mode) → không sửa state dùng chung, an toàn khi nhiều session.
+    - Dedup theo node id; điểm được gom bằng numpy trên ma trận (nhánh × node).
+    - Không sửa NodeWithScore của retriever, luôn trả về object mới.
+    - Deadline theo từng nhánh (branch_timeouts, giây): nhánh trễ hạn hoặc lỗi bị bỏ qua, fusion trên
+      kết quả các nhánh đã về → tail latency bị chặn khi một backend chậm; FusionStatus ghi lại nhánh bị thiếu.
+
+    mode:
+    - "rrf": Σ w_i / (rrf_k + rank_i), rank (từ 0) tính trong từng nhánh theo score giảm dần.
+    - "relative_score": min-max từng nhánh về [0, 1] rồi cộng có trọng số.
+    - "dist_based_score": như relative_score nhưng min/max = mean ∓ 3·std của nhánh.
+    - "simple": lấy score cao nhất của node giữa các nhánh.
+    """
+
+    def __init__(
+        self,
+        retrievers: Sequence[BaseRetriever],
+        mode: FusionMode = "rrf",
+        similarity_top_k: int = 6,
+        rrf_k: int = 60,
+        weights: Optional[Sequence[float]] = None,
+        branch_timeouts: Optional[Sequence[Optional[float]]] = None,   # None (cả list hoặc từng phần tử) = không giới hạn
+        branch_names: Optional[Sequence[str]] = None,
+    ):
+        for name, value in (("weights", weights), ("branch_timeouts", branch_timeouts), ("branch_names", branch_names)):
+            if value is not None and len(value) != len(retrievers):
+                raise ValueError(f"{name} phải có cùng số phần tử với retrievers")
+        self.retrievers = list(retrievers)
+        self.branch_timeouts = list(branch_timeouts) if branch_timeouts is not None else [None] * len(self.retrievers)
+        self.branch_names = list(branch_names) if branch_names is not None else [f"branch{i}" for i in range(len(self.retrievers))]
+        self.mode = mode
+        self.similarity_top_k = similarity_top_k
+        self.rrf_k = rrf_k
+        self.weights = np.asarray(weights if weights is not None else [1.0] * len(self.retrievers), dtype=np.float64)
+
+    async def retrieve(
+        self,
+        query_bundle: QueryBundle,
+        top_k: Optional[int] = None,
+        mode: Optional[FusionMode] = None,
+    ) -> List[NodeWithScore]:
+        nodes, _ = await self.retrieve_with_status(query_bundle, top_k=top_k, mode=mode)
+        return nodes
+
+    async def retrieve_with_status(
+        self,
+        query_bundle: QueryBundle,
+        top_k: Optional[int] = None,
+        mode: Optional[FusionMode] = None,
+    ) -> Tuple[List[NodeWithScore], FusionStatus]:
+        status = FusionStatus()
+        results = await asyncio.gather(*(
+            self._run_branch(retriever, name, timeout, query_bundle, status)
+            for retriever, name, timeout in zip(self.retrievers, self.branch_names, self.branch_timeouts)
+        ))
+        if status.is_degraded:
+            logger.warning(f"[FusionEngine] Fusion thiếu nhánh: {status.summary()}")
+        return self.fuse(results, top_k=top_k, mode=mode), status
+
+    @staticmethod
+    async def _run_branch(
+        retriever: BaseRetriever,
+        name: str,
+        timeout: Optional[float],
+        query_bundle: QueryBundle,
+        status: FusionStatus,
+    ) -> List[NodeWithScore]:
+        start = time.perf_counter()
+        try:
+            # wait_for huỷ coroutine của nhánh khi hết hạn (request HTTP đang chờ được trả về pool)
+            return await asyncio.wait_for(retriever.aretrieve(query_bundle), timeout=timeout)
+        except asyncio.TimeoutError:
+            status.degraded[name] = f"timeout {timeout:g}s"
+        except Exception as e:
+            logger.warning(f"[FusionEngine] Nhánh {name} lỗi: {e}")
+            status.degraded[name] = f"lỗi: {type(e).__name__}"
+        finally:
+            status.elapsed_ms[name] = (time.perf_counter() - start) * 1000
+        return []
+
+    def fuse(
+        self,
+        results: Sequence[List[NodeWithScore]],
+        top_k: Optional[int] = None,
+        mode: Optional[FusionMode] = None,
+    ) -> List[NodeWithScore]:
+        top_k = top_k or self.similarity_top_k
+        mode = mode or self.mode
+
+        # Gán cột cho từng node id (giữ node của lần xuất hiện đầu tiên)
+        columns: Dict[str, int] = {}
+        nodes: List[NodeWithScore] = []
+        for branch in results:
+            for node_with_score in branch:
+                node_id = node_with_score.node.node_id
+                if node_id not in columns:
+                    columns[node_id] = len(nodes)
+                    nodes.append(node_with_score)
+        if not nodes:
+            return []
+
+        # Ma trận điểm (nhánh × node), NaN = node không có trong nhánh
+        scores = np.full((len(results), len(nodes)), np.nan)
+        for i, branch in enumerate(results):
+            if not branch:
+                continue
+            cols = [columns[n.node.node_id] for n in branch]
+            values = [n.score or 0.0 for n in branch]
+            # fmax bỏ qua NaN; nhánh trả node trùng id → giữ score cao nhất
+            np.fmax.at(scores[i], cols, values)
+
+        fused = self._combine(scores, mode)
+        top_k = min(top_k, len(nodes))
+        order = np.argsort(-fused, kind="stable")[:top_k]
+        return [NodeWithScore(node=nodes[j].node, score=float(fused[j])) for j in order]
+
+    def _combine(self, scores: np.ndarray, mode: FusionMode) -> np.ndarray:
+        present = ~np.isnan(scores)
+        weights = self.weights[: scores.shape[0], None]
+
+        if mode == "simple":
+            return np.nanmax(scores, axis=0)
+
+        if mode == "rrf":
+            # Rank trong từng nhánh: node vắng mặt (NaN → -inf) xếp cuối và bị loại bởi mask
+            ranks = np.argsort(np.argsort(-np.where(present, scores, -np.inf), axis=1, kind="stable"), axis=1)
+            contrib = np.where(present, weights / (self.rrf_k + ranks), 0.0)
+            return contrib.sum(axis=0)
+
+        if mode in ("relative_score", "dist_based_score"):
+            filled = np.where(present, scores, 0.0)
+            counts = present.sum(axis=1, keepdims=True)
+            safe_counts = np.maximum(counts, 1)
+            if mode == "dist_based_score":
+                mean = filled.sum(axis=1, keepdims=True) / safe_counts
+                std = np.sqrt((np.where(present, scores - mean, 0.0) ** 2).sum(axis=1, keepdims=True) / safe_counts)
+                low, high = mean - 3 * std, mean + 3 * std
+            else:
+                low = np.where(present, scores, np.inf).min(axis=1, keepdims=True)
+                high = np.where(present, scores, -np.inf).max(axis=1, keepdims=True)
+            span = high - low
+            with np.errstate(invalid="ignore", divide="ignore"):
+                scaled = np.where(span > 0, (filled - low) / np.where(span > 0, span, 1.0), (high > 0).astype(np.float64))
+            return np.where(present, scaled * weights, 0.0).sum(axis=0)
+
+        raise ValueError(f"mode fusion không hỗ trợ: {mode}")
@@ -1,13 +1,15 @@
-import os
-from typing import List, Optional
-from llama_index.core.retrievers import QueryFusionRetriever, BaseRetriever
-from llama_index.core.schema import NodeWithScore
+import asyncio
+from typing import List, Optional, Sequence, Tuple
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
 
 from src.retrievers.dense import DenseRetrieverBuilder
 from src.retrievers.bm25 import BM25RetrieverBuilder
+from src.retrievers.fusion import FusionEngine, FusionMode, FusionStatus
+from src.storage.node_hydrator import NodeHydrator
+from src.cache.retrieval_cache import RetrievalResultCache
+from src.reranker.cross_encoder import CrossEncoderReranker
 
-from llama_index.core import Settings
-from llama_index.llms.groq import Groq
 from langfuse import observe
 
 import logging
@@ -15,7 +17,10 @@ logger = logging.getLogger(__name__)
 
 class HybridRetriever:
     """
-    Hybrid Retriever kết hợp Dense (Pinecone) + BM25 bằng QueryFusionRetriever (RRF).
+    Hybrid Retriever kết hợp Dense (Pinecone) + BM25 bằng FusionEngine (RRF, không cần LLM),
+    tuỳ chọn rerank top ứng viên bằng cross-encoder.
+    Mỗi nhánh (dense / lexical) và bước hydrate có deadline riêng: quá hạn thì dùng phần kết quả đã có,
+    FusionStatus đánh dấu degraded (kết quả degraded không được cache).
     """
 
     def __init__(
@@ -28,38 +33,38 @@ class HybridRetriever:
         mongo_db_name: str,
         mongo_namespace: str,
         bm25_persist_dir: str,
-        small_model: str,
         pinecone_namespace: Optional[str] = None,   # Optional cho Pinecone
         pinecone_text_key: str = "text",            # Optional, mặc định "text"
         top_k_dense: int = 10,
         top_k_bm25: int = 15,
         top_k_final: int = 6,
-        use_rrf: bool = True,    
+        use_rrf: bool = True,
+        fusion_mode: Optional[FusionMode] = None,          # None = "rrf" nếu use_rrf, ngược lại "simple"
+        rrf_k: int = 60,
+        embed_dim: Optional[int] = None,
+        dense_retriever: Optional[BaseRetriever] = None,    # Truyền sẵn (đã build song song) để bỏ qua bước build
+        bm25_retriever: Optional[BaseRetriever] = None,     # Nhánh lexical: BM25 hoặc SparseLexicalRetriever (bge-m3)
+        hydrator: Optional[NodeHydrator] = None,            # Bổ sung text cho node chỉ có id (1 query $in + LRU)
+        result_cache: Optional[RetrievalResultCache] = None,  # Cache kết quả fusion theo query + index version
+        reranker: Optional[CrossEncoderReranker] = None,    # Rerank sau fusion (cross-encoder CPU, có time budget)
+        rerank_candidates: int = 20,                        # Số node fusion đưa vào reranker
+        dense_timeout_seconds: Optional[float] = None,      # Deadline nhánh dense, None = chờ tới khi xong
+        lexical_timeout_seconds: Optional[float] = None,    # Deadline nhánh lexical (BM25 / sparse)
+        hydration_timeout_seconds: Optional[float] = None,  # Deadline hydrate từ Mongo
     ):
-        # Set LLM Groq (từ .env)
-        groq_api_key = os.getenv("GROQ_API_KEY")
-        if not groq_api_key:
-            raise ValueError("Không tìm thấy GROQ_API_KEY trong .env")
-
-        Settings.llm = Groq(
-            model=small_model,
-            api_key=groq_api_key,
-            temperature=0.1,
-        )
-        logger.info("Đã set LLM Groq cho QueryFusionRetriever")
-
         # Tạo dense retriever (bây giờ dùng Pinecone)
-        self.dense_retriever = DenseRetrieverBuilder.build(
+        self.dense_retriever = dense_retriever or DenseRetrieverBuilder.build(
             api_key=pinecone_api_key,
             index_name=pinecone_index_name,
             embed_model=embed_model,
             similarity_top_k=top_k_dense,
             namespace=pinecone_namespace,
             text_key=pinecone_text_key,
+            embed_dim=embed_dim,
         )
 
         # Tạo bm25 retriever (giữ nguyên)
-        self.bm25_retriever = BM25RetrieverBuilder.build(
+        self.bm25_retriever = bm25_retriever or BM25RetrieverBuilder.build(
             persist_dir=bm25_persist_dir,
             mongo_uri=mongo_uri,
             mongo_db_name=mongo_db_name,
@@ -67,32 +72,100 @@ class HybridRetriever:
             similarity_top_k=top_k_bm25,
         )
 
-        # Fusion (giữ nguyên logic)
-        logger.info("Khởi tạo QueryFusionRetriever (hybrid mode)...")
-        self.fusion_retriever = QueryFusionRetriever(
+        self.hydrator = hydrator
+        self.result_cache = result_cache
+        self.reranker = reranker
+        self.rerank_candidates = rerank_candidates
+        self.hydration_timeout_seconds = hydration_timeout_seconds
+
+        # Fusion: dense + lexical chạy song song, top_k / mode truyền theo từng lần gọi
+        self.fusion = FusionEngine(
             retrievers=[self.dense_retriever, self.bm25_retriever],
+            mode=fusion_mode or ("rrf" if use_rrf else "simple"),
             similarity_top_k=top_k_final,
-            num_queries=1,
-            mode="reciprocal_rerank" if use_rrf else "simple",
-            use_async=True,
-            verbose=True,
+            rrf_k=rrf_k,
+            branch_timeouts=[dense_timeout_seconds, lexical_timeout_seconds],
+            branch_names=["dense", "lexical"],
         )
+        logger.info(f"Khởi tạo FusionEngine (hybrid mode: {self.fusion.mode})")
 
-    @observe(name="hybrid_retrieve")
     async def retrieve(
         self,
         query: str,
         top_k: Optional[int] = None,
+        query_embedding: Optional[Sequence[float]] = None,
     ) -> List[NodeWithScore]:
-        if top_k is not None:
-            original_k = self.fusion_retriever.similarity_top_k
-            self.fusion_retriever.similarity_top_k = top_k
-            nodes = await self.fusion_retriever.aretrieve(query)
-            self.fusion_retriever.similarity_top_k = original_k
-        else:
-            nodes = await self.fusion_retriever.aretrieve(query)
+        nodes, _ = await self.retrieve_with_status(query, top_k=top_k, query_embedding=query_embedding)
         return nodes
 
+    @observe(name="hybrid_retrieve")
+    async def retrieve_with_status(
+        self,
+        query: str,
+        top_k: Optional[int] = None,
+        query_embedding: Optional[Sequence[float]] = None,
+    ) -> Tuple[List[NodeWithScore], FusionStatus]:
+        """
+        query_embedding: embedding đã tính sẵn cho query → dense retriever dùng luôn,
+        không embed lại (BM25 vẫn dùng query_str).
+        FusionStatus.degraded: các bước trễ deadline / lỗi (nhánh retrieve, hydrate, rerank).
+        """
+        query_bundle = QueryBundle(
+            query_str=query,
+            embedding=[float(x) for x in query_embedding] if query_embedding is not None else None,
+        )
+        top_k = top_k or self.fusion.similarity_top_k
+        # Kết quả đã rerank cache riêng với kết quả fusion thuần
+        cache_mode = f"{self.fusion.mode}+rerank" if self.reranker is not None else self.fusion.mode
+        if self.result_cache is not None:
+            nodes = self.result_cache.get(query, top_k, cache_mode, embedding=query_embedding)
+            logger.debug(f"[HybridRetriever] Result cache {'HIT' if nodes is not None else 'MISS'}: {self.result_cache.stats()}")
+            if nodes is not None:
+                # Chỉ kết quả rerank đầy đủ mới được cache dưới cache_mode "+rerank"
+                status = FusionStatus(reranked=self.reranker is not None)
+                return await self._hydrate(nodes, status), status
+
+        if self.reranker is None:
+            nodes, status = await self.fusion.retrieve_with_status(query_bundle, top_k=top_k)
+            if self.result_cache is not None and not status.is_degraded:
+                self.result_cache.set(query, top_k, cache_mode, nodes, embedding=query_embedding)
+            return await self._hydrate(nodes, status), status
+
+        # Fusion lấy nhiều ứng viên hơn → hydrate (reranker cần text) → cross-encoder chọn top_k
+        candidates, status = await self.fusion.retrieve_with_status(query_bundle, top_k=max(top_k, self.rerank_candidates))
+        candidates = await self._hydrate(candidates, status)
+        result = await self.reranker.arerank(query, candidates, top_n=top_k)
+        logger.debug(
+            f"[HybridRetriever] Rerank {len(candidates)} → {len(result.nodes)} "
+            f"({'fallback RRF' if not result.reranked else 'một phần' if result.partial else 'OK'}, {result.elapsed_ms:.0f}ms, "
+            f"cache hit {result.cache_hits}, chấm {result.scored})"
+        )
+        status.reranked = result.reranked
+        if not result.reranked or result.partial:
+            status.degraded["rerank"] = f"hết time budget {self.reranker.time_budget_ms:.0f}ms"
+        # Kết quả fallback (hết budget / thiếu nhánh) không cache, lần sau có thể đầy đủ (điểm đã chấm nằm trong cache cặp)
+        if self.result_cache is not None and not status.is_degraded:
+            self.result_cache.set(query, top_k, cache_mode, result.nodes, embedding=query_embedding)
+        return result.nodes, status
+
+    async def _hydrate(self, nodes: List[NodeWithScore], status: FusionStatus) -> List[NodeWithScore]:
+        if self.hydrator is None:
+            return nodes
+        try:
+            nodes = await asyncio.wait_for(self.hydrator.ahydrate(nodes), timeout=self.hydration_timeout_seconds)
+        except asyncio.TimeoutError:
+            status.degraded["hydrate"] = f"timeout {self.hydration_timeout_seconds:g}s"
+        except Exception as e:
+            logger.warning(f"[HybridRetriever] Lỗi hydrate: {e}")
+            status.degraded["hydrate"] = f"lỗi: {type(e).__name__}"
+        else:
+            logger.debug(f"[HybridRetriever] Hydration: {self.hydrator.stats()}")
+            return nodes
+        # Hydrate không xong → chỉ giữ node đã có text (vd node từ nhánh lexical)
+        kept = [n for n in nodes if not self.hydrator.needs_hydration(n)]
+        logger.warning(f"[HybridRetriever] Hydrate {status.degraded['hydrate']} → giữ {len(kept)}/{len(nodes)} node có text")
+        return kept
+
     def get_context_string(self, nodes: List[NodeWithScore], max_chars: int = 15000) -> str:
         if not nodes:
             return "Không tìm thấy tài liệu liên quan."
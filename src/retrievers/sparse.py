@@ -0,0 +1,158 @@
+import asyncio
+import json
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+import numpy as np
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+from src.storage.node_file_store import NodeFileStore, write_node_store
+import logging
+
+logger = logging.getLogger(__name__)
+
+SparseWeights = Dict[int, float]
+
+# Tên file trong thư mục index
+INDPTR_FILE = "indptr.npy"
+POSTING_DOCS_FILE = "posting_docs.npy"
+POSTING_WEIGHTS_FILE = "posting_weights.npy"
+META_FILE = "meta.json"
+
+
+class SparseLexicalIndex:
+    """
+    Inverted index (CSR theo token id) cho trọng số lexical của bge-m3:
+    - posting của token t nằm trong [indptr[t], indptr[t+1]) của posting_docs / posting_weights.
+    - score(q, d) = Σ_t w_q(t) · w_d(t)  (lexical matching score của bge-m3).
+    - Mọi mảng được memory-map → load tức thì, chỉ các trang posting được đụng tới mới vào RAM.
+    - Text + metadata của node nằm trong NodeFileStore cùng thư mục → chỉ đọc top-k.
+    """
+
+    def __init__(self, index_dir: Union[str, Path], mmap: bool = True):
+        self.index_dir = Path(index_dir)
+        mode = "r" if mmap else None
+        self.meta = json.loads((self.index_dir / META_FILE).read_text(encoding="utf-8"))
+        self.indptr = np.load(self.index_dir / INDPTR_FILE, mmap_mode=mode)
+        self.posting_docs = np.load(self.index_dir / POSTING_DOCS_FILE, mmap_mode=mode)
+        self.posting_weights = np.load(self.index_dir / POSTING_WEIGHTS_FILE, mmap_mode=mode)
+        self.store = NodeFileStore(self.index_dir, mmap=mmap)
+        self.num_docs = int(self.meta["num_docs"])
+        self.vocab_size = len(self.indptr) - 1
+        logger.info(
+            f"[SparseLexicalIndex] {self.index_dir} | {self.num_docs:,} node | "
+            f"{len(self.posting_docs):,} posting | model={self.meta.get('model_name')}"
+        )
+
+    def search(self, query: SparseWeights, top_k: int = 10) -> List[Tuple[int, float]]:
+        """Trả về [(doc_index, score)] giảm dần, chỉ các doc có score > 0."""
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        for token_id, query_weight in query.items():
+            if token_id >= self.vocab_size:
+                continue
+            start, end = int(self.indptr[token_id]), int(self.indptr[token_id + 1])
+            if start == end:
+                continue
+            # Trong một posting list mỗi doc xuất hiện một lần → cộng fancy-index an toàn
+            scores[self.posting_docs[start:end]] += np.float32(query_weight) * self.posting_weights[start:end].astype(np.float32)
+
+        top_k = min(top_k, self.num_docs)
+        if top_k <= 0:
+            return []
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(i), float(scores[i])) for i in candidates if scores[i] > 0]
+
+
+def write_sparse_index(
+    index_dir: Union[str, Path],
+    node_ids: List[str],
+    texts: List[str],
+    metadatas: List[dict],
+    sparse_weights: List[SparseWeights],
+    vocab_size: int,
+    model_name: str,
+):
+    """Ghi SparseLexicalIndex ra đĩa (dùng trong script build)."""
+    index_dir = Path(index_dir)
+    index_dir.mkdir(parents=True, exist_ok=True)
+
+    counts = np.fromiter((len(w) for w in sparse_weights), dtype=np.int64, count=len(sparse_weights))
+    total = int(counts.sum())
+    tokens = np.empty(total, dtype=np.int32)
+    docs = np.empty(total, dtype=np.int32)
+    weights = np.empty(total, dtype=np.float32)
+    pos = 0
+    for doc_index, doc_weights in enumerate(sparse_weights):
+        n = len(doc_weights)
+        if n:
+            tokens[pos:pos + n] = np.fromiter(doc_weights.keys(), dtype=np.int32, count=n)
+            weights[pos:pos + n] = np.fromiter(doc_weights.values(), dtype=np.float32, count=n)
+            docs[pos:pos + n] = doc_index
+        pos += n
+
+    # Sắp theo token (stable → doc tăng dần trong từng posting list)
+    order = np.argsort(tokens, kind="stable")
+    indptr = np.zeros(vocab_size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(tokens, minlength=vocab_size), out=indptr[1:])
+
+    np.save(index_dir / INDPTR_FILE, indptr)
+    np.save(index_dir / POSTING_DOCS_FILE, docs[order])
+    np.save(index_dir / POSTING_WEIGHTS_FILE, weights[order].astype(np.float16))
+    write_node_store(index_dir, node_ids, texts, metadatas)
+
+    (index_dir / META_FILE).write_text(
+        json.dumps({"model_name": model_name, "num_docs": len(node_ids), "num_postings": total, "vocab_size": vocab_size}),
+        encoding="utf-8",
+    )
+
+
+class SparseLexicalRetriever(BaseRetriever):
+    """
+    Retriever lexical dùng trọng số sparse của bge-m3, thay cho BM25 + Mongo docstore.
+    sparse_fn(query) trả về trọng số của query (lấy lại từ lần embed dense, không forward thêm).
+    """
+
+    def __init__(
+        self,
+        index: SparseLexicalIndex,
+        sparse_fn: Callable[[str], SparseWeights],
+        similarity_top_k: int = 15,
+    ):
+        super().__init__()
+        self.index = index
+        self.sparse_fn = sparse_fn
+        self.similarity_top_k = similarity_top_k
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        hits = self.index.search(self.sparse_fn(query_bundle.query_str), top_k=self.similarity_top_k)
+        docs = self.index.store.load_docs(doc_index for doc_index, _ in hits)
+        return [
+            NodeWithScore(node=TextNode(id_=doc["id"], text=doc["text"], metadata=doc["metadata"]), score=score)
+            for doc, (_, score) in zip(docs, hits)
+        ]
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._retrieve, query_bundle)
+
+
+class SparseRetrieverBuilder:
+    """
+    Builder tạo SparseLexicalRetriever từ index đã build bằng src.storage.build_sparse_index.
+    """
+
+    @staticmethod
+    def build(
+        index_dir: Union[str, Path],
+        sparse_fn: Callable[[str], SparseWeights],
+        similarity_top_k: int = 15,
+        expected_model: Optional[str] = None,
+    ) -> SparseLexicalRetriever:
+        index = SparseLexicalIndex(index_dir)
+        if expected_model and index.meta.get("model_name") != expected_model:
+            raise ValueError(
+                f"Sparse index được build bằng '{index.meta.get('model_name')}', "
+                f"nhưng embedding model hiện tại là '{expected_model}'"
+            )
+        logger.info(f"Sparse lexical retriever sẵn sàng (top_k={similarity_top_k}, nodes={index.num_docs:,})")
+        return SparseLexicalRetriever(index=index, sparse_fn=sparse_fn, similarity_top_k=similarity_top_k)
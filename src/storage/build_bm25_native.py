@@ -0,0 +1,50 @@
+"""
+Chuẩn bị BM25 persist dir (output của build_mongo_docstore.py) cho NativeBM25Index:
+ghi node store (node_ids.npy + docs.jsonl + doc_offsets.npy) từ corpus.jsonl mà bm25s đã lưu,
+để lúc chạy chỉ cần memory-map ma trận điểm và đọc text của top-k, không cần Mongo docstore.
+
+Chạy (một lần, sau mỗi lần build lại BM25):
+    python -m src.storage.build_bm25_native
+    python -m src.storage.build_bm25_native --persist-dir bm25_persist_vi
+Ma trận điểm (data/indices/indptr.csc.index.npy) giữ nguyên, không build lại.
+"""
+import argparse
+import json
+from pathlib import Path
+from tqdm import tqdm
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
+from src.retrievers.bm25 import DATA_FILE, INDICES_FILE, INDPTR_FILE, VOCAB_FILE
+from src.storage.node_file_store import write_node_store
+from src.storage.index_version import bump_index_version
+from src.config.settings import settings
+
+CORPUS_FILE = "corpus.jsonl"
+
+
+def build(persist_dir: Path):
+    for name in (DATA_FILE, INDICES_FILE, INDPTR_FILE, VOCAB_FILE, CORPUS_FILE):
+        if not (persist_dir / name).exists():
+            raise FileNotFoundError(f"Thiếu {name} trong {persist_dir} (BM25 phải được persist kèm corpus)")
+
+    node_ids, texts, metadatas = [], [], []
+    with open(persist_dir / CORPUS_FILE, encoding="utf-8") as f:
+        for line in tqdm(f, desc="Đọc corpus BM25", unit="node"):
+            node_dict = json.loads(line)
+            node = metadata_dict_to_node(node_dict)
+            node_ids.append(node_dict.get("node_id", node.node_id))
+            texts.append(node.get_content(metadata_mode="none"))
+            metadatas.append(node.metadata)
+    print(f"Tổng số nodes: {len(node_ids):,}")
+
+    write_node_store(persist_dir, node_ids, texts, metadatas)
+    print(f"Đã ghi node store vào: {persist_dir}")
+    bump_index_version(settings.paths.index_version_file, reason="build_bm25_native")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chuẩn bị BM25 persist dir cho NativeBM25Index")
+    parser.add_argument("--persist-dir", type=Path, default=settings.paths.bm25_persist_dir)
+    args = parser.parse_args()
+
+    print("=== Build node store cho native BM25 ===")
+    build(args.persist_dir)
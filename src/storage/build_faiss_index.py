@@ -0,0 +1,68 @@
+"""
+Build index FAISS local (dense backend thay cho Pinecone) từ embedded_nodes.pkl.
+Dùng lại embedding có sẵn trong node.embedding → không cần GPU / model.
+
+Chạy:
+    python -m src.storage.build_faiss_index
+    python -m src.storage.build_faiss_index --index-type ivfpq --nlist 4096 --pq-m 64
+Node id giữ nguyên như trong pickle (trùng với id trên Pinecone) → fusion dedup đúng.
+Sau khi build: đặt settings.retriever.dense_backend = "faiss".
+"""
+import argparse
+import pickle
+import time
+from pathlib import Path
+import faiss
+import numpy as np
+from src.retrievers.faiss_dense import build_faiss_index, write_faiss_index
+from src.storage.index_version import bump_index_version
+from src.config.settings import settings
+
+
+def build(pkl_path: Path, index_dir: Path, index_type: str, nlist, pq_m: int, hnsw_m: int, ef_construction: int):
+    print(f"Đang load nodes từ {pkl_path}...")
+    with open(pkl_path, "rb") as f:
+        nodes = pickle.load(f)
+    nodes = [node for node in nodes if node.embedding is not None]
+    print(f"Tổng số nodes có embedding: {len(nodes):,}")
+
+    embeddings = np.asarray([node.embedding for node in nodes], dtype=np.float32)
+    faiss.normalize_L2(embeddings)
+
+    start = time.perf_counter()
+    index = build_faiss_index(
+        embeddings,
+        index_type=index_type,
+        nlist=nlist,
+        pq_m=pq_m,
+        hnsw_m=hnsw_m,
+        ef_construction=ef_construction,
+    )
+    print(f"Build index {index_type} xong trong {time.perf_counter() - start:.1f}s ({index.ntotal:,} vector, dim={index.d})")
+
+    write_faiss_index(
+        index_dir=index_dir,
+        index=index,
+        index_type=index_type,
+        node_ids=[node.node_id for node in nodes],
+        texts=[node.get_content(metadata_mode="none") for node in nodes],
+        metadatas=[node.metadata for node in nodes],
+        model_name=settings.embedding.model_name,
+    )
+    print(f"Đã lưu FAISS index vào: {index_dir}")
+    bump_index_version(settings.paths.index_version_file, reason="build_faiss_index")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build FAISS dense index")
+    parser.add_argument("--pkl", type=Path, default=settings.paths.embedded_nodes_path)
+    parser.add_argument("--output-dir", type=Path, default=settings.paths.faiss_index_dir)
+    parser.add_argument("--index-type", choices=["flat", "ivfpq", "hnsw"], default=settings.faiss.index_type)
+    parser.add_argument("--nlist", type=int, default=settings.faiss.nlist)
+    parser.add_argument("--pq-m", type=int, default=settings.faiss.pq_m)
+    parser.add_argument("--hnsw-m", type=int, default=settings.faiss.hnsw_m)
+    parser.add_argument("--ef-construction", type=int, default=settings.faiss.ef_construction)
+    args = parser.parse_args()
+
+    print("=== Build FAISS dense index ===")
+    build(args.pkl, args.output_dir, args.index_type, args.nlist, args.pq_m, args.hnsw_m, args.ef_construction)
@@ -6,6 +6,7 @@ from pymongo import MongoClient
 import datetime
 import os
 from src.config.settings import settings
+from src.storage.index_version import bump_index_version
 
 print("=== Build BM25 & lưu nodes vào MongoDocumentStore (MongoDB) - Tối ưu tiếng Việt ===")
 
@@ -92,5 +93,6 @@ BM25_PERSIST_DIR = settings.paths.bm25_persist_dir
 os.makedirs(BM25_PERSIST_DIR, exist_ok=True)
 bm25_retriever.persist(path=BM25_PERSIST_DIR)
 print(f"Đã lưu BM25 retriever (tiếng Việt optimized) vào: {BM25_PERSIST_DIR}")
+bump_index_version(settings.paths.index_version_file, reason="build_mongo_docstore")
 
 print("\nHoàn tất! Load lại trong HybridRetriever như sau:")
@@ -0,0 +1,41 @@
+"""
+Build node store (node_ids.npy + docs.jsonl + doc_offsets.npy) từ embedded_nodes.pkl cho NodeHydrator:
+id giữ nguyên như trong pickle (trùng id trên Pinecone / FAISS) → hydrate được node chỉ có id
+mà dense retriever trả về (Pinecone includeMetadata=false), không cần Mongo docstore.
+
+Chạy (một lần, sau mỗi lần embed / upsert lại):
+    python -m src.storage.build_node_store
+    python -m src.storage.build_node_store --pkl storage/embedded_nodes.pkl --output-dir storage/node_store
+"""
+import argparse
+import pickle
+from pathlib import Path
+from src.storage.node_file_store import write_node_store
+from src.storage.index_version import bump_index_version
+from src.config.settings import settings
+
+
+def build(pkl_path: Path, output_dir: Path):
+    print(f"Đang load nodes từ {pkl_path}...")
+    with open(pkl_path, "rb") as f:
+        nodes = pickle.load(f)
+    print(f"Tổng số nodes: {len(nodes):,}")
+
+    write_node_store(
+        output_dir,
+        node_ids=[node.node_id for node in nodes],
+        texts=[node.get_content(metadata_mode="none") for node in nodes],
+        metadatas=[node.metadata for node in nodes],
+    )
+    print(f"Đã ghi node store vào: {output_dir}")
+    bump_index_version(settings.paths.index_version_file, reason="build_node_store")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build node store (id Pinecone) cho NodeHydrator")
+    parser.add_argument("--pkl", type=Path, default=settings.paths.embedded_nodes_path)
+    parser.add_argument("--output-dir", type=Path, default=settings.paths.node_store_dir)
+    args = parser.parse_args()
+
+    print("=== Build node store cho hydrate ===")
+    build(args.pkl, args.output_dir)
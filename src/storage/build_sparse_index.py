@@ -0,0 +1,65 @@
+"""
+Build inverted index trọng số lexical (sparse) của bge-m3 từ embedded_nodes.pkl,
+thay cho bước build BM25 + Mongo docstore (build_mongo_docstore.py).
+
+Chạy:
+    python -m src.storage.build_sparse_index
+    python -m src.storage.build_sparse_index --device cuda --batch-size 32
+Node id giữ nguyên như trong pickle (trùng với id trên Pinecone) → fusion dedup đúng.
+"""
+import argparse
+import pickle
+import time
+from pathlib import Path
+from tqdm import tqdm
+from src.embedding.bge_m3 import BGEM3Encoder
+from src.retrievers.sparse import write_sparse_index
+from src.storage.index_version import bump_index_version
+from src.config.settings import settings
+
+
+def build(pkl_path: Path, index_dir: Path, model_name: str, device: str, batch_size: int, max_length: int):
+    print(f"Đang load nodes từ {pkl_path}...")
+    with open(pkl_path, "rb") as f:
+        nodes = pickle.load(f)
+    print(f"Tổng số nodes: {len(nodes):,}")
+
+    encoder = BGEM3Encoder(model_name, device=device)
+    texts = [node.get_content(metadata_mode="none") for node in nodes]
+
+    # Encode theo thứ tự độ dài → ít padding, ghi lại theo đúng thứ tự node
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    sparse = [None] * len(texts)
+    start = time.perf_counter()
+    for batch_start in tqdm(range(0, len(order), batch_size), desc="Encode sparse"):
+        batch = order[batch_start: batch_start + batch_size]
+        _, weights = encoder.encode([texts[i] for i in batch], max_length=max_length, return_dense=False)
+        for i, w in zip(batch, weights):
+            sparse[i] = w
+    elapsed = time.perf_counter() - start
+    print(f"Encode xong {len(texts):,} nodes trong {elapsed:.0f}s ({len(texts) / max(elapsed, 1e-9):.1f} docs/s)")
+
+    write_sparse_index(
+        index_dir=index_dir,
+        node_ids=[node.node_id for node in nodes],
+        texts=texts,
+        metadatas=[node.metadata for node in nodes],
+        sparse_weights=sparse,
+        vocab_size=encoder.vocab_size,
+        model_name=model_name,
+    )
+    print(f"Đã lưu sparse index vào: {index_dir}")
+    bump_index_version(settings.paths.index_version_file, reason="build_sparse_index")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build sparse lexical index (bge-m3)")
+    parser.add_argument("--pkl", type=Path, default=settings.paths.embedded_nodes_path)
+    parser.add_argument("--output-dir", type=Path, default=settings.paths.sparse_index_dir)
+    parser.add_argument("--device", default=settings.embedding.device)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--max-length", type=int, default=8192)
+    args = parser.parse_args()
+
+    print("=== Build sparse lexical index (bge-m3) ===")
+    build(args.pkl, args.output_dir, settings.embedding.model_name, args.device, args.batch_size, args.max_length)
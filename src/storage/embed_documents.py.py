@@ -15,6 +15,7 @@ from src.config.settings import settings
 import chromadb
 from llama_index.vector_stores.chroma import ChromaVectorStore
 from transformers import AutoTokenizer
+from src.embedding.bucketed_embedder import BucketedEmbedder
 import pickle
 
 # ========================
@@ -28,15 +29,20 @@ os.makedirs(PERSIST_DIR, exist_ok=True)
 
 # Model & tokenizer
 EMBED_MODEL_NAME = settings.embedding.model_name 
-tokenizer = AutoTokenizer.from_pretrained(EMBED_MODEL_NAME)
-embed_model = HuggingFaceEmbedding(model_name=EMBED_MODEL_NAME, device="cuda")
-Settings.embed_model = embed_model
+DEVICE = settings.embedding.device
 
 # Ngưỡng token
 MAX_TOKEN_SINGLE_CHUNK = 1000
 
 # Batch size embedding (tối ưu cho T4 16GB)
 BATCH_SIZE_EMBED = 256  # Có thể tăng lên 64 nếu không OOM
+# Ngân sách token (sau padding) cho một batch: T4 16GB ~32k, CPU nên để 8k-16k
+TOKEN_BUDGET_PER_BATCH = 32_768 if DEVICE == "cuda" else 8_192
+
+tokenizer = AutoTokenizer.from_pretrained(EMBED_MODEL_NAME)
+# embed_batch_size = BATCH_SIZE_EMBED để mỗi batch của BucketedEmbedder là đúng một forward pass
+embed_model = HuggingFaceEmbedding(model_name=EMBED_MODEL_NAME, device=DEVICE, embed_batch_size=BATCH_SIZE_EMBED)
+Settings.embed_model = embed_model
 
 # ========================
 # HÀM HỖ TRỢ
@@ -50,9 +56,16 @@ def embed_batch(texts: List[str]) -> List[List[float]]:
     """Embed batch để tăng tốc"""
     if not texts:
         return []
-    embeddings = embed_model.get_text_embedding_batch(texts, show_progress=False)
-    torch.cuda.empty_cache()  # Giải phóng VRAM
-    return embeddings
+    return embed_model.get_text_embedding_batch(texts, show_progress=False)
+
+# Sắp text theo số token, chia batch theo ngân sách token → ít padding, trả về đúng thứ tự
+embedder = BucketedEmbedder(
+    tokenizer=tokenizer,
+    embed_fn=embed_batch,
+    max_tokens_per_batch=TOKEN_BUDGET_PER_BATCH,
+    max_batch_size=BATCH_SIZE_EMBED,
+    on_batch_end=torch.cuda.empty_cache if DEVICE == "cuda" else None,  # Giải phóng VRAM
+)
 
 # ========================
 # 1. Load documents (như cũ)
@@ -128,31 +141,34 @@ print(f"Số mẫu ngắn (<=1000 token): {len(short_texts):,}")
 print(f"Số mẫu dài (>1000 token): {len(long_docs):,}")
 
 # XỬ LÝ MẪU DÀI TRƯỚC
-print("\nXử lý mẫu dài (split semantic + embed batch)...")
-long_nodes = []
-for doc in tqdm(long_docs, desc="Split & embed mẫu dài"):
+print("\nXử lý mẫu dài (split semantic, sau đó embed toàn bộ sub-chunk theo batch)...")
+sub_texts = []
+sub_metadatas = []
+for doc in tqdm(long_docs, desc="Split mẫu dài"):
     sub_docs = semantic_splitter.get_nodes_from_documents([doc])  # Chỉ split
-    sub_texts = [sub.text for sub in sub_docs]
-    
-    # Embed batch cho sub-nodes
-    sub_embeddings = embed_batch(sub_texts)
-    
-    for sub_text, sub_emb in zip(sub_texts, sub_embeddings):
-        node = TextNode(text=sub_text, metadata=doc.metadata)
-        node.embedding = sub_emb
-        long_nodes.append(node)
+    for sub in sub_docs:
+        sub_texts.append(sub.text)
+        sub_metadatas.append(doc.metadata)
+
+sub_embeddings = embedder.embed(sub_texts, desc="Embed sub-chunk mẫu dài")
+long_nodes = []
+for sub_text, sub_emb, meta in zip(sub_texts, sub_embeddings, sub_metadatas):
+    node = TextNode(text=sub_text, metadata=meta)
+    node.embedding = sub_emb
+    long_nodes.append(node)
 
 all_nodes.extend(long_nodes)
 
 # XỬ LÝ MẪU NGẮN SAU
 print("\nXử lý mẫu ngắn (embed batch)...")
-short_embeddings = embed_batch(short_texts)
+short_embeddings = embedder.embed(short_texts, desc="Embed mẫu ngắn")
 for text, emb, meta in tqdm(zip(short_texts, short_embeddings, short_metadatas), desc="Tạo node mẫu ngắn", total=len(short_texts)):
     node = TextNode(text=text, metadata=meta)
     node.embedding = emb
     all_nodes.append(node)
 
 print(f"Tổng số nodes sau chunking + embedding: {len(all_nodes):,}")
+print(f"Thống kê embedding: {embedder.stats.summary()}")
 
 # Lưu nodes đã embed (để resume nếu cần)
 with open(EMBEDDED_NODES_PATH, "wb") as f:
@@ -0,0 +1,68 @@
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional, Union
+import logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_VERSION = "0"
+
+
+def read_index_version(path: Union[str, Path]) -> str:
+    try:
+        return Path(path).read_text(encoding="utf-8").strip() or DEFAULT_VERSION
+    except FileNotFoundError:
+        return DEFAULT_VERSION
+
+
+def bump_index_version(path: Union[str, Path], reason: str = "") -> str:
+    """
+    Ghi version mới cho dữ liệu index (gọi ở cuối mọi script ingest / build index).
+    Cache phụ thuộc index (vd RetrievalResultCache) gắn version vào key → entry cũ tự mất hiệu lực.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    version = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(version, encoding="utf-8")
+    os.replace(tmp_path, path)     # Ghi atomic, process đang chạy không đọc phải file dở
+    print(f"Index version mới: {version}" + (f" ({reason})" if reason else ""))
+    return version
+
+
+class IndexVersion:
+    """
+    Version hiện tại của dữ liệu index, đọc lại từ file khi mtime đổi
+    (kiểm tra tối đa mỗi check_interval_seconds) → re-ingest không cần restart app.
+    """
+
+    def __init__(self, path: Union[str, Path], check_interval_seconds: float = 5.0):
+        self.path = Path(path)
+        self.check_interval_seconds = check_interval_seconds
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._version = DEFAULT_VERSION
+        self._refresh()
+
+    def _refresh(self):
+        try:
+            mtime = self.path.stat().st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._mtime:
+            self._mtime = mtime
+            version = read_index_version(self.path)
+            if version != self._version:
+                logger.info(f"[IndexVersion] {self._version} → {version}")
+            self._version = version
+
+    def current(self) -> str:
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at >= self.check_interval_seconds:
+                self._checked_at = now
+                self._refresh()
+            return self._version
@@ -0,0 +1,78 @@
+import json
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+import numpy as np
+
+DOCS_FILE = "docs.jsonl"
+DOC_OFFSETS_FILE = "doc_offsets.npy"
+NODE_IDS_FILE = "node_ids.npy"
+
+
+class NodeFileStore:
+    """
+    Kho text + metadata của node nằm cạnh một index local (sparse, FAISS):
+    - docs.jsonl: mỗi dòng {id, text, metadata}, doc_offsets.npy: offset byte từng dòng.
+    - node_ids.npy: id theo thứ tự doc (trùng id trên Pinecone / trong embedded_nodes.pkl).
+    - Offset + id được memory-map, chỉ đọc đúng các dòng của top-k → không load cả kho vào RAM.
+    - find / load_docs_by_id: tra doc theo node id (thứ tự id sắp xếp tính lười một lần + searchsorted),
+      dùng cho NodeHydrator.
+    """
+
+    def __init__(self, store_dir: Union[str, Path], mmap: bool = True):
+        self.store_dir = Path(store_dir)
+        mode = "r" if mmap else None
+        self.node_ids = np.load(self.store_dir / NODE_IDS_FILE, mmap_mode=mode)
+        self.doc_offsets = np.load(self.store_dir / DOC_OFFSETS_FILE, mmap_mode=mode)
+        self._docs_path = self.store_dir / DOCS_FILE
+        self._sorted_order: Optional[np.ndarray] = None
+        self._sorted_ids: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    def node_id(self, doc_index: int) -> str:
+        return str(self.node_ids[doc_index])
+
+    def find(self, node_ids: List[str]) -> Dict[str, int]:
+        """{node_id: doc_index} cho các id có trong kho."""
+        if not node_ids or len(self) == 0:
+            return {}
+        if self._sorted_order is None:
+            self._sorted_order = np.argsort(self.node_ids, kind="stable")
+            self._sorted_ids = np.asarray(self.node_ids)[self._sorted_order]
+        sorted_ids = self._sorted_ids
+        positions = np.searchsorted(sorted_ids, np.array(node_ids), side="left")
+        found = {}
+        for node_id, pos in zip(node_ids, positions.tolist()):
+            if pos < len(sorted_ids) and sorted_ids[pos] == node_id:
+                found[node_id] = int(self._sorted_order[pos])
+        return found
+
+    def load_docs_by_id(self, node_ids: List[str]) -> Dict[str, dict]:
+        """{node_id: {id, text, metadata}} cho các id có trong kho."""
+        found = self.find(node_ids)
+        return {doc["id"]: doc for doc in self.load_docs(found.values())}
+
+    def load_docs(self, doc_indices: Iterable[int]) -> List[dict]:
+        """Đọc {id, text, metadata} của các doc theo offset."""
+        docs = []
+        with open(self._docs_path, "rb") as f:
+            for i in doc_indices:
+                start, end = int(self.doc_offsets[i]), int(self.doc_offsets[i + 1])
+                f.seek(start)
+                docs.append(json.loads(f.read(end - start)))
+        return docs
+
+
+def write_node_store(store_dir: Union[str, Path], node_ids: List[str], texts: List[str], metadatas: List[dict]):
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    np.save(store_dir / NODE_IDS_FILE, np.array(node_ids))
+
+    offsets = np.zeros(len(node_ids) + 1, dtype=np.int64)
+    with open(store_dir / DOCS_FILE, "wb") as f:
+        for i, (node_id, text, metadata) in enumerate(zip(node_ids, texts, metadatas)):
+            line = json.dumps({"id": node_id, "text": text, "metadata": metadata}, ensure_ascii=False).encode("utf-8") + b"\n"
+            f.write(line)
+            offsets[i + 1] = offsets[i] + len(line)
+    np.save(store_dir / DOC_OFFSETS_FILE, offsets)
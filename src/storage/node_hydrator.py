@@ -0,0 +1,180 @@
+import asyncio
+import hashlib
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+from pymongo import MongoClient
+from llama_index.core.schema import NodeWithScore, TextNode
+from src.cache.lru import TTLLRUCache
+from src.storage.node_file_store import NodeFileStore
+import logging
+logger = logging.getLogger(__name__)
+
+# Layout của llama-index KVDocumentStore trên Mongo: collection "<namespace>/data", node nằm trong "__data__"
+DATA_COLLECTION_SUFFIX = "/data"
+DATA_KEY = "__data__"
+
+_clients: Dict[Tuple[str, int], MongoClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_mongo_client(uri: str, max_pool_size: int = 20) -> MongoClient:
+    """MongoClient dùng chung theo URI (bản thân client là connection pool, thread-safe)."""
+    key = (uri, max_pool_size)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            # Lazy connect: chưa mở kết nối nào cho tới lần query đầu
+            client = _clients[key] = MongoClient(uri, maxPoolSize=max_pool_size, connect=False)
+        return client
+
+
+class IdOnlyNode(TextNode):
+    """
+    Node chỉ có id (text do NodeHydrator bổ sung sau). Hash theo id: BaseRetriever dedup theo hash
+    (text + metadata) → các node text rỗng sẽ bị gộp làm một nếu giữ hash mặc định.
+    """
+
+    @property
+    def hash(self) -> str:
+        return hashlib.sha256(f"id:{self.id_}".encode()).hexdigest()
+
+
+class NodeHydrator:
+    """
+    Bổ sung text + metadata cho node sau fusion:
+    - Chỉ node chưa có text mới cần hydrate (retriever trả về id + score).
+    - LRU in-process cho node "nóng" (bệnh phổ biến được hỏi lại liên tục).
+    - Tra trước trong các NodeFileStore local (theo đúng namespace id của retriever: node store từ
+      embedded_nodes.pkl cho id Pinecone / FAISS, node store của BM25 native cho id BM25).
+    - Node còn thiếu (nếu có cấu hình Mongo) được lấy trong MỘT query {_id: {$in: [...]}} với projection
+      text + metadata → mỗi request tối đa 1 round-trip Mongo (0 nếu trúng cache / node store hết).
+      Id trong Mongo docstore là id của BM25 (build_mongo_docstore), KHÔNG trùng id Pinecone.
+    """
+
+    def __init__(
+        self,
+        uri: Optional[str] = None,
+        db_name: Optional[str] = None,
+        namespace: Optional[str] = None,
+        stores: Sequence[NodeFileStore] = (),
+        cache_size: int = 20_000,
+        cache_ttl_seconds: Optional[int] = 86400,
+        max_pool_size: int = 20,
+    ):
+        self.stores: List[NodeFileStore] = list(stores)
+        self.collection = (
+            get_mongo_client(uri, max_pool_size)[db_name][f"{namespace}{DATA_COLLECTION_SUFFIX}"] if uri else None
+        )
+        self.cache = TTLLRUCache(maxsize=cache_size, ttl_seconds=cache_ttl_seconds) if cache_size > 0 else None
+        self.requests = 0
+        self.round_trips = 0
+        self.nodes_local = 0
+        self.nodes_fetched = 0
+        self.nodes_missing = 0
+        self._lock = threading.Lock()
+
+    def add_store(self, store: NodeFileStore):
+        self.stores.append(store)
+
+    @staticmethod
+    def needs_hydration(node_with_score: NodeWithScore) -> bool:
+        return not node_with_score.node.get_content(metadata_mode="none")
+
+    def _cached(self, node_ids: List[str]) -> Tuple[Dict[str, dict], List[str]]:
+        found: Dict[str, dict] = {}
+        missing: List[str] = []
+        for node_id in node_ids:
+            doc = self.cache.get(node_id) if self.cache is not None else None
+            if doc is None:
+                missing.append(node_id)
+            else:
+                found[node_id] = doc
+        return found, missing
+
+    def _fetch_local(self, node_ids: List[str]) -> Dict[str, dict]:
+        docs: Dict[str, dict] = {}
+        for store in self.stores:
+            remaining = [node_id for node_id in node_ids if node_id not in docs]
+            if not remaining:
+                break
+            for node_id, doc in store.load_docs_by_id(remaining).items():
+                docs[node_id] = {"text": doc["text"], "metadata": doc["metadata"] or {}}
+        return docs
+
+    def _fetch_mongo(self, node_ids: List[str]) -> Dict[str, dict]:
+        cursor = self.collection.find(
+            {"_id": {"$in": node_ids}},
+            projection={f"{DATA_KEY}.text": 1, f"{DATA_KEY}.metadata": 1},
+        )
+        docs = {}
+        for raw in cursor:
+            data = raw.get(DATA_KEY, {})
+            docs[raw["_id"]] = {"text": data.get("text", ""), "metadata": data.get("metadata") or {}}
+        with self._lock:
+            self.round_trips += 1
+        return docs
+
+    def fetch(self, node_ids: List[str]) -> Dict[str, dict]:
+        """{node_id: {"text", "metadata"}} cho các node tìm thấy trong node store / Mongo (không qua cache)."""
+        if not node_ids:
+            return {}
+        docs = self._fetch_local(node_ids)
+        local = len(docs)
+        remaining = [node_id for node_id in node_ids if node_id not in docs]
+        if remaining and self.collection is not None:
+            docs.update(self._fetch_mongo(remaining))
+        if len(docs) < len(node_ids):
+            logger.warning(f"[NodeHydrator] {len(node_ids) - len(docs)} node không có trong node store / docstore (vd: {next(i for i in node_ids if i not in docs)})")
+        with self._lock:
+            self.nodes_local += local
+            self.nodes_fetched += len(docs) - local
+            self.nodes_missing += len(node_ids) - len(docs)
+        if self.cache is not None:
+            for node_id, doc in docs.items():
+                self.cache.set(node_id, doc)
+        return docs
+
+    def _apply(self, nodes: List[NodeWithScore], docs: Dict[str, dict]) -> List[NodeWithScore]:
+        hydrated = []
+        for node_with_score in nodes:
+            doc = docs.get(node_with_score.node.node_id) if self.needs_hydration(node_with_score) else None
+            if doc is None:
+                hydrated.append(node_with_score)
+                continue
+            node = TextNode(id_=node_with_score.node.node_id, text=doc["text"], metadata=doc["metadata"])
+            hydrated.append(NodeWithScore(node=node, score=node_with_score.score))
+        return hydrated
+
+    def _pending(self, nodes: List[NodeWithScore]) -> Tuple[Dict[str, dict], List[str]]:
+        node_ids = list(dict.fromkeys(n.node.node_id for n in nodes if self.needs_hydration(n)))
+        if node_ids:
+            with self._lock:
+                self.requests += 1
+        return self._cached(node_ids)
+
+    def hydrate(self, nodes: List[NodeWithScore]) -> List[NodeWithScore]:
+        docs, missing = self._pending(nodes)
+        if missing:
+            docs.update(self.fetch(missing))
+        return self._apply(nodes, docs)
+
+    async def ahydrate(self, nodes: List[NodeWithScore]) -> List[NodeWithScore]:
+        docs, missing = self._pending(nodes)
+        if missing:
+            # pymongo / đọc file là sync → chạy trong executor để không block event loop
+            loop = asyncio.get_running_loop()
+            docs.update(await loop.run_in_executor(None, self.fetch, missing))
+        return self._apply(nodes, docs)
+
+    def stats(self) -> dict:
+        cache_stats = self.cache.stats() if self.cache is not None else {"hits": 0, "misses": 0, "hit_rate": 0.0}
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "round_trips": self.round_trips,
+                "round_trips_per_request": self.round_trips / self.requests if self.requests else 0.0,
+                "nodes_local": self.nodes_local,
+                "nodes_fetched": self.nodes_fetched,
+                "nodes_missing": self.nodes_missing,
+                "cache": cache_stats,
+            }
@@ -0,0 +1,290 @@
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+import httpx
+import numpy as np
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+from src.storage.node_hydrator import IdOnlyNode
+import logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_VERSION = "2025-04"
+DEFAULT_METADATA_FIELDS = ("title", "url", "source_url")
+NODE_CONTENT_KEY = "_node_content"     # PineconeVectorStore lưu cả node (kể cả text) dạng JSON trong metadata
+
+
+@dataclass
+class QueryMatch:
+    id: str
+    score: float
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+
+class LatencyTracker:
+    """Cửa sổ trượt độ trễ các request thành công (ms), dùng để tính ngưỡng hedge theo percentile."""
+
+    def __init__(self, window: int = 512):
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, latency_ms: float):
+        with self._lock:
+            self._samples.append(latency_ms)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if not self._samples:
+                return None
+            return float(np.percentile(np.fromiter(self._samples, dtype=np.float64), q))
+
+
+class PineconeQueryClient:
+    """
+    Client query Pinecone qua REST data plane (httpx), thay cho VectorStoreIndex.as_retriever:
+    - Một AsyncClient / Client dùng chung, giữ kết nối keep-alive (pool giới hạn max_connections).
+    - Timeout rõ ràng cho mỗi request.
+    - include_metadata=True (mặc định): chỉ giữ lại metadata_fields + text (Pinecone không hỗ trợ chọn field khi query).
+      include_metadata=False (Rag tự chọn khi đã có node store): chỉ lấy id + score, text / metadata do NodeHydrator bổ sung từ node store
+      có cùng id với Pinecone (src.storage.build_node_store) — id trong Mongo docstore KHÔNG trùng id Pinecone.
+    - Hedging: request chưa xong sau ngưỡng p{hedge_percentile} độ trễ gần đây → gửi thêm một request
+      trùng lặp, lấy kết quả về trước, huỷ request còn lại.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        index_host: str,
+        namespace: Optional[str] = None,
+        include_metadata: bool = True,
+        text_key: str = "text",
+        metadata_fields: Sequence[str] = DEFAULT_METADATA_FIELDS,
+        timeout_seconds: float = 2.0,
+        max_connections: int = 20,
+        keepalive_expiry_seconds: float = 60.0,
+        hedge: bool = True,
+        hedge_percentile: float = 95.0,
+        hedge_min_samples: int = 50,
+        hedge_min_delay_ms: float = 10.0,
+        api_version: str = DEFAULT_API_VERSION,
+    ):
+        self.base_url = index_host if index_host.startswith(("http://", "https://")) else f"https://{index_host}"
+        self.namespace = namespace
+        self.include_metadata = include_metadata
+        self.text_key = text_key
+        self.metadata_fields = tuple(metadata_fields)
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay_ms = hedge_min_delay_ms
+
+        self._headers = {
+            "Api-Key": api_key or "",
+            "X-Pinecone-API-Version": api_version,
+            "Content-Type": "application/json",
+        }
+        self._timeout = httpx.Timeout(timeout_seconds)
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=keepalive_expiry_seconds,
+        )
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._sync_client: Optional[httpx.Client] = None
+        self._lock = threading.Lock()
+
+        self.latency = LatencyTracker()
+        self.requests = 0
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self.errors = 0
+
+    # ────────────────────────────────────────────────
+    # HTTP
+    # ────────────────────────────────────────────────
+    def _client_kwargs(self) -> dict:
+        return dict(base_url=self.base_url, headers=self._headers, timeout=self._timeout, limits=self._limits)
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(**self._client_kwargs())
+        return self._async_client
+
+    @property
+    def sync_client(self) -> httpx.Client:
+        if self._sync_client is None:
+            self._sync_client = httpx.Client(**self._client_kwargs())
+        return self._sync_client
+
+    def _payload(self, vector: Sequence[float], top_k: int, filter: Optional[dict]) -> dict:
+        payload = {
+            "vector": [float(x) for x in vector],
+            "topK": top_k,
+            "includeValues": False,
+            "includeMetadata": self.include_metadata,
+        }
+        if self.namespace:
+            payload["namespace"] = self.namespace
+        if filter:
+            payload["filter"] = filter
+        return payload
+
+    def _parse(self, body: dict) -> List[QueryMatch]:
+        matches = []
+        for match in body.get("matches", []):
+            metadata = match.get("metadata") or {}
+            minimal = {key: metadata[key] for key in self.metadata_fields if key in metadata}
+            if self.include_metadata:
+                text = metadata.get(self.text_key)
+                if text is None and NODE_CONTENT_KEY in metadata:
+                    text = json.loads(metadata[NODE_CONTENT_KEY]).get("text")
+                if text is not None:
+                    minimal[self.text_key] = text
+            matches.append(QueryMatch(id=match["id"], score=float(match.get("score", 0.0)), metadata=minimal))
+        return matches
+
+    async def _post(self, payload: dict) -> dict:
+        start = time.perf_counter()
+        response = await self.async_client.post("/query", json=payload)
+        response.raise_for_status()
+        self.latency.add((time.perf_counter() - start) * 1000)
+        return response.json()
+
+    def hedge_delay(self) -> Optional[float]:
+        """Ngưỡng (giây) trước khi gửi request hedge; None khi tắt hoặc chưa đủ mẫu độ trễ."""
+        if not self.hedge or len(self.latency) < self.hedge_min_samples:
+            return None
+        return max(self.latency.percentile(self.hedge_percentile), self.hedge_min_delay_ms) / 1000
+
+    async def _hedged_post(self, payload: dict) -> dict:
+        primary = asyncio.ensure_future(self._post(payload))
+        tasks = [primary]
+        try:
+            delay = self.hedge_delay()
+            if delay is None:
+                return await primary
+
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result()
+
+            with self._lock:
+                self.hedges_sent += 1
+            hedge = asyncio.ensure_future(self._post(payload))
+            tasks.append(hedge)
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            with self._lock:
+                                self.hedges_won += 1
+                        return task.result()
+            # Cả hai đều lỗi → báo lỗi của request gốc
+            return primary.result()
+        finally:
+            # Request thua (hoặc người gọi bị huỷ / hết deadline) → huỷ để trả kết nối về pool
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    # ────────────────────────────────────────────────
+    # API
+    # ────────────────────────────────────────────────
+    async def aquery(self, vector: Sequence[float], top_k: int = 10, filter: Optional[dict] = None) -> List[QueryMatch]:
+        with self._lock:
+            self.requests += 1
+        try:
+            return self._parse(await self._hedged_post(self._payload(vector, top_k, filter)))
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+
+    def query(self, vector: Sequence[float], top_k: int = 10, filter: Optional[dict] = None) -> List[QueryMatch]:
+        """Bản sync (không hedge), cho code path không có event loop."""
+        with self._lock:
+            self.requests += 1
+        start = time.perf_counter()
+        try:
+            response = self.sync_client.post("/query", json=self._payload(vector, top_k, filter))
+            response.raise_for_status()
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        self.latency.add((time.perf_counter() - start) * 1000)
+        return self._parse(response.json())
+
+    def describe_index_stats(self) -> dict:
+        response = self.sync_client.post("/describe_index_stats", json={})
+        response.raise_for_status()
+        return response.json()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "hedges_sent": self.hedges_sent,
+                "hedges_won": self.hedges_won,
+                "p50_ms": self.latency.percentile(50),
+                "p95_ms": self.latency.percentile(95),
+                "hedge_delay_ms": (self.hedge_delay() or 0.0) * 1000,
+            }
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
+
+
+class PineconeQueryRetriever(BaseRetriever):
+    """
+    Dense retriever dùng PineconeQueryClient: dùng query_bundle.embedding nếu đã có
+    (embedding tính một lần cho cả request), ngược lại tự embed bằng embed_model.
+    Node trả về chỉ có id + score (+ metadata tối thiểu) khi client không lấy metadata → cần NodeHydrator.
+    """
+
+    def __init__(self, client: PineconeQueryClient, embed_model: BaseEmbedding, similarity_top_k: int = 10):
+        super().__init__()
+        self.client = client
+        self.embed_model = embed_model
+        self.similarity_top_k = similarity_top_k
+
+    def _to_nodes(self, matches: List[QueryMatch]) -> List[NodeWithScore]:
+        nodes = []
+        for match in matches:
+            metadata = dict(match.metadata)
+            text = metadata.pop(self.client.text_key, "")
+            node_cls = TextNode if text else IdOnlyNode
+            nodes.append(NodeWithScore(node=node_cls(id_=match.id, text=text, metadata=metadata), score=match.score))
+        return nodes
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        embedding = query_bundle.embedding
+        if embedding is None:
+            embedding = self.embed_model.get_query_embedding(query_bundle.query_str)
+        return self._to_nodes(self.client.query(embedding, top_k=self.similarity_top_k))
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        embedding = query_bundle.embedding
+        if embedding is None:
+            embedding = await self.embed_model.aget_query_embedding(query_bundle.query_str)
+        nodes = self._to_nodes(await self.client.aquery(embedding, top_k=self.similarity_top_k))
+        logger.debug(f"[PineconeQueryRetriever] {self.client.stats()}")
+        return nodes
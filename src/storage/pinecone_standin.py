@@ -0,0 +1,157 @@
+"""
+Server HTTP local giả lập data plane Pinecone (POST /query, POST /describe_index_stats) để test
+PineconeQueryClient không cần mạng / API key: keep-alive, timeout, hedging (độ trễ + đuôi chậm giả lập).
+Chỉ dùng thư viện chuẩn + numpy, tìm kiếm exact (cosine) trên toàn bộ vector.
+
+Chạy:
+    python -m src.storage.pinecone_standin                       # vector từ embedded_nodes.pkl
+    python -m src.storage.pinecone_standin --random 20000 --latency-ms 15 --slow-fraction 0.05 --slow-ms 300
+Sau đó đặt settings.pinecone.index_host = "http://127.0.0.1:5081".
+"""
+import argparse
+import json
+import pickle
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+import numpy as np
+from src.config.settings import settings
+
+# ========================
+# CẤU HÌNH
+# ========================
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 5081
+NODE_CONTENT_KEY = "_node_content"
+
+
+class StandinIndex:
+    """Vector đã chuẩn hoá L2 + id + metadata; query = tích vô hướng (cosine)."""
+
+    def __init__(self, ids: List[str], vectors: np.ndarray, metadatas: Optional[List[dict]] = None):
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.ids = ids
+        self.vectors = (vectors / np.maximum(norms, 1e-12)).astype(np.float32)
+        self.metadatas = metadatas or [{} for _ in ids]
+
+    @classmethod
+    def from_pickle(cls, path) -> "StandinIndex":
+        with open(path, "rb") as f:
+            nodes = [node for node in pickle.load(f) if node.embedding is not None]
+        metadatas = [
+            {**node.metadata, "text": node.get_content(metadata_mode="none"), NODE_CONTENT_KEY: node.to_json()}
+            for node in nodes
+        ]
+        return cls([node.node_id for node in nodes], np.asarray([node.embedding for node in nodes], dtype=np.float32), metadatas)
+
+    @classmethod
+    def random(cls, num_vectors: int, dim: int = 1024, seed: int = 0) -> "StandinIndex":
+        vectors = np.random.default_rng(seed).standard_normal((num_vectors, dim)).astype(np.float32)
+        ids = [f"node-{i}" for i in range(num_vectors)]
+        metadatas = [{"title": f"Tài liệu {i}", "url": f"https://example.com/{i}", "text": f"Nội dung tài liệu {i}"} for i in range(num_vectors)]
+        return cls(ids, vectors, metadatas)
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1]
+
+    def query(self, vector: List[float], top_k: int, include_metadata: bool) -> List[dict]:
+        query = np.asarray(vector, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        scores = self.vectors @ query
+        top_k = min(top_k, len(self.ids))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        matches = []
+        for i in top:
+            match = {"id": self.ids[i], "score": float(scores[i]), "values": []}
+            if include_metadata:
+                match["metadata"] = self.metadatas[i]
+            matches.append(match)
+        return matches
+
+
+def make_handler(index: StandinIndex, latency_ms: float, jitter_ms: float, slow_fraction: float, slow_ms: float,
+                 api_key: Optional[str]):
+    rng = random.Random(0)
+    rng_lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"     # Keep-alive: client dùng lại kết nối
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, body: dict):
+            raw = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            try:
+                self.wfile.write(raw)
+            except (BrokenPipeError, ConnectionResetError):
+                pass    # Client đã huỷ request (vd request hedge thua)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if api_key and self.headers.get("Api-Key") != api_key:
+                return self._send(401, {"code": 16, "message": "Invalid API Key"})
+
+            with rng_lock:
+                delay = latency_ms + rng.uniform(0, jitter_ms)
+                if rng.random() < slow_fraction:
+                    delay += slow_ms
+            time.sleep(delay / 1000)
+
+            if self.path == "/describe_index_stats":
+                return self._send(200, {
+                    "dimension": index.dim,
+                    "totalVectorCount": len(index.ids),
+                    "namespaces": {"": {"vectorCount": len(index.ids)}},
+                })
+            if self.path == "/query":
+                matches = index.query(payload["vector"], int(payload.get("topK", 10)), bool(payload.get("includeMetadata")))
+                return self._send(200, {"matches": matches, "namespace": payload.get("namespace", ""), "usage": {"readUnits": 5}})
+            self._send(404, {"message": f"Không hỗ trợ {self.path}"})
+
+    return Handler
+
+
+def serve(
+    index: StandinIndex,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    latency_ms: float = 10.0,
+    jitter_ms: float = 5.0,
+    slow_fraction: float = 0.0,
+    slow_ms: float = 200.0,
+    api_key: Optional[str] = None,
+) -> ThreadingHTTPServer:
+    """Tạo server (chưa chạy): gọi serve_forever() hoặc chạy trong thread riêng. port=0 = port ngẫu nhiên."""
+    handler = make_handler(index, latency_ms, jitter_ms, slow_fraction, slow_ms, api_key)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Server giả lập data plane Pinecone")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--random", type=int, default=0, help="Dùng N vector ngẫu nhiên thay cho embedded_nodes.pkl")
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--latency-ms", type=float, default=10.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--slow-fraction", type=float, default=0.0, help="Tỉ lệ request bị chậm thêm --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=200.0)
+    parser.add_argument("--api-key", default=None, help="Bắt buộc header Api-Key (mặc định không kiểm tra)")
+    args = parser.parse_args()
+
+    index = StandinIndex.random(args.random, args.dim) if args.random else StandinIndex.from_pickle(settings.paths.embedded_nodes_path)
+    server = serve(index, args.host, args.port, args.latency_ms, args.jitter_ms, args.slow_fraction, args.slow_ms, args.api_key)
+    print(f"Pinecone stand-in: http://{args.host}:{server.server_port} ({len(index.ids):,} vector, {index.dim}d)")
+    server.serve_forever()
@@ -4,6 +4,7 @@ from pinecone import Pinecone, ServerlessSpec
 from llama_index.vector_stores.pinecone import PineconeVectorStore
 from tqdm import tqdm  # Để có progress bar đẹp (pip install tqdm nếu chưa có)
 from src.config.settings import settings
+from src.storage.index_version import bump_index_version
 from dotenv import load_dotenv
 load_dotenv()
 # ========================
@@ -75,6 +76,7 @@ for start in tqdm(range(0, total_nodes, batch_size), desc="Upsert progress"):
     print(f"  → Đã upsert {end}/{total_nodes} nodes")
 
 print("\nUpsert hoàn tất!")
+bump_index_version(settings.paths.index_version_file, reason="upsert_to_pinecone")
 print(f"Tổng vectors trong index: {pinecone_index.describe_index_stats()['total_vector_count']:,}")
 print(f"Index name: {INDEX_NAME}")
 print("→ Vào dashboard Pinecone (app.pinecone.io) → chọn index → xem 'Usage' để kiểm tra storage used (GB).")
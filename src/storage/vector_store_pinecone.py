@@ -1,10 +1,11 @@
 import os
-from typing import Optional, Any
+from typing import Optional, Any, Literal
 from pinecone import Pinecone
 from llama_index.vector_stores.pinecone import PineconeVectorStore
 from llama_index.core import VectorStoreIndex, Settings
 from llama_index.core.embeddings import BaseEmbedding
 from llama_index.core.retrievers import VectorIndexRetriever, BaseRetriever
+from src.storage.pinecone_query_client import PineconeQueryClient, PineconeQueryRetriever
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,6 +16,8 @@ class PineconeVectorStoreManager:
     - Lazy loading client, index, vector_store, và llama_index.
     - Tích hợp kiểm tra dimension để tránh lỗi mismatch.
     - Dùng cho dense retrieval trong RAG (tương thích HybridRetriever).
+    - query_client="http": query bằng PineconeQueryClient (async, keep-alive, hedging, chỉ lấy id + score)
+      thay cho VectorStoreIndex.as_retriever ("llama").
     """
 
     def __init__(
@@ -24,17 +27,27 @@ class PineconeVectorStoreManager:
         embed_model: Optional[BaseEmbedding] = None,
         namespace: Optional[str] = None,
         text_key: str = "text",  # Thay đổi nếu field text trong metadata là khác (ví dụ: "_node_content")
+        embed_dim: Optional[int] = None,  # Dimension đã biết của embed_model → bỏ qua bước embed thử
+        query_client: Literal["llama", "http"] = "llama",
+        index_host: Optional[str] = None,     # Host data plane; None = hỏi Pinecone (describe_index)
+        client_options: Optional[dict] = None,    # Tham số thêm cho PineconeQueryClient (timeout, hedge...)
     ):
         self.api_key = api_key
         self.index_name = index_name
         self.embed_model = embed_model
         self.namespace = namespace
         self.text_key = text_key
+        self.embed_dim = embed_dim
+        self.query_client = query_client
+        self.index_host = index_host
+        self.client_options = client_options or {}
 
         self._client: Optional[Pinecone] = None
         self._pinecone_index: Optional[Any] = None  # type: ignore
+        self._index_stats: Optional[dict] = None
         self._vector_store: Optional[PineconeVectorStore] = None
         self._index: Optional[VectorStoreIndex] = None
+        self._query_client: Optional[PineconeQueryClient] = None
 
     def connect(self) -> Pinecone:
         if self._client is None:
@@ -50,7 +63,7 @@ class PineconeVectorStoreManager:
             client = self.connect()
             try:
                 self._pinecone_index = client.Index(self.index_name)
-                stats = self._pinecone_index.describe_index_stats()
+                stats = self._index_stats = self._pinecone_index.describe_index_stats()
                 total = stats.get('total_vector_count', 0)
                 namespaces = list(stats.get('namespaces', {}).keys())
                 logger.info(
@@ -61,20 +74,39 @@ class PineconeVectorStoreManager:
                 raise ValueError(f"Index '{self.index_name}' không tồn tại hoặc lỗi: {e}")
         return self._pinecone_index
 
-    def _check_dimension_match(self):
+    def get_index_host(self) -> str:
+        if self.index_host is None:
+            self.index_host = self.connect().describe_index(self.index_name).host
+            logger.info(f"Host data plane của index '{self.index_name}': {self.index_host}")
+        return self.index_host
+
+    def build_query_client(self) -> PineconeQueryClient:
+        if self._query_client is None:
+            self._query_client = PineconeQueryClient(
+                api_key=self.api_key,
+                index_host=self.get_index_host(),
+                namespace=self.namespace,
+                text_key=self.text_key,
+                **self.client_options,
+            )
+        return self._query_client
+
+    def _check_dimension_match(self, index_stats: Optional[dict] = None):
         """Kiểm tra dimension của embed_model có khớp với index không."""
         if self.embed_model is None:
             logger.warning("Chưa có embed_model → bỏ qua kiểm tra dimension")
             return
 
-        # Lấy dimension từ embed_model (thử embed 1 chuỗi ngắn)
-        test_embedding = self.embed_model.get_text_embedding("test")
-        model_dim = len(test_embedding)
+        # Lấy dimension từ embed_model (thử embed 1 chuỗi ngắn nếu chưa biết)
+        model_dim = self.embed_dim
+        if model_dim is None:
+            model_dim = len(self.embed_model.get_text_embedding("test"))
 
-        # Lấy dimension từ Pinecone index
-        index = self.get_pinecone_index()
-        stats = index.describe_index_stats()
-        index_dim = stats.get('dimension')
+        # Lấy dimension từ Pinecone index (stats đã có từ lúc kết nối)
+        if index_stats is None:
+            self.get_pinecone_index()
+            index_stats = self._index_stats
+        index_dim = index_stats.get('dimension')
 
         if index_dim is None:
             logger.warning("Không lấy được dimension từ index stats")
@@ -116,6 +148,22 @@ class PineconeVectorStoreManager:
         return self._index
 
     def get_retriever(self, similarity_top_k: int = 10) -> BaseRetriever:
+        if self.query_client == "http":
+            if self.embed_model is None:
+                raise ValueError("Cần cung cấp embed_model để tạo dense retriever")
+            client = self.build_query_client()
+            stats = client.describe_index_stats()
+            logger.info(
+                f"Index '{self.index_name}' ({client.base_url}) | "
+                f"Tổng vectors: {stats.get('totalVectorCount', 0):,} | Namespaces: {list(stats.get('namespaces', {}).keys())}"
+            )
+            self._check_dimension_match(stats)
+            logger.info(
+                f"Dense retriever (Pinecone HTTP) sẵn sàng | top_k={similarity_top_k} | "
+                f"metadata={'có' if client.include_metadata else 'không (hydrate từ node store)'} | hedge={client.hedge}"
+            )
+            return PineconeQueryRetriever(client=client, embed_model=self.embed_model, similarity_top_k=similarity_top_k)
+
         index = self.build_index()
         retriever = index.as_retriever(similarity_top_k=similarity_top_k)
         logger.info(f"Dense retriever (Pinecone) sẵn sàng | top_k={similarity_top_k}")